@@ -1,14 +1,26 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
 import os
-import csv
-import io
+import functools
+import hashlib
 from datetime import datetime, date
 from decimal import Decimal
 import logging
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.ador_csv import AdorColumns
+from taxrates.batch_writer import BatchWriter
+from taxrates.jobs import JobQueue, JobStore
+from taxrates.jurisdictions import JURISDICTION_COLUMNS, JurisdictionResolver
+from taxrates.db import fetch_all
+from taxrates.fingerprint import find_loaded_version, rates_fingerprint, record_fingerprint
+from taxrates.health import LazyClient, SchemaCheck
+from taxrates.rate_index import CachedRateIndex, RateIndex
+from taxrates.rate_matrix import RateMatrix, current_rate_matrix
+from taxrates.version_hashes import FRESHNESS_COLUMNS, refresh_hashes, versions_freshness
+from taxrates.zip_index import ZipIndex
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -20,61 +32,127 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_SIZE'] = int(os.getenv('MAX_UPLOAD_SIZE', 16 * 1024 * 1024)) # 16MB max file size
+app.config['RATES_CHUNK_SIZE'] = int(os.getenv('RATES_CHUNK_SIZE', 500))  # rows per multi-row upsert
+app.config['JOBS_FOLDER'] = os.getenv('JOBS_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], 'jobs'))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))  # background upload threads per process
+app.config['RATE_INDEX_TTL'] = float(os.getenv('RATE_INDEX_TTL', 300))  # seconds before /api/rate reloads
+app.config['RATE_MATRIX_PATH'] = os.getenv('RATE_MATRIX_PATH') or None  # materialised combined rates
+app.config['ZIP_JURISDICTION_PATH'] = os.getenv('ZIP_JURISDICTION_PATH') or None  # ZIP -> jurisdiction CSV
+app.config['JURISDICTION_CACHE_TTL'] = float(os.getenv('JURISDICTION_CACHE_TTL', 300))
+app.config['JURISDICTION_CACHE_PATH'] = os.getenv('JURISDICTION_CACHE_PATH') or None
+app.config['READINESS_TTL'] = float(os.getenv('READINESS_TTL', 30))  # seconds a passing /readyz probe is reused
 
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env")
+def create_supabase_client() -> Client:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env")
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Created on first use, so importing the app (worker boot, tests, scripts) costs no network
+supabase: Client = LazyClient(create_supabase_client)
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-def init_database():
-    """Initialize database tables."""
-    try:
-        # Check if tables exist by trying to query them
-        logger.info("Checking database connection and existing tables...")
-        
-        # Test connection by querying existing tables
+def load_rate_matrix():
+    """The materialised matrix file while it matches the rates, else a fresh build from Supabase."""
+    return current_rate_matrix(supabase, app.config['RATE_MATRIX_PATH'])
+
+def materialize_rate_matrix():
+    """After a load: rewrite RATE_MATRIX_PATH (if set) and drop the cached matrix.
+
+    Without a path the matrix is simply rebuilt on the next lookup.
+    """
+    if app.config['RATE_MATRIX_PATH']:
         try:
-            # Check jurisdictions table
-            result = supabase.table('jurisdictions').select('id').limit(1).execute()
-            logger.info("✅ jurisdictions table exists")
-            
-            # Check rate_versions table  
-            result = supabase.table('rate_versions').select('id').limit(1).execute()
-            logger.info("✅ rate_versions table exists")
-            
-            # Check rates table
-            result = supabase.table('rates').select('id').limit(1).execute()
-            logger.info("✅ rates table exists")
-            
-            # Check business_class_codes table
-            result = supabase.table('business_class_codes').select('code').limit(1).execute()
-            logger.info("✅ business_class_codes table exists")
-            
-            logger.info("All required tables exist - database ready!")
-            return True
-            
+            RateMatrix.load(supabase).save(app.config['RATE_MATRIX_PATH'])
         except Exception as e:
-            logger.error(f"Database connection or table check failed: {e}")
-            logger.info("Please ensure the following tables exist in your Supabase database:")
-            logger.info("- jurisdictions")
-            logger.info("- rate_versions") 
-            logger.info("- rates")
-            logger.info("- business_class_codes")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Database initialization error: {e}")
-        return False
+            logger.error(f"Could not rebuild rate matrix: {e}")
+    rate_matrix.invalidate()
+
+job_queue = rate_index = rate_matrix = jurisdiction_resolver = zip_index = schema_check = None
+
+def build_services():
+    """(Re)build the config-dependent singletons from ``app.config``.
+
+    Runs at import, and again from ``create_app`` when it is given
+    overrides. Nothing is loaded here: every cache fills on first use.
+    """
+    global job_queue, rate_index, rate_matrix, jurisdiction_resolver, zip_index, schema_check
+
+    # Background upload jobs (state is shared between workers through JOBS_FOLDER); the
+    # queue is kept unless its settings changed, else the old pool is shut down first
+    jobs_folder, job_workers = app.config['JOBS_FOLDER'], app.config['JOB_WORKERS']
+    if job_queue is None or (job_queue.store.directory, job_queue.max_workers) != (jobs_folder, job_workers):
+        if job_queue is not None:
+            job_queue.shutdown()
+        job_queue = JobQueue(JobStore(jobs_folder), max_workers=job_workers)
+
+    # In-memory rate history for point lookups (built on first use)
+    rate_index = CachedRateIndex(lambda: RateIndex.load(supabase), ttl=app.config['RATE_INDEX_TTL'])
+
+    # Combined (city + county) rates per version for /api/rate/combined
+    rate_matrix = CachedRateIndex(load_rate_matrix, ttl=app.config['RATE_INDEX_TTL'])
+
+    # Region code -> jurisdiction resolution shared with the scripts (county records win)
+    jurisdiction_resolver = JurisdictionResolver(
+        lambda: fetch_all(supabase, 'jurisdictions', JURISDICTION_COLUMNS),
+        ttl=app.config['JURISDICTION_CACHE_TTL'],
+        cache_path=app.config['JURISDICTION_CACHE_PATH'],
+    )
+
+    # ZIP / ZIP+4 -> jurisdiction ids for /api/rate/combined?zip= (built on first use)
+    zip_index = CachedRateIndex(
+        lambda: ZipIndex.load(app.config['ZIP_JURISDICTION_PATH'], jurisdiction_resolver.rows()),
+        ttl=app.config['RATE_INDEX_TTL'],
+    )
+
+    # Required-table probe behind /readyz: deferred to first use, then cached
+    schema_check = SchemaCheck(lambda: supabase, ttl=app.config['READINESS_TTL'])
+
+build_services()
+
+def init_database():
+    """Check the required tables exist (fresh probe, logged); True when they all do."""
+    logger.info("Checking database connection and existing tables...")
+    status = schema_check.status(refresh=True)
+    for table, result in status['tables'].items():
+        if result == 'ok':
+            logger.info(f"✅ {table} table exists")
+        else:
+            logger.error(f"Table check failed for {table}: {result}")
+    if status['ready']:
+        logger.info("All required tables exist - database ready!")
+    else:
+        logger.info("Please ensure the following tables exist in your Supabase database: "
+                    + ", ".join(status['tables']))
+    return status['ready']
+
+def create_app(config=None):
+    """Application factory (``gunicorn 'app:create_app()'``).
+
+    Applies ``config`` overrides, rebuilding the job queue and caches so they
+    see them, and returns the app. Nothing here touches the network: the
+    Supabase client is created on first use and the schema check runs on
+    the first /readyz, so a worker is serving in milliseconds.
+    """
+    if config:
+        app.config.update(config)
+        build_services()
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    return app
+
+def chunked(items, size):
+    """Yield successive slices of ``items`` with at most ``size`` elements."""
+    size = max(1, int(size))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 def upsert_business_codes(rates_data):
-    """Upsert business codes from rates data using the same approach as ador_sync_service."""
+    """Upsert business codes from rates data in a single multi-row request."""
     try:
         business_codes = {}
         for rate in rates_data:
@@ -82,27 +160,39 @@ def upsert_business_codes(rates_data):
             name = rate['business_name']
             if code and code not in business_codes:
                 business_codes[code] = name or f'Business Code {code}'
-        
+
+        records = [{'code': code, 'description': description}
+                   for code, description in business_codes.items()]
         processed = 0
-        for code, description in business_codes.items():
+        for chunk in chunked(records, app.config['RATES_CHUNK_SIZE']):
             try:
-                supabase.table("business_class_codes").upsert({
-                    'code': code,
-                    'description': description
-                }).execute()
-                processed += 1
+                supabase.table("business_class_codes").upsert(chunk).execute()
+                processed += len(chunk)
             except Exception as e:
-                logger.error(f"Error upserting business code {code}: {e}")
-        
+                logger.error(f"Error upserting business codes {chunk[0]['code']}..{chunk[-1]['code']}: {e}")
+
         logger.info(f"Processed {processed} business codes")
         return processed
-        
+
     except Exception as e:
         logger.error(f"Error upserting business codes: {e}")
         return 0
 
+def fetch_jurisdictions_by_code():
+    """Return {city_code: jurisdiction row}, re-read from the database.
+
+    This also re-primes ``jurisdiction_resolver`` for the rate upsert that
+    follows, so a CSV load reads the table once.
+    """
+    rows = jurisdiction_resolver.refresh()
+    return {j['city_code']: j for j in rows if j.get('city_code')}
+
 def upsert_jurisdictions(rates_data):
-    """Upsert jurisdictions from rates data using the same approach as ador_sync_service."""
+    """Upsert jurisdictions from rates data.
+
+    Existing jurisdictions are resolved with one lookup; only rows whose
+    fields actually change are updated and all new ones go in one insert.
+    """
     try:
         # Extract unique region codes
         jurisdictions = {}
@@ -114,54 +204,56 @@ def upsert_jurisdictions(rates_data):
                     'code': region_code,
                     'name': region_name or f"{region_code} City"
                 }
-        
+
+        existing_by_code = fetch_jurisdictions_by_code()
+
         # Get the current max ID from the database
         max_id_result = supabase.table("jurisdictions").select("id").order("id", desc=True).limit(1).execute()
         jurisdiction_id_counter = (max_id_result.data[0]['id'] + 1) if max_id_result.data else 1
-        
-        # Upsert to database (using existing jurisdictions table structure)
+
         processed = 0
-        for region_code, jurisdiction_data in jurisdictions.items():
+        updated = 0
+        new_records = []
+        for city_code, jurisdiction_data in jurisdictions.items():
+            update_data = {
+                'level': 'city',
+                'state_code': 'AZ',
+                'county_name': None,  # Always None for city jurisdictions
+                'city_name': jurisdiction_data['name']
+            }
+            existing = existing_by_code.get(city_code)
+            if existing is None:
+                new_records.append({'id': jurisdiction_id_counter, 'city_code': city_code, **update_data})
+                jurisdiction_id_counter += 1
+                continue
+
+            if all(existing.get(k) == v for k, v in update_data.items()):
+                processed += 1
+                continue
+
+            try:
+                # Update existing jurisdiction (don't change ID)
+                supabase.table("jurisdictions").update(update_data).eq("id", existing['id']).execute()
+                logger.info(f"Updated jurisdiction {city_code} (ID: {existing['id']})")
+                processed += 1
+                updated += 1
+            except Exception as e:
+                logger.error(f"Error upserting jurisdiction {city_code}: {e}")
+
+        if new_records:
             try:
-                # Map to existing table structure
-                city_code = region_code
-                
-                # Check if jurisdiction already exists by city_code
-                existing = supabase.table("jurisdictions").select("id").eq("city_code", city_code).execute()
-                
-                if existing.data:
-                    # Update existing jurisdiction (don't change ID)
-                    existing_id = existing.data[0]['id']
-                    update_data = {
-                        'level': 'city',
-                        'state_code': 'AZ',
-                        'county_name': None,  # Always None for city jurisdictions
-                        'city_name': jurisdiction_data['name']
-                    }
-                    supabase.table("jurisdictions").update(update_data).eq("id", existing_id).execute()
-                    logger.info(f"Updated jurisdiction {city_code} (ID: {existing_id})")
-                    processed += 1
-                else:
-                    # Insert new jurisdiction with auto-incremented ID
-                    jurisdiction_record = {
-                        'id': jurisdiction_id_counter,
-                        'level': 'city',
-                        'state_code': 'AZ',
-                        'county_name': None,  # Always None for city jurisdictions
-                        'city_code': city_code,
-                        'city_name': jurisdiction_data['name']
-                    }
-                    supabase.table("jurisdictions").insert(jurisdiction_record).execute()
-                    logger.info(f"Inserted new jurisdiction {city_code} (ID: {jurisdiction_id_counter})")
-                    processed += 1
-                    jurisdiction_id_counter += 1
-                    
+                supabase.table("jurisdictions").insert(new_records).execute()
+                logger.info(f"Inserted {len(new_records)} new jurisdictions "
+                            f"(IDs {new_records[0]['id']}-{new_records[-1]['id']})")
+                processed += len(new_records)
             except Exception as e:
-                logger.error(f"Error upserting jurisdiction {region_code}: {e}")
-        
+                logger.error(f"Error inserting {len(new_records)} new jurisdictions: {e}")
+
+        if updated or new_records:
+            jurisdiction_resolver.invalidate()
         logger.info(f"Processed {processed} jurisdictions (new + updated)")
         return processed
-        
+
     except Exception as e:
         logger.error(f"Error upserting jurisdictions: {e}")
         return 0
@@ -184,105 +276,138 @@ def create_rate_version(effective_date, uploader):
         logger.error(f"Error creating rate version: {e}")
         raise
 
-def upsert_tax_rates(rates_data, rate_version_id, uploader):
-    """Upsert tax rates data."""
+def upsert_tax_rates(rates_data, rate_version_id, uploader, chunk_size=None, progress=None):
+    """Upsert tax rates data.
+
+    Region codes are resolved through ``jurisdiction_resolver`` (county
+    records win, and their rate goes in ``county_rate``) and the rows are
+    written through a ``BatchWriter`` in inserts of ``chunk_size`` (defaults
+    to ``RATES_CHUNK_SIZE``). ``rates`` has no unique key, so a chunk that
+    may have committed before failing is only resent once it is known not to
+    have landed, and only a content error splits a chunk to isolate the bad
+    rows. ``progress`` (if given) is called with the running
+    ``rows_written`` count after every chunk.
+    """
     try:
-        count = 0
-        
+        chunk_size = chunk_size or app.config['RATES_CHUNK_SIZE']
+        jurisdictions = jurisdiction_resolver.mapping()
+
+        rows = []
+        missing_codes = set()
         for rate in rates_data:
-            try:
-                # Get jurisdiction ID by city_code (not region_code)
-                jurisdiction_result = supabase.table('jurisdictions').select('id').eq('city_code', rate['region_code']).execute()
-                if not jurisdiction_result.data:
-                    logger.warning(f"Jurisdiction not found for code: {rate['region_code']}")
-                    continue
-                
-                jurisdiction_id = jurisdiction_result.data[0]['id']
-                
-                # Prepare rate data - insert into rates table (current_rates is a view)
-                rate_data = {
-                    'rate_version_id': rate_version_id,
-                    'business_code': rate['business_code'],
-                    'jurisdiction_id': jurisdiction_id,
-                    'state_rate': rate['state_rate'],
-                    'county_rate': rate['county_rate'],
-                    'city_rate': rate['city_rate']
-                }
-                
-                # Insert into rates table (current_rates is a view that will automatically show this data)
-                supabase.table('rates').upsert(rate_data).execute()
-                count += 1
-                
-            except Exception as e:
-                logger.warning(f"Error upserting rate for {rate['business_code']}-{rate['region_code']}: {e}")
+            jurisdiction = jurisdictions.get(rate['region_code'])
+            if jurisdiction is None:
+                missing_codes.add(rate['region_code'])
                 continue
-        
-        logger.info(f"Upserted {count} tax rates")
-        return count
+
+            county_rate, city_rate = rate['county_rate'], rate['city_rate']
+            if jurisdiction.level == 'county' and not county_rate:
+                # The CSV rate for a county code is a county rate
+                county_rate, city_rate = city_rate, 0.0
+
+            # Prepare rate data - insert into rates table (current_rates is a view)
+            rows.append({
+                'rate_version_id': rate_version_id,
+                'business_code': rate['business_code'],
+                'jurisdiction_id': jurisdiction.id,
+                'state_rate': rate['state_rate'],
+                'county_rate': county_rate,
+                'city_rate': city_rate
+            })
+
+        if missing_codes:
+            logger.warning(f"Jurisdiction not found for codes: {', '.join(sorted(missing_codes))}")
+
+        writer = BatchWriter.for_table(supabase, 'rates', batch_size=chunk_size)
+        result = writer.write(rows, progress=(lambda written: progress(rows_written=written)) if progress else None)
+        for err in result.errors[:10]:
+            logger.warning(f"Error inserting rates {err.start + 1}-{err.start + err.size}: {err.error}")
+
+        logger.info(f"Upserted {result.written} tax rates")
+        return result.written
     except Exception as e:
         logger.error(f"Error upserting tax rates: {e}")
         return 0
 
-def parse_csv_content(csv_content: str, effective_date: str, uploader: str) -> dict:
+def duplicate_upload_result(loaded, total_records=0):
+    """parse_csv_content result for content that is already loaded (see taxrates/fingerprint.py)."""
+    return {
+        'total_records': total_records,
+        'inserted_count': 0,
+        'updated_count': 0,
+        'business_codes_processed': 0,
+        'jurisdictions_processed': 0,
+        'errors': [],
+        'success': True,
+        'duplicate_of': loaded['id'],
+    }
+
+def upload_fingerprint(csv_content, effective_date):
+    """Content fingerprint of an upload, or None if it doesn't parse (the load reports why)."""
+    try:
+        return rates_fingerprint(effective_date, AdorColumns.from_text(csv_content).records())
+    except ValueError:
+        return None
+
+def parse_csv_content(csv_content: str, effective_date: str, uploader: str, progress=None,
+                      fingerprint=None) -> dict:
     """
     Parse CSV content using the same structure as cactuscomply-integrations
+
+    ``progress`` is an optional callback (see taxrates.jobs.JobProgress) that
+    receives rows_parsed / rows_written counts as the load advances.
+    ``fingerprint`` is the content hash when the caller has already checked
+    it (upload_file); otherwise it is computed and checked here, and an
+    identical earlier load short-circuits without any writes.
     """
     try:
         logger.info(f"Parsing CSV content uploaded by: {uploader}")
         
-        # Parse CSV content (handle BOM)
-        csv_io = io.StringIO(csv_content)
-        reader = csv.DictReader(csv_io)
-        
+        # Read the file once into columns; TaxRate is converted in bulk
+        # (AZDOR values are percentages, e.g. "2.0" means 2%)
+        table = AdorColumns.from_text(csv_content)
+
+        if fingerprint is None:
+            fingerprint = rates_fingerprint(effective_date, table.records())
+            loaded = find_loaded_version(supabase, fingerprint)
+            if loaded:
+                logger.info(f"Identical content already loaded as rate version {loaded['id']}; skipping")
+                return duplicate_upload_result(loaded, len(table.valid_indices()))
+
         rates_data = []
-        for row in reader:
-            try:
-                # Extract data from actual CSV format (handle BOM in field names)
-                region_code = row.get('RegionCode', row.get('\ufeffRegionCode', '')).strip()
-                region_name = row.get('RegionName', '').strip()
-                business_code = row.get('BusinessCode', '').strip()
-                business_name = row.get('BusinessCodesName', '').strip()
-                tax_rate = row.get('TaxRate', '0').strip()
-                
-                # Parse the tax rate (convert percentage to decimal)
-                # AZDOR CSV rates are always in percentage form (e.g., "2.0" means 2%)
-                try:
-                    rate_value = float(tax_rate.replace('%', ''))
-                    # Always divide by 100 — AZDOR CSV values are percentages
-                    # Previous threshold (> 1) failed for rates of exactly 1%,
-                    # storing them as 1.0 (100%) instead of 0.01 (1%)
-                    rate_decimal = rate_value / 100.0
-                except (ValueError, AttributeError):
-                    rate_decimal = 0.0
-                
-                if region_code and business_code and rate_decimal > 0:
-                    rates_data.append({
-                        'region_code': region_code,
-                        'region_name': region_name,
-                        'business_code': business_code,
-                        'business_name': business_name,
-                        'state_rate': 0.0,  # ADOR CSV doesn't separate by state/county/city
-                        'county_rate': 0.0,
-                        'city_rate': rate_decimal,  # Put the rate in city_rate for now
-                        'total_rate': rate_decimal,
-                        'effective_date': effective_date,
-                        'uploader': uploader
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"Error parsing row {row}: {e}")
-                continue
+        for rec in table.records():
+            rates_data.append({
+                'region_code': rec['region_code'],
+                'region_name': rec['region_name'],
+                'business_code': rec['business_code'],
+                'business_name': rec['business_name'],
+                'state_rate': 0.0,  # ADOR CSV doesn't separate by state/county/city
+                'county_rate': 0.0,
+                'city_rate': rec['rate'],  # Put the rate in city_rate for now
+                'total_rate': rec['rate'],
+                'effective_date': effective_date,
+                'uploader': uploader
+            })
         
         if not rates_data:
             raise RuntimeError("No valid rates data found in CSV")
         
         logger.info(f"Successfully parsed {len(rates_data)} rate records from CSV")
+        if progress:
+            progress(rows_parsed=len(rates_data), stage='writing')
         
         # Process data in order
         business_codes_count = upsert_business_codes(rates_data)
         jurisdictions_count = upsert_jurisdictions(rates_data)
         rate_version_id = create_rate_version(effective_date, uploader)
-        rates_count = upsert_tax_rates(rates_data, rate_version_id, uploader)
+        rates_count = upsert_tax_rates(rates_data, rate_version_id, uploader, progress=progress)
+        if rates_count == len(rates_data):
+            # Only a complete load may mark the file as loaded; a partial one can be re-run
+            record_fingerprint(supabase, rate_version_id, fingerprint)
+        if rates_count:
+            refresh_hashes(supabase, rate_version_id)
+        rate_index.invalidate()
+        materialize_rate_matrix()
         
         return {
             'total_records': len(rates_data),
@@ -291,7 +416,8 @@ def parse_csv_content(csv_content: str, effective_date: str, uploader: str) -> d
             'business_codes_processed': business_codes_count,
             'jurisdictions_processed': jurisdictions_count,
             'errors': [],
-            'success': True
+            'success': True,
+            'duplicate_of': None,
         }
         
     except Exception as e:
@@ -334,9 +460,28 @@ def upload_file():
         try:
             # Read file content
             csv_content = file.read().decode('utf-8')
+            is_async = request.form.get('async') in ('1', 'true', 'on')
+
+            # Re-submitting an already loaded file is a single lookup
+            fingerprint = upload_fingerprint(csv_content, effective_date)
+            loaded = fingerprint and find_loaded_version(supabase, fingerprint)
+            if loaded:
+                if is_async:
+                    return jsonify({'duplicate_of': loaded['id'], 'effective_date': loaded['effective_date']}), 200
+                flash(f'This file is already loaded (rate version {loaded["id"]}, effective '
+                      f'{loaded["effective_date"]}); nothing was written.', 'warning')
+                return redirect(url_for('index'))
+
+            load = functools.partial(parse_csv_content, fingerprint=fingerprint)
+
+            # Async mode: queue the load and hand back a job id to poll
+            if is_async:
+                job_id = job_queue.submit('csv_upload', load, csv_content, effective_date, uploader,
+                                          filename=secure_filename(file.filename), effective_date=effective_date)
+                return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
             
             # Parse and process CSV
-            result = parse_csv_content(csv_content, effective_date, uploader)
+            result = load(csv_content, effective_date, uploader)
             
             
             if result['success']:
@@ -350,57 +495,333 @@ def upload_file():
     
     return redirect(url_for('index'))
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a background upload job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job)
+
+# Columns of current_rates a client may project with ?fields=
+RATE_FIELDS = ('id', 'rate_version_id', 'jurisdiction_id', 'business_code',
+               'state_rate', 'county_rate', 'city_rate', 'total_rate')
+RATE_EMBEDS = ('jurisdictions', 'business_class_codes')
+API_RATES_MAX_LIMIT = 1000  # PostgREST's own row cap
+
+def build_rate_select(fields_param):
+    """Turn ?fields=business_code,city_rate,jurisdictions into a select string.
+
+    ``id`` is always included because it is the pagination key.
+    """
+    if not fields_param:
+        return '*, jurisdictions(*), business_class_codes(*)'
+    requested = [f.strip() for f in fields_param.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in RATE_FIELDS and f not in RATE_EMBEDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = ['id'] + [f for f in requested if f in RATE_FIELDS and f != 'id']
+    columns += [f'{f}(*)' for f in requested if f in RATE_EMBEDS]
+    return ', '.join(columns)
+
+def rate_id_filters(args):
+    """Filters that resolve to ids first: (rates column, lookup table, lookup column, value).
+
+    effective_date and region_code are resolved to rate_version / jurisdiction
+    ids so the filter applies to the rows themselves rather than only to an
+    embedded resource.
+    """
+    filters = []
+    if args.get('effective_date'):
+        filters.append(('rate_version_id', 'rate_versions', 'effective_date', args.get('effective_date')))
+    if args.get('region_code'):
+        filters.append(('jurisdiction_id', 'jurisdictions', 'city_code', args.get('region_code')))
+    return filters
+
+def parse_min_rate(args):
+    """The min_rate filter as a float (None if absent); raises ValueError."""
+    value = args.get('min_rate')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'Invalid min_rate: {value} (expected a number)')
+
+def apply_value_filters(query, args):
+    """The /rates filters that apply to rate columns directly (business_code, min_rate)."""
+    if args.get('business_code'):
+        query = query.eq('business_code', args.get('business_code'))
+    min_rate = parse_min_rate(args)
+    if min_rate is not None:
+        query = query.gte('total_rate', min_rate)
+    return query
+
+def apply_rate_filters(query, args):
+    """Apply the /rates filters (effective_date, business_code, region_code, min_rate)."""
+    for column, table, key, value in rate_id_filters(args):
+        matches = supabase.table(table).select('id').eq(key, value).execute()
+        query = query.in_(column, [m['id'] for m in matches.data])
+    return apply_value_filters(query, args)
+
+def rates_freshness():
+    """Return (last_modified, version_tag) for the rates data.
+
+    Keyed off the latest rate_versions.loaded_at or row_hashes refresh, so a
+    fix that rewrites rates in place (010, 009, 005, a 004 re-run) counts as
+    a change too; the tag also folds in every version's hash root, the
+    newest version id and the version count so deletes change it as well.
+    """
+    versions = supabase.table('rate_versions').select(FRESHNESS_COLUMNS).execute().data or []
+    return versions_freshness(versions)
+
+# DataTables column index -> current_rates column it sorts on (None: not sortable server side)
+DATATABLE_SORT_COLUMNS = ('id', 'business_code', None, None, None,
+                          'state_rate', 'county_rate', 'city_rate', 'total_rate')
+DATATABLE_DEFAULT_LENGTH = 25
+
+RATE_SEARCH_COLUMNS = ('city_code', 'city_name')  # jurisdictions columns the search box matches
+
+def clean_search_term(term):
+    """Strip characters that would break the PostgREST or() expression."""
+    return (term or '').replace(',', ' ').replace('(', ' ').replace(')', ' ').strip()
+
+def apply_search_matches(query, term, matches):
+    """or() the business code match with the jurisdictions the term matched."""
+    clauses = [f'business_code.ilike.*{term}*']
+    if matches:
+        clauses.append(f"jurisdiction_id.in.({','.join(str(j['id']) for j in matches)})")
+    return query.or_(','.join(clauses))
+
+def apply_rate_search(query, term):
+    """Global search box: business code, or jurisdiction city code / name."""
+    term = clean_search_term(term)
+    if not term:
+        return query
+    matches = []
+    for column in RATE_SEARCH_COLUMNS:
+        matches += supabase.table('jurisdictions').select('id').ilike(column, f'%{term}%').execute().data
+    return apply_search_matches(query, term, matches)
+
+def query_rates_page(args, start=0, length=DATATABLE_DEFAULT_LENGTH, sort_column='id', descending=False,
+                     search=''):
+    """One filtered, sorted page of current_rates plus (records_total, records_filtered)."""
+    total = supabase.table('current_rates').select('id', count='exact').limit(1).execute().count or 0
+    query = supabase.table('current_rates').select('*, jurisdictions(*), business_class_codes(*)', count='exact')
+    query = apply_rate_filters(query, args)
+    query = apply_rate_search(query, search)
+    query = query.order(sort_column, desc=descending)
+    if sort_column != 'id':
+        query = query.order('id')  # stable paging across equal values
+    result = query.range(start, start + length - 1).execute()
+    return result.data or [], total, result.count if result.count is not None else len(result.data or [])
+
 @app.route('/rates')
 def view_rates():
-    """View all tax rates with filtering."""
+    """View tax rates with filtering.
+
+    Only the first page is rendered here; DataTables pages, sorts and
+    searches through /api/rates/datatable from then on.
+    """
     try:
-        # Get filter parameters
-        effective_date = request.args.get('effective_date')
-        business_code = request.args.get('business_code')
-        region_code = request.args.get('region_code')
-        min_rate = request.args.get('min_rate')
-        
-        # Build query with proper joins to get meaningful names
-        query = supabase.table('current_rates').select('*, jurisdictions(*), business_class_codes(*)')
-        
-        if effective_date:
-            # Join with rate_versions to filter by effective_date
-            query = query.eq('rate_versions.effective_date', effective_date)
-        if business_code:
-            query = query.eq('business_code', business_code)
-        if region_code:
-            # Join with jurisdictions to filter by region_code
-            query = query.eq('jurisdictions.city_code', region_code)
-        if min_rate:
-            query = query.gte('total_rate', float(min_rate))
-        
-        # Execute query
-        result = query.execute()
-        rates = result.data or []
-        return render_template('rates.html', rates=rates)
+        rates, total, filtered = query_rates_page(request.args)
+        return render_template('rates.html', rates=rates, records_total=total, records_filtered=filtered)
         
     except Exception as e:
         logger.error(f"Error fetching rates: {str(e)}")
         flash(f'Error fetching rates: {str(e)}', 'error')
-        return render_template('rates.html', rates=[])
+        return render_template('rates.html', rates=[], records_total=0, records_filtered=0)
 
+def parse_datatable_args(args):
+    """DataTables parameters -> (draw, query_rates_page kwargs); raises ValueError."""
+    draw = int(args.get('draw', 0))
+    start = max(int(args.get('start', 0)), 0)
+    length = int(args.get('length', DATATABLE_DEFAULT_LENGTH))
+    length = API_RATES_MAX_LIMIT if length < 1 else min(length, API_RATES_MAX_LIMIT)
+    order_index = int(args.get('order[0][column]', 0))
+    if not 0 <= order_index < len(DATATABLE_SORT_COLUMNS):
+        raise ValueError(f"Invalid sort column {order_index}")
+    parse_min_rate(args)
+    return draw, {
+        'start': start,
+        'length': length,
+        'sort_column': DATATABLE_SORT_COLUMNS[order_index] or 'id',
+        'descending': args.get('order[0][dir]') == 'desc',
+        'search': args.get('search[value]', ''),
+    }
+
+@app.route('/api/rates/datatable')
+def api_rates_datatable():
+    """Server-side processing endpoint for the DataTables grid on /rates.
+
+    Accepts the standard DataTables parameters (draw, start, length,
+    search[value], order[0][column], order[0][dir]) plus the /rates filters.
+    """
+    try:
+        draw, page = parse_datatable_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        rows, total, filtered = query_rates_page(request.args, **page)
+        return jsonify({'draw': draw, 'recordsTotal': total, 'recordsFiltered': filtered, 'data': rows})
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return jsonify({'draw': draw, 'error': str(e)}), 500
+
+def parse_api_rates_args(args):
+    """/api/rates paging parameters -> (limit, cursor, select); raises ValueError."""
+    limit = min(int(args.get('limit', API_RATES_MAX_LIMIT)), API_RATES_MAX_LIMIT)
+    cursor = int(args['cursor']) if args.get('cursor') else None
+    select = build_rate_select(args.get('fields'))
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    parse_min_rate(args)
+    return limit, cursor, select
+
+def api_rates_etag(version_tag, query_string):
+    return hashlib.sha1(f"{version_tag}?{query_string}".encode()).hexdigest()
+
+def next_page_args(args, rows, limit):
+    """Query arguments for the page after ``rows`` (keyset on id)."""
+    return {**args, 'cursor': rows[-1]['id'], 'limit': limit}
 
 @app.route('/api/rates')
 def api_rates():
-    """API endpoint for rates data."""
+    """API endpoint for rates data.
+
+    Query parameters:
+        limit: page size (default and max 1000)
+        cursor: id of the last row of the previous page (see the Link header)
+        fields: comma-separated columns / embeds to return
+        effective_date, business_code, region_code, min_rate: same filters as /rates
+
+    The body stays a JSON array; the next page is advertised in a
+    ``Link: <...>; rel="next"`` header. Responses carry an ETag and
+    Last-Modified derived from rate_versions (see ``rates_freshness``), so a
+    conditional GET returns 304 without touching the rates table.
+    """
     try:
-        result = supabase.table('current_rates').select('*, jurisdictions(*), business_class_codes(*)').execute()
-        return jsonify(result.data or [])
+        try:
+            limit, cursor, select = parse_api_rates_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        last_modified, version_tag = rates_freshness()
+        etag = api_rates_etag(version_tag, request.query_string.decode())
+
+        not_modified = app.response_class(status=304)
+        not_modified.set_etag(etag)
+        not_modified.last_modified = last_modified
+        if request.if_none_match.contains(etag):
+            return not_modified
+        if (not request.if_none_match and last_modified and request.if_modified_since
+                and last_modified.replace(microsecond=0) <= request.if_modified_since):
+            return not_modified
+
+        query = supabase.table('current_rates').select(select)
+        query = apply_rate_filters(query, request.args)
+        if cursor is not None:
+            query = query.gt('id', cursor)
+        rows = query.order('id').limit(limit).execute().data or []
+
+        response = jsonify(rows)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        if len(rows) == limit:
+            next_args = next_page_args(request.args.to_dict(), rows, limit)
+            response.headers['Link'] = f'<{url_for("api_rates", _external=True, **next_args)}>; rel="next"'
+        return response
         
     except Exception as e:
         logger.error(f"API error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Initialize database on startup (runs in both development and production)
-init_database()
+def parse_rate_lookup_args(args, place='region_code'):
+    """/api/rate parameters -> (region_code, business_code, date); raises ValueError.
+
+    ``place`` names the location parameter (``zip`` for ZIP lookups).
+    """
+    location = args.get(place, '').strip()
+    business_code = args.get('business_code', '').strip()
+    on_date = args.get('date') or date.today().isoformat()
+    if not location or not business_code:
+        raise ValueError(f'{place} and business_code are required')
+    try:
+        date.fromisoformat(on_date)
+    except ValueError:
+        raise ValueError(f'Invalid date: {on_date} (expected YYYY-MM-DD)')
+    return location, business_code, on_date
+
+@app.route('/api/rate')
+def api_rate():
+    """Point lookup: rate for region_code + business_code on a date (default today)."""
+    try:
+        region_code, business_code, on_date = parse_rate_lookup_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        rate = rate_index.get().lookup(region_code, business_code, on_date)
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    if rate is None:
+        return jsonify({'error': f'No rate for {region_code}/{business_code} on {on_date}'}), 404
+    return jsonify({'region_code': region_code, 'date': on_date, **rate.as_dict()})
+
+@app.route('/api/rate/combined')
+def api_rate_combined():
+    """Combined state + county + city rate for region_code (or zip) + business_code on a date.
+
+    A city's county component includes its county's rate (county code
+    mapping applied, e.g. 214 -> 014), read from the per-version matrix.
+    ``zip`` (5 or 9 digits) is resolved to its city and county through the
+    offline ZIP index first.
+    """
+    place = 'zip' if 'zip' in request.args else 'region_code'
+    try:
+        location, business_code, on_date = parse_rate_lookup_args(request.args, place)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if place == 'zip' and not app.config['ZIP_JURISDICTION_PATH']:
+        return jsonify({'error': 'ZIP lookups need ZIP_JURISDICTION_PATH'}), 501
+
+    extra = {}
+    try:
+        if place == 'zip':
+            found = zip_index.get().lookup(location)
+            if found is None:
+                return jsonify({'error': f'Unknown ZIP code {location}'}), 404
+            rate = rate_matrix.get().lookup_place(found.city_id, found.county_id, business_code, on_date)
+            extra = {'city_id': found.city_id, 'county_id': found.county_id, 'ambiguous': found.ambiguous}
+        else:
+            rate = rate_matrix.get().lookup(location, business_code, on_date)
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    if rate is None:
+        return jsonify({'error': f'No rate for {location}/{business_code} on {on_date}'}), 404
+    return jsonify({place: location, 'date': on_date, **extra, **rate.as_dict()})
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving. No database access."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness from the cached schema probe; 503 until the required tables answer."""
+    status = schema_check.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 if __name__ == '__main__':
     # This only runs for local development (not when using Gunicorn)
+    init_database()
     port = int(os.getenv('PORT', 5000))
     logger.info(f"Starting Tax Rates Intake Application on port {port}")
     app.run(debug=True, host='0.0.0.0', port=port)
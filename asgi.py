@@ -0,0 +1,361 @@
+"""
+ASGI entry point: async read API in front of the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+    gunicorn -k uvicorn.workers.UvicornWorker -w 1 -b 0.0.0.0:8080 asgi:app
+
+``/api/rates``, ``/api/rates/datatable``, ``/api/rate`` and
+``/api/rate/combined`` are served here
+with the async Supabase client, whose httpx connection pool is shared by
+every request in the process, so one worker can keep many PostgREST queries
+in flight instead of tying up a Gunicorn worker per request. Independent
+lookups within a request (filter ids, freshness, totals) run concurrently.
+
+Everything else (uploads, pages, jobs) is handed to the Flask app on a
+thread, so this is a drop-in replacement for ``app:app``. Parameter
+parsing, filters, ETags and paging come from app.py, so both entry points
+answer identically.
+"""
+
+import asyncio
+import logging
+import sys
+from email.utils import format_datetime, parsedate_to_datetime
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from supabase import acreate_client
+
+import app as flask_app
+from taxrates.version_hashes import FRESHNESS_COLUMNS, versions_freshness
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock: Optional[asyncio.Lock] = None
+
+
+async def get_client():
+    """The process-wide async Supabase client (created on first use)."""
+    global _client, _client_lock
+    if _client is None:
+        if _client_lock is None:
+            _client_lock = asyncio.Lock()
+        async with _client_lock:
+            if _client is None:
+                _client = await acreate_client(flask_app.SUPABASE_URL, flask_app.SUPABASE_KEY)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        try:
+            await _client.postgrest.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing Supabase client: {e}")
+        _client = None
+
+
+# -- queries (async twins of the helpers in app.py) -------------------------
+
+async def apply_rate_filters(client, query, args):
+    lookups = flask_app.rate_id_filters(args)
+    results = await asyncio.gather(*(
+        client.table(table).select('id').eq(key, value).execute() for _, table, key, value in lookups))
+    for (column, *_), matches in zip(lookups, results):
+        query = query.in_(column, [m['id'] for m in matches.data])
+    return flask_app.apply_value_filters(query, args)
+
+
+async def rates_freshness(client):
+    versions = (await client.table('rate_versions').select(FRESHNESS_COLUMNS).execute()).data or []
+    return versions_freshness(versions)
+
+
+async def search_matches(client, term: str) -> List[Dict]:
+    """Jurisdictions whose city code / name contain the (cleaned) search term."""
+    if not term:
+        return []
+    results = await asyncio.gather(*(
+        client.table('jurisdictions').select('id').ilike(column, f'%{term}%').execute()
+        for column in flask_app.RATE_SEARCH_COLUMNS))
+    return [m for r in results for m in r.data]
+
+
+async def query_rates_page(client, args, start=0, length=flask_app.DATATABLE_DEFAULT_LENGTH,
+                           sort_column='id', descending=False, search=''):
+    term = flask_app.clean_search_term(search)
+    query = client.table('current_rates').select('*, jurisdictions(*), business_class_codes(*)', count='exact')
+    query, matches = await asyncio.gather(apply_rate_filters(client, query, args), search_matches(client, term))
+    if term:
+        query = flask_app.apply_search_matches(query, term, matches)
+    query = query.order(sort_column, desc=descending)
+    if sort_column != 'id':
+        query = query.order('id')  # stable paging across equal values
+    total, result = await asyncio.gather(
+        client.table('current_rates').select('id', count='exact').limit(1).execute(),
+        query.range(start, start + length - 1).execute())
+    rows = result.data or []
+    return rows, total.count or 0, result.count if result.count is not None else len(rows)
+
+
+# -- HTTP plumbing -----------------------------------------------------------
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.args: Dict[str, str] = {}
+        for key, value in parse_qsl(self.query_string, keep_blank_values=True):
+            self.args.setdefault(key, value)  # first value wins, like request.args.get
+        self.headers: Dict[str, str] = {}
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            self.headers[name] = f"{self.headers[name]}, {value}" if name in self.headers else value
+
+    def url_for(self, path: str, args: Dict) -> str:
+        host = self.headers.get('host')
+        if not host:
+            server_host, port = self.scope.get('server') or ('localhost', 80)
+            host = f"{server_host}:{port}"
+        root = self.scope.get('root_path', '')
+        return f"{self.scope.get('scheme', 'http')}://{host}{root}{path}?{urlencode(args)}"
+
+    def etag_matches(self, etag: str) -> bool:
+        """Strong If-None-Match comparison, as werkzeug's ``ETags.contains``."""
+        for tag in self.headers.get('if-none-match', '').split(','):
+            tag = tag.strip()
+            if tag == '*' or (not tag.startswith('W/') and tag.strip('"') == etag):
+                return True
+        return False
+
+    def if_modified_since(self):
+        value = self.headers.get('if-modified-since')
+        if not value:
+            return None
+        try:
+            return parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+
+Response = Tuple[int, List[Tuple[str, str]], bytes]
+
+
+def json_response(body, status: int = 200, headers: Optional[List[Tuple[str, str]]] = None) -> Response:
+    payload = flask_app.app.json.dumps(body).encode('utf-8') + b'\n'
+    base = [('content-type', 'application/json'), ('content-length', str(len(payload)))]
+    return status, base + (headers or []), payload
+
+
+def cache_headers(etag: str, last_modified) -> List[Tuple[str, str]]:
+    headers = [('etag', f'"{etag}"')]
+    if last_modified is not None:
+        headers.append(('last-modified', format_datetime(last_modified.replace(microsecond=0), usegmt=True)))
+    return headers
+
+
+# -- endpoints ---------------------------------------------------------------
+
+async def api_rates(request: Request) -> Response:
+    """Async /api/rates (see app.api_rates for the contract)."""
+    try:
+        limit, cursor, select = flask_app.parse_api_rates_args(request.args)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    try:
+        client = await get_client()
+        # Filter-id lookups run alongside the freshness check; the rates
+        # query itself only goes out if the client's copy is stale.
+        query = client.table('current_rates').select(select)
+        (last_modified, version_tag), query = await asyncio.gather(
+            rates_freshness(client), apply_rate_filters(client, query, request.args))
+        etag = flask_app.api_rates_etag(version_tag, request.query_string)
+
+        if request.etag_matches(etag):
+            return 304, cache_headers(etag, last_modified), b''
+        since = request.if_modified_since()
+        if ('if-none-match' not in request.headers and last_modified and since
+                and last_modified.replace(microsecond=0) <= since):
+            return 304, cache_headers(etag, last_modified), b''
+
+        if cursor is not None:
+            query = query.gt('id', cursor)
+        rows = (await query.order('id').limit(limit).execute()).data or []
+
+        headers = cache_headers(etag, last_modified) + [('cache-control', 'no-cache')]
+        if len(rows) == limit:
+            next_args = flask_app.next_page_args(request.args, rows, limit)
+            headers.append(('link', f'<{request.url_for("/api/rates", next_args)}>; rel="next"'))
+        return json_response(rows, headers=headers)
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return json_response({'error': str(e)}, 500)
+
+
+async def api_rates_datatable(request: Request) -> Response:
+    """Async /api/rates/datatable (see app.api_rates_datatable)."""
+    try:
+        draw, page = flask_app.parse_datatable_args(request.args)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    try:
+        rows, total, filtered = await query_rates_page(await get_client(), request.args, **page)
+        return json_response({'draw': draw, 'recordsTotal': total, 'recordsFiltered': filtered, 'data': rows})
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return json_response({'draw': draw, 'error': str(e)}, 500)
+
+
+async def api_rate(request: Request) -> Response:
+    """Async /api/rate: the in-memory index, rebuilt on a thread when stale."""
+    try:
+        region_code, business_code, on_date = flask_app.parse_rate_lookup_args(request.args)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    try:
+        index = await asyncio.to_thread(flask_app.rate_index.get)
+        rate = index.lookup(region_code, business_code, on_date)
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return json_response({'error': str(e)}, 500)
+    if rate is None:
+        return json_response({'error': f'No rate for {region_code}/{business_code} on {on_date}'}, 404)
+    return json_response({'region_code': region_code, 'date': on_date, **rate.as_dict()})
+
+
+async def api_rate_combined(request: Request) -> Response:
+    """Async /api/rate/combined (see app.api_rate_combined); indexes rebuilt on a thread."""
+    place = 'zip' if 'zip' in request.args else 'region_code'
+    try:
+        location, business_code, on_date = flask_app.parse_rate_lookup_args(request.args, place)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    if place == 'zip' and not flask_app.app.config['ZIP_JURISDICTION_PATH']:
+        return json_response({'error': 'ZIP lookups need ZIP_JURISDICTION_PATH'}, 501)
+
+    extra = {}
+    try:
+        if place == 'zip':
+            found = (await asyncio.to_thread(flask_app.zip_index.get)).lookup(location)
+            if found is None:
+                return json_response({'error': f'Unknown ZIP code {location}'}, 404)
+            matrix = await asyncio.to_thread(flask_app.rate_matrix.get)
+            rate = matrix.lookup_place(found.city_id, found.county_id, business_code, on_date)
+            extra = {'city_id': found.city_id, 'county_id': found.county_id, 'ambiguous': found.ambiguous}
+        else:
+            matrix = await asyncio.to_thread(flask_app.rate_matrix.get)
+            rate = matrix.lookup(location, business_code, on_date)
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return json_response({'error': str(e)}, 500)
+
+    if rate is None:
+        return json_response({'error': f'No rate for {location}/{business_code} on {on_date}'}, 404)
+    return json_response({place: location, 'date': on_date, **extra, **rate.as_dict()})
+
+
+ROUTES = {
+    '/api/rates': api_rates,
+    '/api/rates/datatable': api_rates_datatable,
+    '/api/rate': api_rate,
+    '/api/rate/combined': api_rate_combined,
+}
+
+
+# -- Flask fallback ------------------------------------------------------------
+
+def wsgi_environ(scope, body: bytes) -> Dict:
+    server_host, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_host,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive) -> Response:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    def run() -> Response:
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+            return lambda data: None
+
+        result = flask_app.app(wsgi_environ(scope, body), start_response)
+        try:
+            payload = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], payload
+
+    return await asyncio.to_thread(run)
+
+
+# -- ASGI application ------------------------------------------------------------
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get(scope['path']) if scope['method'] in ('GET', 'HEAD') else None
+    if handler is not None:
+        status, headers, body = await handler(Request(scope))
+    else:
+        status, headers, body = await call_flask(scope, receive)
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
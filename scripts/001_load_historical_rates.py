@@ -1,12 +1,23 @@
 """
 Script to load historical tax rates with proper RateStartDate as effective_date
+
+Usage:
+    python scripts/001_load_historical_rates.py            # read the whole CSV, then load
+    python scripts/001_load_historical_rates.py --stream   # load one effective date at a time
 """
 import os
+import sys
 import csv
 from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.ador_csv import iter_date_batches
+from taxrates.jurisdictions import JurisdictionResolver
+
 # Load environment variables
 load_dotenv()
 
@@ -15,6 +26,9 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Region code -> (id, level, name); county records win on code clashes
+jurisdictions = JurisdictionResolver.for_client(supabase)
+
 def query_table_structure():
     """Step 1: Query current rates and rate_versions table structure"""
     print("\n" + "="*60)
@@ -262,6 +276,94 @@ def load_csv_data(csv_path):
 
     print(f"\n  TOTAL: {total_rates} rates inserted across {len(rates_by_date)} rate versions")
 
+def stream_csv_data(csv_path):
+    """Step 3 (streaming): load the CSV one RateStartDate batch at a time.
+
+    Only the current batch is held in memory; jurisdictions and business
+    codes are created the first time a batch references them.
+    """
+    print("\n" + "="*60)
+    print(f"STEP 3: Streaming CSV data from {csv_path}")
+    print("="*60)
+
+    version_ids = {}
+    seen_regions = set()
+    seen_codes = set()
+    total_rates = 0
+
+    for effective_date, records in iter_date_batches(csv_path, positive_only=False):
+        new_regions = {(r['region_code'], r['region_name']) for r in records
+                       if r['region_code'] not in seen_regions}
+        known = jurisdictions.mapping()
+        created = False
+        for region_code, region_name in sorted(new_regions):
+            seen_regions.add(region_code)
+            if region_code in known:
+                continue
+            try:
+                max_id_result = supabase.table('jurisdictions').select('id').order('id', desc=True).limit(1).execute()
+                new_id = (max_id_result.data[0]['id'] + 1) if max_id_result.data else 1
+                supabase.table('jurisdictions').insert({
+                    'id': new_id,
+                    'level': 'city',
+                    'state_code': 'AZ',
+                    'city_code': region_code,
+                    'city_name': region_name or f"{region_code} City"
+                }).execute()
+                created = True
+                print(f"  Created jurisdiction: {region_code} ({region_name})")
+            except Exception as e:
+                print(f"  Error with jurisdiction {region_code}: {e}")
+        if created:
+            jurisdictions.invalidate()
+            known = jurisdictions.mapping()
+
+        new_codes = [{'code': r['business_code'], 'description': r['business_name'] or f"Business Code {r['business_code']}"}
+                     for r in records if r['business_code'] not in seen_codes]
+        if new_codes:
+            unique = {c['code']: c for c in new_codes}
+            seen_codes.update(unique)
+            try:
+                supabase.table('business_class_codes').upsert(list(unique.values())).execute()
+            except Exception as e:
+                print(f"  Error with business codes: {e}")
+
+        try:
+            rate_version_id = version_ids.get(effective_date)
+            if rate_version_id is None:
+                rv_result = supabase.table('rate_versions').insert({
+                    'effective_date': effective_date,
+                    'loaded_at': effective_date
+                }).execute()
+                rate_version_id = version_ids[effective_date] = rv_result.data[0]['id']
+                print(f"\n  Created rate_version {rate_version_id} for {effective_date}")
+
+            rates_to_insert = []
+            for r in records:
+                lookup = known.get(r['region_code'])
+                if not lookup:
+                    continue
+                county = lookup.level == 'county'
+                rates_to_insert.append({
+                    'rate_version_id': rate_version_id,
+                    'business_code': r['business_code'],
+                    'jurisdiction_id': lookup.id,
+                    'state_rate': 0.0,
+                    'county_rate': r['rate'] if county else 0.0,
+                    'city_rate': 0.0 if county else r['rate']
+                })
+
+            batch_size = 500
+            for i in range(0, len(rates_to_insert), batch_size):
+                supabase.table('rates').insert(rates_to_insert[i:i+batch_size]).execute()
+
+            print(f"    Inserted {len(rates_to_insert)} rates")
+            total_rates += len(rates_to_insert)
+        except Exception as e:
+            print(f"  Error processing {effective_date}: {e}")
+
+    print(f"\n  TOTAL: {total_rates} rates inserted across {len(version_ids)} rate versions")
+
 def verify_px_011():
     """Step 4: Verify with PX + 011 query"""
     print("\n" + "="*60)
@@ -318,7 +420,10 @@ def main():
     truncate_tables()
 
     # Step 3: Load CSV data
-    load_csv_data(csv_path)
+    if '--stream' in sys.argv:
+        stream_csv_data(csv_path)
+    else:
+        load_csv_data(csv_path)
 
     # Step 4: Verify
     verify_px_011()
@@ -15,20 +15,35 @@ Options:
     --skip-historical Skip historical CSV merge
     --skip-ador      Skip ADOR CSV sync
     --verify-only    Only run verification, no modifications
+    --stream         Write historical CSVs one effective date at a time
+                     instead of loading them into memory first
+    --direct         Restore / merge through COPY + set-based SQL over
+                     DATABASE_URL (psycopg2) instead of PostgREST batches
 """
 
 import csv
+import json
 import os
 import re
 import sys
 import argparse
 from collections import defaultdict
-from datetime import datetime
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.ador_csv import AdorColumns, iter_date_batches
+from taxrates.batch_writer import BatchWriter
+from taxrates.db import fetch_all, insert_batches
+from taxrates.fingerprint import find_loaded_version, rates_fingerprint, record_fingerprint
+from taxrates.pg_dump import iter_copy_rows
+from taxrates import pg_copy
+from taxrates.jurisdictions import Jurisdiction, JurisdictionResolver
+from taxrates.version_hashes import refresh_hashes
+
 # Load environment variables
 load_dotenv()
 
@@ -36,6 +51,12 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Region code -> (id, level, name); county records win on code clashes
+jurisdictions = JurisdictionResolver.for_client(supabase)
+
+# psycopg2 connection when run with --direct (COPY + set-based merge)
+direct = None
+
 # Default paths
 BACKUP_PATH = r"C:\Users\noson\Downloads\backup_jan26.sql"
 DOWNLOADS_DIR = r"C:\Users\noson\Downloads"
@@ -47,94 +68,20 @@ HISTORICAL_CSVS = [
 ]
 
 
-def parse_backup_sql(backup_path: str) -> Tuple[List[Dict], List[Dict]]:
-    """Parse the backup SQL file to extract rate_versions and rates data."""
-    print(f"\n[1] Parsing backup file: {backup_path}")
-
-    with open(backup_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Extract rate_versions
-    rv_match = re.search(r'COPY public\.rate_versions.*?FROM stdin;\n(.*?)\n\\\.', content, re.DOTALL)
-    rate_versions = []
-    if rv_match:
-        for line in rv_match.group(1).strip().split('\n'):
-            if line.strip():
-                parts = line.split('\t')
-                rate_versions.append({
-                    'id': int(parts[0]),
-                    'effective_date': parts[1],
-                    'loaded_at': parts[2] if len(parts) > 2 else None
-                })
-
-    # Extract rates
-    rates_match = re.search(r'COPY public\.rates.*?FROM stdin;\n(.*?)\n\\\.', content, re.DOTALL)
-    rates = []
-    if rates_match:
-        for line in rates_match.group(1).strip().split('\n'):
-            if line.strip():
-                parts = line.split('\t')
-                rates.append({
-                    'id': int(parts[0]),
-                    'rate_version_id': int(parts[1]),
-                    'business_code': parts[2],
-                    'jurisdiction_id': int(parts[3]),
-                    'state_rate': float(parts[4]),
-                    'county_rate': float(parts[5]),
-                    'city_rate': float(parts[6])
-                })
-
-    print(f"    Found {len(rate_versions)} rate_versions, {len(rates)} rates")
-    return rate_versions, rates
+RATE_COLUMNS = ('id', 'rate_version_id', 'business_code', 'jurisdiction_id', 'state_rate', 'county_rate', 'city_rate')
+# rate_versions columns restored when the dump has them (the storage columns come with delta storage)
+VERSION_COLUMNS = ('id', 'effective_date', 'storage', 'base_version_id', 'diff_summary')
+REMOVAL_COLUMNS = ('rate_version_id', 'jurisdiction_id', 'business_code')
 
 
 def parse_historical_csv(csv_path: str) -> List[Dict]:
     """Parse the AZTaxesRpt historical CSV."""
     print(f"\n    Parsing: {os.path.basename(csv_path)}")
 
-    records = []
-    with open(csv_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                # Parse date - handle different formats
-                date_str = row.get('RateStartDate', '').strip()
-                if not date_str:
-                    continue
-
-                # Try different date formats
-                start_date = None
-                for fmt in ['%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M', '%m/%d/%Y']:
-                    try:
-                        start_date = datetime.strptime(date_str.split()[0] if ' ' not in fmt else date_str, fmt)
-                        break
-                    except:
-                        continue
-
-                if not start_date:
-                    # Last resort: extract just the date part
-                    try:
-                        parts = date_str.split()[0].split('/')
-                        start_date = datetime(int(parts[2]), int(parts[0]), int(parts[1]))
-                    except:
-                        continue
-
-                # Parse rate
-                rate_str = row.get('TaxRate', '0').strip()
-                rate = float(rate_str.replace('%', ''))
-                # AZDOR CSV rates are always percentages — always divide by 100
-                rate = rate / 100.0
-
-                records.append({
-                    'region_code': row.get('RegionCode', '').strip(),
-                    'region_name': row.get('RegionName', '').strip(),
-                    'business_code': row.get('BusinessCode', '').strip(),
-                    'business_name': row.get('BusinessCodesName', '').strip(),
-                    'rate': rate,
-                    'effective_date': start_date.strftime('%Y-%m-%d')
-                })
-            except Exception as e:
-                continue
+    # Columnar read: RateStartDate / TaxRate are converted once per distinct value.
+    # Zero rates are kept (a rate can drop to 0 in the history).
+    table = AdorColumns.from_path(csv_path)
+    records = list(table.records(require_date=True, positive_only=False))
 
     # Get unique dates
     unique_dates = set(r['effective_date'] for r in records)
@@ -148,20 +95,10 @@ def parse_historical_csv(csv_path: str) -> List[Dict]:
     return records
 
 
-def build_jurisdiction_cache() -> Dict[str, Tuple[int, str]]:
-    """Build cache of region_code -> (jurisdiction_id, level)."""
+def build_jurisdiction_cache() -> Dict[str, Jurisdiction]:
+    """Region code -> Jurisdiction(id, level, name) from the shared resolver."""
     print("\n[3] Building jurisdiction cache...")
-
-    result = supabase.table("jurisdictions").select("id, city_code, region_code, level").execute()
-
-    cache = {}
-    for j in result.data:
-        level = j.get("level", "city")
-        if j.get("city_code"):
-            cache[j["city_code"]] = (j["id"], level)
-        if j.get("region_code"):
-            cache[j["region_code"]] = (j["id"], level)
-
+    cache = jurisdictions.mapping()
     print(f"    Cached {len(cache)} jurisdiction mappings")
     return cache
 
@@ -179,35 +116,122 @@ def get_current_state() -> Dict:
     }
 
 
-def truncate_and_restore_backup(rate_versions: List[Dict], rates: List[Dict]):
-    """Truncate tables and restore from backup."""
-    print("\n[4] Truncating and restoring from backup...")
-
-    # Truncate in correct order (rates first due to FK)
+def truncate_tables():
+    """Truncate in correct order (rates first due to FK); rate_removals cascade with rate_versions."""
     print("    Truncating rates...")
     supabase.table('rates').delete().neq('id', -99999).execute()
 
     print("    Truncating rate_versions...")
     supabase.table('rate_versions').delete().neq('id', -99999).execute()
 
-    # Insert rate_versions
-    print(f"    Inserting {len(rate_versions)} rate_versions...")
-    for rv in rate_versions:
-        supabase.table('rate_versions').insert({
-            'id': rv['id'],
-            'effective_date': rv['effective_date']
-        }).execute()
-
-    # Insert rates in batches
-    print(f"    Inserting {len(rates)} rates...")
-    batch_size = 500
-    for i in range(0, len(rates), batch_size):
-        batch = rates[i:i+batch_size]
-        supabase.table('rates').insert(batch).execute()
-        if (i + batch_size) % 2000 == 0:
-            print(f"      Inserted {min(i + batch_size, len(rates))}/{len(rates)}")
 
+def check_backup(backup_path: str) -> Tuple[List[Dict], int, List[Dict]]:
+    """Read the whole dump once without writing; returns (rate_versions, rate count, rate_removals).
+
+    rate_versions keep their delta storage columns (storage, base_version_id,
+    diff_summary) when the dump has them, ordered by effective date so a
+    base version is always written before the deltas on top of it.
+    Raises ValueError if the dump is truncated or malformed, lacks a rates
+    column we restore, has no rates, or has rates / removals / base versions
+    pointing at a rate_version it doesn't contain.
+    """
+    versions: List[Dict] = []
+    removals: List[Dict] = []
+    version_ids: Set[int] = set()
+    rate_count = 0
+    dangling: Set[Any] = set()
+    for table, columns, row in iter_copy_rows(backup_path, ('rate_versions', 'rates', 'rate_removals')):
+        record = dict(zip(columns, row))
+        if table == 'rate_versions':
+            version = {c: record[c] for c in VERSION_COLUMNS if c in record}
+            if isinstance(version.get('diff_summary'), str):
+                version['diff_summary'] = json.loads(version['diff_summary'])
+            versions.append(version)
+            version_ids.add(record['id'])
+            continue
+        if table == 'rate_removals':
+            removals.append({c: record[c] for c in REMOVAL_COLUMNS})
+            dangling.add(record['rate_version_id'])
+            continue
+        if rate_count == 0:
+            missing = set(RATE_COLUMNS) - set(columns)
+            if missing:
+                raise ValueError(f"rates is missing column(s): {', '.join(sorted(missing))}")
+        rate_count += 1
+        if record['rate_version_id'] not in version_ids:
+            dangling.add(record['rate_version_id'])
+
+    # pg_dump writes rate_versions first, but check against the complete set
+    dangling |= {v['base_version_id'] for v in versions if v.get('base_version_id') is not None}
+    dangling -= version_ids
+    if dangling:
+        raise ValueError(f"rows reference rate_version(s) missing from the dump: {sorted(dangling)[:10]}")
+    if not rate_count:
+        raise ValueError("the dump has no rates")
+    versions.sort(key=lambda v: (str(v['effective_date'])[:10], v['id']))
+    return versions, rate_count, removals
+
+
+def restore_backup(backup_path: str, batch_size: int = 500) -> int:
+    """Truncate and restore rate_versions / rates / rate_removals straight from the dump.
+
+    The dump is streamed twice, so memory stays constant however large the
+    backup is: ``check_backup`` reads all of it first, and nothing is
+    truncated unless it is complete and consistent. The second pass writes
+    rate_versions (a few hundred rows, with their delta storage columns),
+    the rates, and then the rate_removals the truncate cascaded away, and
+    every restored version's row_hashes are recomputed afterwards. With
+    --direct the replacement is one COPY-based transaction; over PostgREST
+    the first failed batch stops the restore with ``BatchWriteError``
+    rather than being logged and skipped. Returns the highest restored
+    rate_version id.
+    """
+    print(f"\n[1] Restoring from backup file: {backup_path}")
+    print("    Checking the dump...")
+    versions, rate_count, removals = check_backup(backup_path)
+    print(f"    Dump holds {len(versions)} rate_versions, {rate_count} rates, {len(removals)} rate_removals")
+
+    def rate_rows():
+        for _, columns, row in iter_copy_rows(backup_path, ('rates',)):
+            record = dict(zip(columns, row))
+            yield {k: record.get(k) for k in RATE_COLUMNS}
+
+    max_version_id = max((v['id'] for v in versions), default=0)
+
+    if direct is not None:
+        print("    Replacing rate_versions / rates via COPY...")
+        restored = pg_copy.restore_tables(direct, versions, rate_rows(), removals).staged
+    else:
+        truncate_tables()
+        # One batch at a time, in effective-date order: base_version_id references earlier rows
+        BatchWriter.for_table(supabase, 'rate_versions', batch_size=batch_size, workers=1).write(
+            versions, stop_on_error=True).check()
+        reported = 0
+
+        def progress(written):
+            nonlocal reported
+            if written - reported >= 10000:
+                reported = written
+                print(f"      Inserted {written} rates")
+
+        # Backup rows carry their ids, so a batch that may have landed is checked by id
+        writer = BatchWriter.for_table(supabase, 'rates', key=('id',), batch_size=batch_size)
+        restored = writer.write(rate_rows(), progress=progress, stop_on_error=True).check().written
+        if removals:
+            BatchWriter.for_table(supabase, 'rate_removals', batch_size=batch_size).write(
+                removals, stop_on_error=True).check()
+
+    if restored != rate_count:
+        raise RuntimeError(f"restored {restored} of {rate_count} rates")
+    print(f"    Restored {len(versions)} rate_versions, {restored} rates, {len(removals)} rate_removals")
+
+    print("    Rehashing restored versions...")
+    for i, v in enumerate(versions, 1):
+        refresh_hashes(supabase, v['id'])
+        if i % 50 == 0:
+            print(f"      {i}/{len(versions)} versions rehashed")
     print("    Backup restored!")
+    return max_version_id
 
 
 def get_or_create_rate_version(effective_date: str, next_id: int) -> Tuple[int, int]:
@@ -226,8 +250,8 @@ def get_or_create_rate_version(effective_date: str, next_id: int) -> Tuple[int,
     return next_id, next_id + 1
 
 
-def ensure_jurisdiction_exists(region_code: str, region_name: str, cache: Dict[str, Tuple[int, str]]) -> Tuple[int, str]:
-    """Ensure jurisdiction exists, create if needed. Returns (jurisdiction_id, level)."""
+def ensure_jurisdiction_exists(region_code: str, region_name: str, cache: Dict[str, Jurisdiction]) -> Jurisdiction:
+    """Ensure jurisdiction exists, create if needed. Returns Jurisdiction(id, level, name)."""
     if region_code in cache:
         return cache[region_code]
 
@@ -244,9 +268,10 @@ def ensure_jurisdiction_exists(region_code: str, region_name: str, cache: Dict[s
         'city_name': region_name or f"{region_code} City"
     }).execute()
 
-    cache[region_code] = (new_id, 'city')
+    jurisdictions.invalidate()
+    cache[region_code] = Jurisdiction(new_id, 'city', region_name or f"{region_code} City")
     print(f"      Created jurisdiction: {region_code} ({region_name}) -> ID {new_id}")
-    return (new_id, 'city')
+    return cache[region_code]
 
 
 def ensure_business_code_exists(code: str, name: str):
@@ -260,7 +285,101 @@ def ensure_business_code_exists(code: str, name: str):
         pass
 
 
-def merge_historical_rates(historical_records: List[Dict], jurisdiction_cache: Dict[str, Tuple[int, str]], start_version_id: int):
+def existing_rate_keys(version_id: int) -> Set[Tuple[int, str]]:
+    """(jurisdiction_id, business_code) pairs the version already has."""
+    if direct is not None:
+        with direct.cursor() as cur:
+            cur.execute("SELECT jurisdiction_id, business_code FROM rates WHERE rate_version_id = %s",
+                        (version_id,))
+            return {(jid, code) for jid, code in cur.fetchall()}
+    existing_rates = fetch_all(supabase, "rates", "id, jurisdiction_id, business_code", rate_version_id=version_id)
+    return {(r['jurisdiction_id'], r['business_code']) for r in existing_rates}
+
+
+def replace_rates(rows: List[Dict]) -> int:
+    """Overwrite the stored rates of existing (version, jurisdiction, business code) rows."""
+    if direct is not None:
+        return pg_copy.merge_rows(direct, 'rates', pg_copy.RATE_COLUMNS, rows, pg_copy.RATE_KEY,
+                                  update=('state_rate', 'county_rate', 'city_rate')).updated
+    for row in rows:
+        supabase.table('rates').update(
+            {k: row[k] for k in ('state_rate', 'county_rate', 'city_rate')}
+        ).eq('rate_version_id', row['rate_version_id']).eq('jurisdiction_id', row['jurisdiction_id']).eq(
+            'business_code', row['business_code']).execute()
+    return len(rows)
+
+
+def write_historical_batch(effective_date: str, records: List[Dict], jurisdiction_cache: Dict[str, Jurisdiction],
+                           next_id: int, stats: Dict, written: Optional[Set[Tuple[int, int, str]]] = None) -> int:
+    """Write one effective date's records (skipping rates the version already has). Returns next_id.
+
+    A key repeated in ``records`` keeps its last row. ``written`` (stream
+    mode) collects the (version, jurisdiction, business code) keys written
+    from the current file; a record for one of those replaces the stored
+    rate instead of being skipped, so the file's last row wins there too.
+    """
+    # Get or create rate version
+    version_id, next_id = get_or_create_rate_version(effective_date, next_id)
+    if next_id > version_id:
+        stats['versions_created'] += 1
+
+    # Get existing rates for this version to avoid duplicates
+    existing_keys = existing_rate_keys(version_id)
+
+    # Build batch of rates, later records overwriting earlier ones
+    rows: Dict[Tuple[int, str], Dict] = {}
+    for r in records:
+        lookup = jurisdiction_cache.get(r['region_code'])
+        if not lookup:
+            lookup = ensure_jurisdiction_exists(r['region_code'], r.get('region_name', ''), jurisdiction_cache)
+
+        if not lookup:
+            stats['skipped'] += 1
+            continue
+
+        jurisdiction_id, jurisdiction_level, _ = lookup
+
+        # Put rate in correct column based on jurisdiction level
+        if jurisdiction_level == 'county':
+            county_rate = r['rate']
+            city_rate = 0.0
+        else:  # city level
+            county_rate = 0.0
+            city_rate = r['rate']
+
+        rows[(jurisdiction_id, r['business_code'])] = {
+            "rate_version_id": version_id,
+            "jurisdiction_id": jurisdiction_id,
+            "business_code": r['business_code'],
+            "state_rate": 0.0,
+            "county_rate": county_rate,
+            "city_rate": city_rate
+        }
+
+    rates_to_insert, rates_to_replace = [], []
+    for key, row in rows.items():
+        if written is not None and (version_id,) + key in written:
+            rates_to_replace.append(row)
+        elif key not in existing_keys:  # Skip if already exists
+            rates_to_insert.append(row)
+            if written is not None:
+                written.add((version_id,) + key)
+
+    # Batch insert
+    inserted = 0
+    if rates_to_insert and direct is not None:
+        inserted = pg_copy.merge_rates(direct, rates_to_insert).inserted
+    elif rates_to_insert:
+        inserted, _ = insert_batches(supabase, 'rates', rates_to_insert, log=lambda msg: print(f"      {msg}"))
+    replaced = replace_rates(rates_to_replace) if rates_to_replace else 0
+    if inserted or replaced:
+        stats['rates_inserted'] += inserted
+        stats['rates_replaced'] = stats.get('rates_replaced', 0) + replaced
+        refresh_hashes(supabase, version_id)
+    return next_id
+
+
+def merge_historical_rates(historical_records: List[Dict], jurisdiction_cache: Dict[str, Jurisdiction], start_version_id: int):
     """Merge historical rates into the database using batch operations."""
     print(f"\n    Merging {len(historical_records)} historical rates (starting version ID: {start_version_id})...")
 
@@ -283,83 +402,68 @@ def merge_historical_rates(historical_records: List[Dict], jurisdiction_cache: D
     stats = {'versions_created': 0, 'rates_inserted': 0, 'skipped': 0}
 
     for i, effective_date in enumerate(sorted_dates):
-        records = by_date[effective_date]
+        next_id = write_historical_batch(effective_date, by_date[effective_date], jurisdiction_cache, next_id, stats)
 
-        # Get or create rate version
-        version_id, next_id = get_or_create_rate_version(effective_date, next_id)
-        if next_id > version_id:
-            stats['versions_created'] += 1
-
-        # Get existing rates for this version to avoid duplicates
-        existing_rates = supabase.table("rates").select("jurisdiction_id, business_code").eq(
-            "rate_version_id", version_id
-        ).execute()
-        existing_keys = {(r['jurisdiction_id'], r['business_code']) for r in existing_rates.data}
-
-        # Build batch of new rates
-        rates_to_insert = []
-        for r in records:
-            lookup = jurisdiction_cache.get(r['region_code'])
-            if not lookup:
-                lookup = ensure_jurisdiction_exists(r['region_code'], r.get('region_name', ''), jurisdiction_cache)
+        # Progress update every 10 dates
+        if (i + 1) % 10 == 0:
+            print(f"      Processed {i + 1}/{len(sorted_dates)} dates, {stats['rates_inserted']} rates inserted")
 
-            if not lookup:
-                stats['skipped'] += 1
-                continue
+    print(f"    Versions created: {stats['versions_created']}")
+    print(f"    Rates inserted: {stats['rates_inserted']}")
+    print(f"    Skipped (no jurisdiction): {stats['skipped']}")
 
-            jurisdiction_id, jurisdiction_level = lookup
+    return next_id
 
-            # Skip if already exists
-            if (jurisdiction_id, r['business_code']) in existing_keys:
-                continue
 
-            # Put rate in correct column based on jurisdiction level
-            if jurisdiction_level == 'county':
-                county_rate = r['rate']
-                city_rate = 0.0
-            else:  # city level
-                county_rate = 0.0
-                city_rate = r['rate']
+def latest_per_key(records: List[Dict]) -> List[Dict]:
+    """Deduplicate by (effective_date, region_code, business_code), keeping the latest value.
 
-            rates_to_insert.append({
-                "rate_version_id": version_id,
-                "jurisdiction_id": jurisdiction_id,
-                "business_code": r['business_code'],
-                "state_rate": 0.0,
-                "county_rate": county_rate,
-                "city_rate": city_rate
-            })
+    Later entries overwrite earlier ones, so the last row of a file wins and
+    the later (2025) file wins over the earlier one.
+    """
+    seen = {}
+    for r in records:
+        seen[(r['effective_date'], r['region_code'], r['business_code'])] = r
+    return list(seen.values())
 
-        # Batch insert
-        if rates_to_insert:
-            batch_size = 500
-            for j in range(0, len(rates_to_insert), batch_size):
-                batch = rates_to_insert[j:j+batch_size]
-                try:
-                    supabase.table('rates').insert(batch).execute()
-                    stats['rates_inserted'] += len(batch)
-                except Exception as e:
-                    print(f"      Error inserting batch: {e}")
-                    # Try individual inserts as fallback
-                    for rate in batch:
-                        try:
-                            supabase.table('rates').insert(rate).execute()
-                            stats['rates_inserted'] += 1
-                        except:
-                            pass
 
-        # Progress update every 10 dates
-        if (i + 1) % 10 == 0:
-            print(f"      Processed {i + 1}/{len(sorted_dates)} dates, {stats['rates_inserted']} rates inserted")
+def stream_historical_rates(csv_paths: List[str], jurisdiction_cache: Dict[str, Jurisdiction], start_version_id: int):
+    """Merge historical CSVs one effective-date batch at a time (flat memory).
 
+    Keeps the same rows as the in-memory merge (``latest_per_key``). Files
+    are read newest first: a rate already present for a version is skipped,
+    so the newest file wins. Within a file the last row wins: a repeated
+    key replaces the rate written from the same file earlier. Only the keys
+    written from the current file are held, not the rows.
+    """
+    next_id = start_version_id
+    stats = {'versions_created': 0, 'rates_inserted': 0, 'skipped': 0}
+    seen_codes: Set[str] = set()
+    batches = 0
+
+    for csv_path in reversed(csv_paths):
+        print(f"\n    Streaming: {os.path.basename(csv_path)}")
+        written: Set[Tuple[int, int, str]] = set()
+        for effective_date, records in iter_date_batches(csv_path, positive_only=False):
+            for r in records:
+                if r['business_code'] not in seen_codes:
+                    seen_codes.add(r['business_code'])
+                    ensure_business_code_exists(r['business_code'], r.get('business_name', ''))
+            next_id = write_historical_batch(effective_date, records, jurisdiction_cache, next_id, stats, written)
+            batches += 1
+            if batches % 10 == 0:
+                print(f"      {batches} batches (at {effective_date}), {stats['rates_inserted']} rates inserted")
+
+    print(f"    Business codes: {len(seen_codes)}")
     print(f"    Versions created: {stats['versions_created']}")
     print(f"    Rates inserted: {stats['rates_inserted']}")
+    print(f"    Rates replaced by a later row of the same file: {stats.get('rates_replaced', 0)}")
     print(f"    Skipped (no jurisdiction): {stats['skipped']}")
 
     return next_id
 
 
-def sync_ador_csvs(csv_dir: str, jurisdiction_cache: Dict[str, Tuple[int, str]], start_version_id: int):
+def sync_ador_csvs(csv_dir: str, jurisdiction_cache: Dict[str, Jurisdiction], start_version_id: int):
     """Sync ADOR CSV files for 2025-2026 data."""
     print(f"\n[6] Syncing TPT_RATETABLE CSVs (starting version ID: {start_version_id})...")
 
@@ -421,6 +525,13 @@ def sync_ador_csvs(csv_dir: str, jurisdiction_cache: Dict[str, Tuple[int, str]],
 
         print(f"      Parsed {len(records)} records")
 
+        # Identical content already loaded: skip before any other query
+        fingerprint = rates_fingerprint(effective_date, records)
+        loaded = find_loaded_version(supabase, fingerprint)
+        if loaded:
+            print(f"      Already loaded as rate_version {loaded['id']} (content fingerprint), skipped")
+            continue
+
         # Get or create rate version
         version_id, next_id = get_or_create_rate_version(effective_date, next_id)
         if next_id > version_id:
@@ -439,7 +550,7 @@ def sync_ador_csvs(csv_dir: str, jurisdiction_cache: Dict[str, Tuple[int, str]],
             if not lookup:
                 continue
 
-            jurisdiction_id, jurisdiction_level = lookup
+            jurisdiction_id, jurisdiction_level, _ = lookup
 
             if (jurisdiction_id, r['business_code']) in existing_keys:
                 continue
@@ -462,16 +573,13 @@ def sync_ador_csvs(csv_dir: str, jurisdiction_cache: Dict[str, Tuple[int, str]],
             })
 
         # Batch insert
-        inserted = 0
+        inserted = failed = 0
         if rates_to_insert:
-            batch_size = 500
-            for j in range(0, len(rates_to_insert), batch_size):
-                batch = rates_to_insert[j:j+batch_size]
-                try:
-                    supabase.table('rates').insert(batch).execute()
-                    inserted += len(batch)
-                except Exception as e:
-                    print(f"      Error: {e}")
+            inserted, failed = insert_batches(supabase, 'rates', rates_to_insert,
+                                              log=lambda msg: print(f"      {msg}"))
+        if not failed:
+            record_fingerprint(supabase, version_id, fingerprint)
+        refresh_hashes(supabase, version_id)
 
         print(f"      Inserted: {inserted} (skipped {len(existing_keys)} existing)")
         total_stats['rates_inserted'] += inserted
@@ -539,12 +647,20 @@ def main():
     parser.add_argument('--skip-historical', action='store_true', help='Skip historical CSV merge')
     parser.add_argument('--skip-ador', action='store_true', help='Skip ADOR CSV sync')
     parser.add_argument('--verify-only', action='store_true', help='Only run verification')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream historical CSVs per effective date (flat memory)')
+    parser.add_argument('--direct', action='store_true',
+                        help='Write via COPY + set-based merge over DATABASE_URL (psycopg2)')
     parser.add_argument('--backup-path', default=BACKUP_PATH, help='Path to backup SQL file')
     parser.add_argument('--historical-csvs', nargs='*', default=HISTORICAL_CSVS, help='Paths to historical rates CSVs')
     parser.add_argument('--downloads-dir', default=DOWNLOADS_DIR, help='Directory with ADOR CSVs')
 
     args = parser.parse_args()
 
+    global direct
+    if args.direct and not args.verify_only:
+        direct = pg_copy.connect()
+
     print("="*60)
     print("COMPREHENSIVE RATES RESTORATION AND SYNC")
     print("="*60)
@@ -571,20 +687,31 @@ def main():
             print("Please extract the backup first or use --skip-backup")
             return
 
-        # Parse backup
-        rate_versions, rates = parse_backup_sql(args.backup_path)
-
-        # Restore backup
-        truncate_and_restore_backup(rate_versions, rates)
-
-        # Get max version ID from backup
-        max_backup_version = max(rv['id'] for rv in rate_versions)
+        # Stream the dump straight into the tables
+        try:
+            max_backup_version = restore_backup(args.backup_path)
+        except ValueError as e:
+            print(f"\nERROR: Backup not restored, the tables were left as they were: {e}")
+            sys.exit(1)
+        except Exception as e:  # BatchWriteError, or an error no batch could get past
+            print(f"\nERROR: Backup restore failed part-way: {e}")
+            print("rates is incomplete; re-run the restore (--direct replaces the tables in one transaction)")
+            sys.exit(1)
         next_version_id = max_backup_version + 1
 
         # Rebuild jurisdiction cache after restore
         jurisdiction_cache = build_jurisdiction_cache()
 
-    if not args.skip_historical:
+    if not args.skip_historical and args.stream:
+        print(f"\n[5] Streaming historical CSVs...")
+        csv_paths = [p for p in args.historical_csvs if os.path.exists(p)]
+        for missing in set(args.historical_csvs) - set(csv_paths):
+            print(f"\nWARNING: Historical CSV not found: {missing}")
+        if csv_paths:
+            next_version_id = stream_historical_rates(csv_paths, jurisdiction_cache, next_version_id)
+        else:
+            print("\nWARNING: No historical CSVs found. Skipping historical merge...")
+    elif not args.skip_historical:
         # Process all historical CSVs
         print(f"\n[5] Processing historical CSVs...")
         all_historical_records = []
@@ -596,13 +723,7 @@ def main():
                 print(f"\nWARNING: Historical CSV not found: {csv_path}")
 
         if all_historical_records:
-            # Deduplicate by (effective_date, region_code, business_code) - keep latest value
-            seen = {}
-            for r in all_historical_records:
-                key = (r['effective_date'], r['region_code'], r['business_code'])
-                seen[key] = r  # Later entries overwrite earlier (2025 file wins)
-
-            unique_records = list(seen.values())
+            unique_records = latest_per_key(all_historical_records)
             print(f"\n    Combined: {len(all_historical_records)} records -> {len(unique_records)} unique")
 
             # Merge historical rates
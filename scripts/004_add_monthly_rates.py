@@ -8,6 +8,10 @@ Usage:
     python scripts/004_add_monthly_rates.py TPT_RATETABLE_ALL_03012026.csv
     python scripts/004_add_monthly_rates.py "C:/Users/noson/Downloads/TPT_RATETABLE_ALL_03012026.csv"
     python scripts/004_add_monthly_rates.py --auto  # Auto-find latest CSV in Downloads
+    python scripts/004_add_monthly_rates.py --auto --direct  # COPY + merge over DATABASE_URL
+    python scripts/004_add_monthly_rates.py --auto --delta   # store only changes vs the previous version
+    python scripts/004_add_monthly_rates.py --auto --incremental  # --delta + diff summary, Stripe sync only on change
+    python scripts/004_add_monthly_rates.py --auto --force   # reload even if this exact file is already loaded
 
 The effective date is parsed from the filename (MMDDYYYY format).
 
@@ -26,17 +30,40 @@ import os
 import re
 import sys
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.db import insert_batches
+from taxrates.fingerprint import find_loaded_version, rates_fingerprint, record_fingerprint
+from taxrates.jurisdictions import JurisdictionResolver
+from taxrates import pg_copy
+from taxrates.rate_deltas import WATCHED_RATES, VersionStore
+from taxrates.rate_matrix import RateMatrix
+from taxrates.version_hashes import refresh_hashes
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Region code -> (id, level, name); county records win on code clashes
+jurisdictions = JurisdictionResolver.for_client(supabase)
+
+# psycopg2 connection when run with --direct (COPY + set-based merge)
+direct = None
+
+# --delta: write the version as changes vs its predecessor (see taxrates/rate_deltas.py)
+delta = False
+
+# --incremental: --delta, plus record the diff on the rate_version and only
+# trigger the Stripe sync when a rate it watches moved
+incremental = False
+
 DOWNLOADS_DIR = r"C:\Users\noson\Downloads"
 
 # Arizona County Region Codes (15 counties)
@@ -185,53 +212,6 @@ def find_latest_csv_file(directory: str = None) -> Optional[str]:
     return latest_file
 
 
-def build_jurisdiction_cache() -> Dict[str, Tuple[int, str, str]]:
-    """
-    Build cache of city_code/region_code -> (jurisdiction_id, level, name).
-
-    When multiple jurisdictions share the same code (e.g. a county code like
-    'APA' exists on both a level='city' and level='county' record), prefer
-    the level='county' record. The backend's _get_county_rate_for_city()
-    filters by level='county' and reads the county_rate column, so county
-    rates must go to level='county' jurisdictions.
-
-    Returns:
-        Dict mapping region codes to (id, level, display_name)
-    """
-    result = supabase.table("jurisdictions").select(
-        "id, city_code, region_code, level, city_name, county_name"
-    ).execute()
-
-    # First pass: collect all candidates per code
-    candidates: Dict[str, List[Tuple[int, str, str]]] = {}
-    for j in result.data:
-        level = j.get("level", "city")
-        if level == "county":
-            display_name = j.get("county_name", "")
-        else:
-            display_name = j.get("city_name", "")
-
-        entry = (j["id"], level, display_name)
-        for code in [j.get("city_code"), j.get("region_code")]:
-            if code:
-                candidates.setdefault(code, []).append(entry)
-
-    # Second pass: resolve conflicts
-    cache = {}
-    for code, entries in candidates.items():
-        if len(entries) == 1:
-            cache[code] = entries[0]
-        else:
-            # For county codes, prefer level='county' (backend requires it)
-            county_entries = [e for e in entries if e[1] == "county"]
-            if county_entries:
-                cache[code] = county_entries[0]
-            else:
-                cache[code] = entries[0]
-
-    return cache
-
-
 def get_or_create_rate_version(effective_date: str) -> int:
     """Get existing rate_version or create new one."""
     existing = supabase.table("rate_versions").select("id").eq("effective_date", effective_date).execute()
@@ -264,16 +244,8 @@ def ensure_business_code_exists(code: str, name: str):
         print(f"WARNING: Could not upsert business code {code}: {e}")
 
 
-def add_rates_from_csv(csv_path: str, effective_date: str):
-    """Add rates from a single CSV file."""
-    print(f"\nProcessing: {os.path.basename(csv_path)}")
-    print(f"Effective date: {effective_date}")
-
-    # Build jurisdiction cache
-    jurisdiction_cache = build_jurisdiction_cache()
-    print(f"Loaded {len(jurisdiction_cache)} jurisdictions")
-
-    # Parse CSV
+def read_csv_records(csv_path: str):
+    """Parse an ADOR CSV -> (records, {(business_code, name)}, parse error count)."""
     records = []
     business_codes = set()
     parse_errors = 0
@@ -302,6 +274,25 @@ def add_rates_from_csv(csv_path: str, effective_date: str):
                 print(f"WARNING: Error parsing row {row_num}: {e}")
                 continue
 
+    return records, business_codes, parse_errors
+
+
+def add_rates_from_csv(csv_path: str, effective_date: str, parsed=None, fingerprint: Optional[str] = None):
+    """Add rates from a single CSV file.
+
+    ``parsed`` is read_csv_records' result if the caller already has it;
+    ``fingerprint`` (taxrates/fingerprint.py) is recorded on the version
+    once every row is written, and the version's row hashes
+    (taxrates/version_hashes.py) are refreshed. Returns (rows inserted, watched rates that
+    changed); the latter is None unless running --incremental.
+    """
+    print(f"\nProcessing: {os.path.basename(csv_path)}")
+    print(f"Effective date: {effective_date}")
+
+    jurisdiction_cache = jurisdictions.mapping()
+    print(f"Loaded {len(jurisdiction_cache)} jurisdictions")
+
+    records, business_codes, parse_errors = parsed or read_csv_records(csv_path)
     print(f"Parsed {len(records)} records, {len(business_codes)} business codes")
     if parse_errors > 0:
         print(f"WARNING: {parse_errors} rows had parse errors and were skipped")
@@ -314,15 +305,18 @@ def add_rates_from_csv(csv_path: str, effective_date: str):
     version_id = get_or_create_rate_version(effective_date)
 
     # Get existing rates for this version to avoid duplicates
-    existing = supabase.table("rates").select("jurisdiction_id, business_code").eq(
-        "rate_version_id", version_id
-    ).execute()
-    existing_keys = {(r['jurisdiction_id'], r['business_code']) for r in existing.data}
-    print(f"Found {len(existing_keys)} existing rates for this version")
-
-    # Build batch of new rates
-    rates_to_insert = []
-    skipped = 0
+    if delta or direct is not None:
+        existing_keys = set()  # write_version / the COPY merge skip stored rows themselves
+    else:
+        existing = supabase.table("rates").select("jurisdiction_id, business_code").eq(
+            "rate_version_id", version_id
+        ).execute()
+        existing_keys = {(r['jurisdiction_id'], r['business_code']) for r in existing.data}
+    if direct is None and not delta:
+        print(f"Found {len(existing_keys)} existing rates for this version")
+
+    # Build the version's full rate set
+    version_rates = []
     missing_jurisdiction = 0
     missing_jurisdiction_codes = set()
 
@@ -335,10 +329,6 @@ def add_rates_from_csv(csv_path: str, effective_date: str):
 
         jurisdiction_id, jurisdiction_level, display_name = lookup
 
-        if (jurisdiction_id, r['business_code']) in existing_keys:
-            skipped += 1
-            continue
-
         # Put rate in correct column based on jurisdiction level
         # Counties: rate goes in county_rate column
         # Cities: rate goes in city_rate column
@@ -349,7 +339,7 @@ def add_rates_from_csv(csv_path: str, effective_date: str):
             county_rate = 0.0
             city_rate = r['rate']
 
-        rates_to_insert.append({
+        version_rates.append({
             "rate_version_id": version_id,
             "jurisdiction_id": jurisdiction_id,
             "business_code": r['business_code'],
@@ -358,30 +348,59 @@ def add_rates_from_csv(csv_path: str, effective_date: str):
             "city_rate": city_rate
         })
 
+    rates_to_insert = [r for r in version_rates
+                       if (r['jurisdiction_id'], r['business_code']) not in existing_keys]
+    skipped = len(version_rates) - len(rates_to_insert)
+
     # Batch insert
     inserted = 0
     insert_errors = 0
-    if rates_to_insert:
-        batch_size = 500
-        for i in range(0, len(rates_to_insert), batch_size):
-            batch = rates_to_insert[i:i+batch_size]
-            try:
-                supabase.table('rates').insert(batch).execute()
-                inserted += len(batch)
-            except Exception as e:
-                insert_errors += 1
-                print(f"ERROR: Failed to insert batch {i//batch_size + 1}: {e}")
+    watched_changed = None
+    if delta:
+        store = VersionStore(supabase)
+
+        def merge_direct(rows):
+            return pg_copy.merge_rates(direct, rows).inserted, 0
+
+        insert = merge_direct if direct is not None else None
+        changes, storage, inserted, insert_errors = store.write_version(version_id, version_rates, insert=insert)
+        print(f"Stored version {version_id} as {storage}: {changes.summary()}")
+        skipped = len(version_rates) - inserted - insert_errors
+
+        if incremental:
+            watched = {}
+            for code, bcode, who in WATCHED_RATES:
+                lookup = jurisdiction_cache.get(code)
+                if lookup:
+                    watched[(lookup[0], bcode)] = f"{code}/{bcode}"
+            # Unresolvable watched codes: leave it to 007 to decide
+            watched_changed = [watched[key] for key in changes.touched(watched)] if watched else None
+            previous = store.predecessor(version_id)
+            summary = dict(changes.as_dict(), storage=storage, watched_changed=watched_changed or [],
+                           base_version_id=previous['id'] if previous else None)
+            if store.record_diff(version_id, summary):
+                print(f"Recorded diff summary on rate_version {version_id}")
+    elif rates_to_insert and direct is not None:
+        merged = pg_copy.merge_rates(direct, rates_to_insert)
+        inserted = merged.inserted
+        skipped += merged.staged - merged.inserted
+    elif rates_to_insert:
+        inserted, insert_errors = insert_batches(supabase, 'rates', rates_to_insert)
 
     print(f"\nResults:")
     print(f"  Inserted: {inserted}")
-    print(f"  Skipped (already exists): {skipped}")
+    print(f"  Skipped ({'unchanged or already stored' if delta else 'already exists'}): {skipped}")
     print(f"  Skipped (missing jurisdiction): {missing_jurisdiction}")
     if missing_jurisdiction_codes:
         print(f"    Missing codes: {', '.join(sorted(missing_jurisdiction_codes))}")
     if insert_errors > 0:
-        print(f"  Insert errors: {insert_errors} batches failed")
+        print(f"  Insert errors: {insert_errors} rows failed")
+    elif fingerprint and record_fingerprint(supabase, version_id, fingerprint):
+        print(f"  Recorded content fingerprint on rate_version {version_id}")
+    hashes = refresh_hashes(supabase, version_id)
+    print(f"  Row hashes: {hashes.rows} rates in {len(hashes.buckets)} jurisdictions (root {hashes.root[:12]})")
 
-    return inserted
+    return inserted, watched_changed
 
 
 def verify_rates():
@@ -406,10 +425,22 @@ def main():
         print("  python scripts/004_add_monthly_rates.py --auto")
         print("\nOptions:")
         print("  --auto    Automatically find and use the latest CSV in Downloads folder")
+        print("  --direct  Load via COPY + set-based merge over DATABASE_URL (psycopg2)")
+        print("  --delta   Store only added/changed/removed rates vs the previous version")
+        print("            (full checkpoint every RATE_CHECKPOINT_EVERY versions)")
+        print("  --incremental  --delta, record the diff on the rate_version, and skip the")
+        print("            Stripe sync when PE/214 and MAR/014 are unchanged")
+        print("  --force   Load even if an identical file is already loaded (content fingerprint)")
         print("\nThe effective date is parsed from the filename (MMDDYYYY format).")
         return
 
-    csv_input = sys.argv[1]
+    global direct, delta, incremental
+    if "--direct" in sys.argv:
+        direct = pg_copy.connect()
+    incremental = "--incremental" in sys.argv
+    delta = incremental or "--delta" in sys.argv
+    force = "--force" in sys.argv
+    csv_input = next((a for a in sys.argv[1:] if a not in ("--direct", "--delta", "--incremental", "--force")), "")
 
     # Handle --auto flag
     if csv_input == "--auto":
@@ -440,16 +471,38 @@ def main():
     print("ADD MONTHLY TAX RATES")
     print("="*60)
 
+    # An identical file that is already loaded needs no database work at all
+    parsed = read_csv_records(csv_path)
+    fingerprint = rates_fingerprint(effective_date, parsed[0])
+    loaded = None if force else find_loaded_version(supabase, fingerprint)
+    if loaded:
+        print(f"\n{os.path.basename(csv_path)} is already loaded as rate_version {loaded['id']} "
+              f"(effective {loaded['effective_date']}) — nothing to do. Use --force to reload.")
+        return
+
     # Show current state
     verify_rates()
 
     # Add rates
-    add_rates_from_csv(csv_path, effective_date)
+    _, watched_changed = add_rates_from_csv(csv_path, effective_date, parsed, fingerprint)
 
     # Show final state
     print("\n" + "="*60)
     verify_rates()
 
+    # Re-materialise the combined rate matrix the app reads
+    matrix_path = os.getenv('RATE_MATRIX_PATH')
+    if matrix_path:
+        print(f"\nRebuilding rate matrix -> {matrix_path}")
+        RateMatrix.load(supabase).save(matrix_path)
+
+    if watched_changed == []:
+        print("\nNo Stripe-watched rate changed (PE/214, MAR/014) — skipping Stripe sync")
+        print("\n" + "="*60)
+        print("DONE!")
+        print("="*60)
+        return
+
     # Auto-sync Stripe tax rates if rates were ingested
     print("\n" + "="*60)
     print("SYNCING STRIPE TAX RATES...")
@@ -1,31 +1,65 @@
 """
 Dry-run drift check for a monthly ADOR CSV.
 
-Read-only. Writes nothing. Mirrors 004_add_monthly_rates.py's jurisdiction
-resolution exactly so the diff reflects what an actual load would do.
+Read-only. Writes nothing. Uses the same shared jurisdiction
+resolution as 004_add_monthly_rates.py so the diff reflects what an actual load would do.
 
 Compares the new CSV against the most recent prior rate_version and reports
 new / changed / removed rates, plus the two Stripe-relevant cells
-(Peoria PE/214 and Maricopa County MAR/014).
+(Peoria PE/214 and Maricopa County MAR/014). The diff is
+taxrates.rate_deltas.diff_rates, which 004_add_monthly_rates.py --incremental
+uses to decide what to write.
+
+Against Supabase, the prior version's stored per-jurisdiction hashes
+(taxrates.version_hashes) are compared with the CSV's and only the
+jurisdictions that differ are downloaded.
+
+Pass --snapshot=<path> (see 011_snapshot_rates.py) to diff against a local
+snapshot instead of Supabase — no network or credentials needed.
 
 Usage:
     python scripts/004_dry_run.py "C:/Users/noson/Downloads/TPT_RATETABLE_ALL_05012026.csv"
+    python scripts/004_dry_run.py TPT_RATETABLE_ALL_05012026.csv --snapshot=rates.ccrs
 """
 
 import csv
 import os
 import re
 import sys
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.jurisdictions import JurisdictionResolver, build_jurisdiction_map
+from taxrates.rate_deltas import WATCHED_RATES, VersionStore, diff_rates, rate_key, total_rate
+from taxrates.snapshot import Snapshot
+from taxrates.version_hashes import diff_against_version
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Optional[Client] = None
+jurisdictions: Optional[JurisdictionResolver] = None
+snapshot: Optional[Snapshot] = None
+
+
+def load_rate_versions() -> List[dict]:
+    """All rate_versions, newest effective_date first."""
+    if snapshot is not None:
+        versions = snapshot.rows("rate_versions", ["id", "effective_date"])
+        return sorted(versions, key=lambda v: v["effective_date"] or "", reverse=True)
+    return supabase.table("rate_versions").select("id, effective_date").order(
+        "effective_date", desc=True).execute().data
+
+
+def load_jurisdictions() -> List[dict]:
+    if snapshot is not None:
+        return snapshot.rows("jurisdictions")
+    return jurisdictions.rows()
 
 
 def parse_rate(rate_str: str) -> float:
@@ -47,88 +81,67 @@ def parse_date_from_filename(filename: str) -> str:
     return f"{int(d[4:])}-{int(d[:2]):02d}-{int(d[2:4]):02d}"
 
 
-def build_jurisdiction_cache() -> Dict[str, Tuple[int, str, str]]:
-    """Copy of 004's build_jurisdiction_cache — county records win on code clashes."""
-    result = supabase.table("jurisdictions").select(
-        "id, city_code, region_code, level, city_name, county_name"
-    ).execute()
-
-    candidates: Dict[str, List[Tuple[int, str, str]]] = {}
-    for j in result.data:
-        level = j.get("level", "city")
-        display_name = j.get("county_name", "") if level == "county" else j.get("city_name", "")
-        entry = (j["id"], level, display_name)
-        for code in [j.get("city_code"), j.get("region_code")]:
-            if code:
-                candidates.setdefault(code, []).append(entry)
-
-    cache = {}
-    for code, entries in candidates.items():
-        if len(entries) == 1:
-            cache[code] = entries[0]
-        else:
-            county_entries = [e for e in entries if e[1] == "county"]
-            cache[code] = county_entries[0] if county_entries else entries[0]
-    return cache
-
-
-def fetch_all_rates(version_id: int) -> Dict[Tuple[int, str], float]:
-    """Paginate through all rates for a version -> {(jurisdiction_id, business_code): rate}."""
-    out: Dict[Tuple[int, str], float] = {}
-    start = 0
-    page = 1000
-    while True:
-        res = supabase.table("rates").select(
-            "jurisdiction_id, business_code, city_rate, county_rate"
-        ).eq("rate_version_id", version_id).order("id").range(
-            start, start + page - 1).execute()
-        for r in res.data:
-            rate = float(r.get("city_rate") or 0) + float(r.get("county_rate") or 0)
-            out[(r["jurisdiction_id"], (r["business_code"] or "").strip())] = round(rate, 6)
-        if len(res.data) < page:
-            break
-        start += page
-    return out
+def fetch_version_rows(version_id: int) -> Dict[Tuple[int, str], dict]:
+    """All rates for a version -> {(jurisdiction_id, business_code): row} (delta versions rebuilt)."""
+    if snapshot is not None:
+        return {rate_key(r): r for r in snapshot.rates_for_version(version_id)}
+    return VersionStore(supabase).rows(version_id)
+
+
+def diff_against_prior(version_id: int, new_rates: Dict[Tuple[int, str], dict], watched: List[int]):
+    """(delta, prior rows read). Against Supabase only jurisdictions whose hashes differ
+    (plus ``watched``) are read; the rest count as unchanged."""
+    if snapshot is not None:
+        prior_rates = fetch_version_rows(version_id)
+        return diff_rates(prior_rates, new_rates.values()), prior_rates
+    return diff_against_version(supabase, version_id, new_rates.values(), also=watched)
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/004_dry_run.py <csv_path>")
+    global supabase, jurisdictions, snapshot
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    snapshot_path = next((a.split("=", 1)[1] for a in sys.argv[1:]
+                          if a.startswith("--snapshot=")), None)
+    if not args:
+        print("Usage: python scripts/004_dry_run.py <csv_path> [--snapshot=<path>]")
         return
 
-    csv_path = sys.argv[1]
+    csv_path = args[0]
     if not os.path.isfile(csv_path):
         print(f"ERROR: File not found: {csv_path}")
         return
+    if snapshot_path:
+        if not os.path.isfile(snapshot_path):
+            print(f"ERROR: Snapshot not found: {snapshot_path}")
+            return
+        snapshot = Snapshot.open(snapshot_path)
+    else:
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        jurisdictions = JurisdictionResolver.for_client(supabase)
 
     new_eff = parse_date_from_filename(os.path.basename(csv_path))
     print("=" * 64)
     print(f"DRY RUN — {os.path.basename(csv_path)}  (effective {new_eff})")
+    if snapshot is not None:
+        print(f"Source: snapshot {snapshot_path} ({snapshot.header['created_at'][:19]})")
     print("=" * 64)
 
     # Prior version = latest rate_version with effective_date < new effective date
-    vers = supabase.table("rate_versions").select("id, effective_date").order(
-        "effective_date", desc=True).execute()
-    prior = next((v for v in vers.data if v["effective_date"] < new_eff), None)
+    vers = load_rate_versions()
+    prior = next((v for v in vers if v["effective_date"] < new_eff), None)
     if not prior:
         print("WARNING: no prior rate_version found — every row will read as NEW.")
-        prior_rates: Dict[Tuple[int, str], float] = {}
-        prior_label = "(none)"
-    else:
-        prior_rates = fetch_all_rates(prior["id"])
-        prior_label = f"v{prior['id']} / {prior['effective_date']}"
-    print(f"Comparing against prior version: {prior_label}  ({len(prior_rates)} rates)\n")
 
-    existing_new = supabase.table("rate_versions").select("id").eq(
-        "effective_date", new_eff).execute()
-    if existing_new.data:
+    existing_new = [v for v in vers if v["effective_date"] == new_eff]
+    if existing_new:
         print(f"NOTE: a rate_version for {new_eff} already exists "
-              f"(id {existing_new.data[0]['id']}) — 004 would skip duplicate rows.\n")
+              f"(id {existing_new[0]['id']}) — 004 would skip duplicate rows.\n")
 
-    cache = build_jurisdiction_cache()
+    # Same resolution as 004 (county records win on code clashes)
+    cache = build_jurisdiction_map(load_jurisdictions())
 
-    # Parse CSV into the same key space the loader uses
-    new_rates: Dict[Tuple[int, str], float] = {}
+    # Parse CSV into the same rows the loader writes
+    new_rates: Dict[Tuple[int, str], dict] = {}
     missing_codes: Dict[str, int] = {}
     dup_in_csv = 0
     with open(csv_path, 'r', encoding='utf-8-sig') as f:
@@ -145,27 +158,28 @@ def main():
             key = (lookup[0], bcode)
             if key in new_rates:
                 dup_in_csv += 1
-            new_rates[key] = rate
-
-    # Diff
-    changed, new_rows, removed = [], [], []
-    for key, rate in new_rates.items():
-        if key not in prior_rates:
-            new_rows.append((key, rate))
-        elif abs(prior_rates[key] - rate) > 1e-9:
-            changed.append((key, prior_rates[key], rate))
-    for key in prior_rates:
-        if key not in new_rates:
-            removed.append(key)
-
-    unchanged = len(new_rates) - len(new_rows) - len(changed)
-    over_one = [(k, v) for k, v in new_rates.items() if v > 1]
+            county = lookup[1] == 'county'
+            new_rates[key] = {"jurisdiction_id": key[0], "business_code": bcode, "state_rate": 0.0,
+                              "county_rate": rate if county else 0.0, "city_rate": 0.0 if county else rate}
+
+    if prior:
+        watched = [cache[code][0] for code, _, _ in WATCHED_RATES if code in cache]
+        delta, prior_rates = diff_against_prior(prior["id"], new_rates, watched)
+        prior_label = f"v{prior['id']} / {prior['effective_date']}"
+    else:
+        prior_rates: Dict[Tuple[int, str], dict] = {}
+        delta = diff_rates(prior_rates, new_rates.values())
+        prior_label = "(none)"
+    prior_count = delta.unchanged + len(delta.changed) + len(delta.removed)
+    print(f"Comparing against prior version: {prior_label}  ({prior_count} rates)\n")
+
+    over_one = [(k, total_rate(r)) for k, r in new_rates.items() if total_rate(r) > 1]
 
     print(f"CSV resolved rates : {len(new_rates)}")
-    print(f"  unchanged        : {unchanged}")
-    print(f"  CHANGED          : {len(changed)}")
-    print(f"  NEW (not in prior): {len(new_rows)}")
-    print(f"  REMOVED (in prior, gone in CSV): {len(removed)}")
+    print(f"  unchanged        : {delta.unchanged}")
+    print(f"  CHANGED          : {len(delta.changed)}")
+    print(f"  NEW (not in prior): {len(delta.added)}")
+    print(f"  REMOVED (in prior, gone in CSV): {len(delta.removed)}")
     print(f"  duplicate keys within CSV: {dup_in_csv}")
     print(f"  rates > 1.0 (100x bug check): {len(over_one)}")
     if missing_codes:
@@ -173,27 +187,26 @@ def main():
         print(f"  rows with unmapped RegionCode: {tot} "
               f"({', '.join(sorted(missing_codes))})")
 
-    juris = supabase.table("jurisdictions").select(
-        "id, city_name, county_name, level").execute()
-    jmap = {j["id"]: j for j in juris.data}
+    jmap = {j["id"]: j for j in load_jurisdictions()}
 
     def label(jid, bcode):
         j = jmap.get(jid, {})
         nm = j.get("county_name") if j.get("level") == "county" else j.get("city_name")
         return f"{nm or '?'} ({jid}) / {bcode}"
 
-    if changed:
+    if delta.changed:
         print("\n--- CHANGED RATES ---")
+        changed = [(rate_key(r), total_rate(prior_rates[rate_key(r)]), total_rate(r)) for r in delta.changed]
         for (jid, bc), old, new in sorted(changed, key=lambda x: -abs(x[2] - x[1])):
             print(f"  {label(jid, bc):<48} {old:.4%} -> {new:.4%}")
-    if new_rows:
+    if delta.added:
         print("\n--- NEW RATES (first 30) ---")
-        for (jid, bc), rate in sorted(new_rows)[:30]:
+        for (jid, bc), rate in sorted((rate_key(r), total_rate(r)) for r in delta.added)[:30]:
             print(f"  {label(jid, bc):<48} {rate:.4%}")
-    if removed:
+    if delta.removed:
         print("\n--- REMOVED RATES (first 30) ---")
-        for jid, bc in sorted(removed)[:30]:
-            print(f"  {label(jid, bc):<48} (was {prior_rates[(jid, bc)]:.4%})")
+        for jid, bc in delta.removed[:30]:
+            print(f"  {label(jid, bc):<48} (was {total_rate(prior_rates[(jid, bc)]):.4%})")
     if over_one:
         print("\n--- WARNING: RATES > 1.0 (possible 100x bug) ---")
         for (jid, bc), v in over_one[:30]:
@@ -201,15 +214,14 @@ def main():
 
     # Stripe-relevant cells
     print("\n--- STRIPE CHECK (007 watches these) ---")
-    for code, bcode, who in [("PE", "214", "Peoria city"),
-                             ("MAR", "014", "Maricopa County")]:
+    for code, bcode, who in WATCHED_RATES:
         lookup = cache.get(code)
         if not lookup:
             print(f"  {who}: RegionCode {code} not in jurisdiction cache")
             continue
         key = (lookup[0], bcode)
-        old = prior_rates.get(key)
-        new = new_rates.get(key)
+        old = total_rate(prior_rates.get(key))
+        new = total_rate(new_rates.get(key))
         old_s = f"{old:.4%}" if old is not None else "—"
         new_s = f"{new:.4%}" if new is not None else "—"
         flag = "  <-- CHANGED, Stripe sync would fire" if (
@@ -9,26 +9,38 @@ columns based on jurisdiction level.
 Usage:
     python scripts/004b_load_historical_county_rates.py "C:/Users/noson/Downloads/AZTaxesRpt - SpRates (2).csv"
     python scripts/004b_load_historical_county_rates.py --verify  # Just verify coverage
+    python scripts/004b_load_historical_county_rates.py "<csv>" --direct  # COPY + merge over DATABASE_URL
 
 Based on migration 020: County rates go in county_rate column, city rates in city_rate column.
 """
 
-import csv
 import os
 import sys
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.ador_csv import AdorColumns
+from taxrates.db import insert_batches
+from taxrates.jurisdictions import JurisdictionResolver
+from taxrates import pg_copy
+from taxrates.version_hashes import refresh_hashes
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Region code -> (id, level, name); county records win on code clashes
+jurisdictions = JurisdictionResolver.for_client(supabase)
+
+# psycopg2 connection when run with --direct (COPY + set-based merge)
+direct = None
+
 # Arizona County Region Codes (15 counties)
 COUNTY_CODES = {
     "APA": "Apache",
@@ -49,86 +61,6 @@ COUNTY_CODES = {
 }
 
 
-def parse_rate(rate_str: str) -> float:
-    """Parse rate string to decimal with 6 decimal precision."""
-    if not rate_str:
-        return 0.0
-
-    rate_str = str(rate_str).strip().replace("%", "")
-    try:
-        rate = float(rate_str)
-        # AZDOR CSV rates are always percentages — always divide by 100
-        rate = rate / 100.0
-        return round(rate, 6)
-    except ValueError:
-        print(f"WARNING: Could not parse rate: '{rate_str}', using 0.0")
-        return 0.0
-
-
-def parse_date(date_str: str) -> Optional[str]:
-    """Parse date string to ISO format (YYYY-MM-DD)."""
-    if not date_str:
-        return None
-
-    date_str = str(date_str).strip()
-    try:
-        # Handle ADOR date format: "1/01/2021 0:00" or "1/01/2021 12:00:00 AM"
-        if " 0:00" in date_str:
-            date_str = date_str.replace(" 0:00", "")
-        if " 12:00:00 AM" in date_str:
-            date_str = date_str.replace(" 12:00:00 AM", "")
-
-        # Try various date formats
-        for fmt in [
-            "%m/%d/%Y",
-            "%Y-%m-%d",
-            "%m-%d-%Y",
-            "%Y/%m/%d",
-        ]:
-            try:
-                parsed_date = datetime.strptime(date_str, fmt).date()
-                return parsed_date.isoformat()
-            except ValueError:
-                continue
-
-        print(f"WARNING: Could not parse date: '{date_str}'")
-        return None
-    except Exception as e:
-        print(f"WARNING: Error parsing date '{date_str}': {e}")
-        return None
-
-
-def build_jurisdiction_cache() -> Dict[str, Tuple[int, str, str]]:
-    """
-    Build cache of city_code/region_code -> (jurisdiction_id, level, name).
-
-    Returns:
-        Dict mapping region codes to (id, level, display_name)
-    """
-    result = supabase.table("jurisdictions").select(
-        "id, city_code, region_code, level, city_name, county_name"
-    ).execute()
-
-    cache = {}
-    for j in result.data:
-        level = j.get("level", "city")
-        # Determine display name
-        if level == "county":
-            display_name = j.get("county_name", "")
-        else:
-            display_name = j.get("city_name", "")
-
-        # Cache by city_code (for cities)
-        if j.get("city_code"):
-            cache[j["city_code"]] = (j["id"], level, display_name)
-
-        # Cache by region_code (for counties)
-        if j.get("region_code"):
-            cache[j["region_code"]] = (j["id"], level, display_name)
-
-    return cache
-
-
 def get_or_create_rate_version(effective_date: str) -> int:
     """Get existing rate_version or create new one."""
     existing = supabase.table("rate_versions").select("id").eq("effective_date", effective_date).execute()
@@ -165,8 +97,7 @@ def load_rates_from_csv(csv_path: str, verify_only: bool = False):
     """Load rates from CSV, grouping by effective date."""
     print(f"\nProcessing: {os.path.basename(csv_path)}")
 
-    # Build jurisdiction cache
-    jurisdiction_cache = build_jurisdiction_cache()
+    jurisdiction_cache = jurisdictions.mapping()
     print(f"Loaded {len(jurisdiction_cache)} jurisdictions from database")
 
     # Parse CSV and group by effective date
@@ -176,45 +107,27 @@ def load_rates_from_csv(csv_path: str, verify_only: bool = False):
     skipped_future = 0
 
     print("\nParsing CSV...")
-    with open(csv_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row_num, row in enumerate(reader, start=2):
-            try:
-                region_code = row.get('RegionCode', row.get('\ufeffRegionCode', '')).strip()
-                business_code = row.get('BusinessCode', '').strip()
-                business_name = row.get('BusinessCodesName', '').strip()
-                tax_rate = row.get('TaxRate', '0').strip()
-                rate_start = row.get('RateStartDate', '').strip()
-
-                # Parse rate
-                rate = parse_rate(tax_rate)
-
-                # Parse effective date
-                effective_date = parse_date(rate_start)
-
-                # Skip if no effective date or rate is 0
-                if not effective_date:
-                    parse_errors += 1
-                    continue
-
-                # Skip future dates (after 2026-02-04)
-                if effective_date > "2026-02-04":
-                    skipped_future += 1
-                    continue
-
-                if region_code and business_code and rate > 0:
-                    records_by_date[effective_date].append({
-                        'region_code': region_code,
-                        'business_code': business_code,
-                        'rate': rate
-                    })
-                    business_codes.add((business_code, business_name))
-
-            except Exception as e:
-                parse_errors += 1
-                if parse_errors <= 5:  # Only show first 5 errors
-                    print(f"WARNING: Error parsing row {row_num}: {e}")
-                continue
+    table = AdorColumns.from_path(csv_path)
+    if table.effective_date is None:
+        print("ERROR: CSV has no RateStartDate column")
+        return
+    for i in table.valid_indices():
+        effective_date = table.effective_date[i]
+        if not effective_date:
+            parse_errors += 1
+            continue
+
+        # Skip future dates (after 2026-02-04)
+        if effective_date > "2026-02-04":
+            skipped_future += 1
+            continue
+
+        records_by_date[effective_date].append({
+            'region_code': table.region_code[i],
+            'business_code': table.business_code[i],
+            'rate': table.rate[i]
+        })
+        business_codes.add((table.business_code[i], table.business_name[i]))
 
     print(f"\nParsed {sum(len(recs) for recs in records_by_date.values())} total records")
     print(f"Found {len(records_by_date)} unique effective dates")
@@ -258,10 +171,13 @@ def load_rates_from_csv(csv_path: str, verify_only: bool = False):
         version_id = get_or_create_rate_version(effective_date)
 
         # Get existing rates for this version to avoid duplicates
-        existing = supabase.table("rates").select("jurisdiction_id, business_code").eq(
-            "rate_version_id", version_id
-        ).execute()
-        existing_keys = {(r['jurisdiction_id'], r['business_code']) for r in existing.data}
+        if direct is not None:
+            existing_keys = set()  # the COPY merge skips existing rows itself
+        else:
+            existing = supabase.table("rates").select("jurisdiction_id, business_code").eq(
+                "rate_version_id", version_id
+            ).execute()
+            existing_keys = {(r['jurisdiction_id'], r['business_code']) for r in existing.data}
 
         # Build batch of new rates
         rates_to_insert = []
@@ -303,15 +219,15 @@ def load_rates_from_csv(csv_path: str, verify_only: bool = False):
 
         # Batch insert
         inserted = 0
-        if rates_to_insert:
-            batch_size = 500
-            for i in range(0, len(rates_to_insert), batch_size):
-                batch = rates_to_insert[i:i+batch_size]
-                try:
-                    supabase.table('rates').insert(batch).execute()
-                    inserted += len(batch)
-                except Exception as e:
-                    print(f"  ERROR: Failed to insert batch {i//batch_size + 1}: {e}")
+        if rates_to_insert and direct is not None:
+            merged = pg_copy.merge_rates(direct, rates_to_insert)
+            inserted = merged.inserted
+            skipped += merged.staged - merged.inserted
+        elif rates_to_insert:
+            inserted, _ = insert_batches(supabase, 'rates', rates_to_insert,
+                                         log=lambda msg: print(f"  {msg}"))
+        if inserted:
+            refresh_hashes(supabase, version_id)
 
         print(f"  Results: Inserted={inserted}, Skipped={skipped}, Missing={missing_jurisdiction}")
         if missing_jurisdiction_codes:
@@ -385,6 +301,7 @@ def verify_county_coverage():
 
 
 def main():
+    global direct
     verify_only = False
     csv_path = None
 
@@ -392,6 +309,8 @@ def main():
     for arg in sys.argv[1:]:
         if arg == "--verify":
             verify_only = True
+        elif arg == "--direct":
+            direct = pg_copy.connect()
         elif not csv_path:
             csv_path = arg
 
@@ -407,6 +326,7 @@ def main():
         print('  python scripts/004b_load_historical_county_rates.py --verify')
         print("\nOptions:")
         print("  --verify    Just verify county coverage, don't load data")
+        print("  --direct    Load via COPY + set-based merge over DATABASE_URL (psycopg2)")
         return
 
     # Check file exists
@@ -13,6 +13,7 @@ It does NOT create new rate_versions — it adds county rates to existing versio
 Usage:
     python scripts/005_backfill_county_rates.py
     python scripts/005_backfill_county_rates.py --dry-run
+    python scripts/005_backfill_county_rates.py --direct   # COPY + merge over DATABASE_URL
 """
 
 import csv
@@ -22,9 +23,15 @@ import sys
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.db import insert_batches
+from taxrates import pg_copy
+from taxrates.version_hashes import refresh_hashes
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -136,8 +143,8 @@ def extract_county_rates_from_csv(csv_path: str) -> List[dict]:
     return records
 
 
-def backfill_county_rates(dry_run: bool = False):
-    """Main backfill logic."""
+def backfill_county_rates(dry_run: bool = False, direct=None):
+    """Main backfill logic (``direct``: psycopg2 connection for the COPY merge)."""
     print("=" * 60)
     print("BACKFILL COUNTY RATES")
     print("=" * 60)
@@ -210,15 +217,13 @@ def backfill_county_rates(dry_run: bool = False):
 
         # Insert in batches
         inserted = 0
-        if rates_to_insert:
-            batch_size = 500
-            for i in range(0, len(rates_to_insert), batch_size):
-                batch = rates_to_insert[i:i + batch_size]
-                try:
-                    supabase.table('rates').insert(batch).execute()
-                    inserted += len(batch)
-                except Exception as e:
-                    print(f"  ERROR inserting batch: {e}")
+        if rates_to_insert and direct is not None:
+            inserted = pg_copy.merge_rates(direct, rates_to_insert).inserted
+        elif rates_to_insert:
+            inserted, _ = insert_batches(supabase, 'rates', rates_to_insert,
+                                         log=lambda msg: print(f"  {msg}"))
+        if inserted:
+            refresh_hashes(supabase, version_id)
 
         print(f"  Inserted: {inserted}")
         total_inserted += inserted
@@ -244,4 +249,5 @@ def backfill_county_rates(dry_run: bool = False):
 
 if __name__ == "__main__":
     dry_run = "--dry-run" in sys.argv
-    backfill_county_rates(dry_run=dry_run)
+    direct = pg_copy.connect() if "--direct" in sys.argv and not dry_run else None
+    backfill_county_rates(dry_run=dry_run, direct=direct)
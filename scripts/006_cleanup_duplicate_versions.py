@@ -9,47 +9,71 @@ Duplicates found:
 - v2-v5 (2025-09-30): test loads, not a real effective date -> DELETE
 - v6-v8 (2025-10-01): duplicates of v9 -> MERGE 13 unique v6 records into v9, then DELETE
 
+Pass --snapshot=<path> (see 011_snapshot_rates.py) with --dry-run to plan
+the cleanup against a local snapshot instead of Supabase — no network or
+credentials needed.
+
 Usage:
     python scripts/006_cleanup_duplicate_versions.py --dry-run
+    python scripts/006_cleanup_duplicate_versions.py --dry-run --snapshot=rates.ccrs
     python scripts/006_cleanup_duplicate_versions.py
 """
 
 import os
 import sys
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.batch_writer import BatchWriter
+from taxrates.rate_deltas import VersionStore
+from taxrates.snapshot import Snapshot
+from taxrates.version_hashes import load_hashes, refresh_hashes
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Optional[Client] = None
+snapshot: Optional[Snapshot] = None  # --snapshot: read everything from a local snapshot
+
+
+def get_all_rates(version_id: int, columns: str = "jurisdiction_id, business_code, city_rate, county_rate, state_rate",
+                  jurisdiction_ids=None) -> List[Dict]:
+    """A version's full rate set (delta versions rebuilt), optionally only some jurisdictions'."""
+    if jurisdiction_ids is not None and not jurisdiction_ids:
+        return []
+    names = [c.strip() for c in columns.split(",")]
+    if snapshot is not None:
+        wanted = None if jurisdiction_ids is None else set(jurisdiction_ids)
+        rows = [r for r in snapshot.rates_for_version(version_id) if wanted is None or r["jurisdiction_id"] in wanted]
+    else:
+        rows = VersionStore(supabase).rows(version_id, jurisdiction_ids).values()
+    return [{c: r.get(c) for c in names} for r in rows]
 
 
-def get_all_rates(version_id: int, columns: str = "jurisdiction_id, business_code, city_rate, county_rate, state_rate") -> List[Dict]:
-    """Paginate through all rates for a version."""
-    all_rates = []
-    offset = 0
-    batch = 1000
-    while True:
-        result = (
-            supabase.table("rates")
-            .select(columns)
-            .eq("rate_version_id", version_id)
-            .range(offset, offset + batch - 1)
-            .execute()
-        )
-        all_rates.extend(result.data)
-        if len(result.data) < batch:
-            break
-        offset += batch
-    return all_rates
+def get_jurisdiction(jurisdiction_id: int) -> Dict:
+    if snapshot is not None:
+        return next((j for j in snapshot.rows("jurisdictions") if j["id"] == jurisdiction_id), {})
+    j = supabase.table("jurisdictions").select("region_code, city_name, county_name, level").eq(
+        "id", jurisdiction_id).execute()
+    return j.data[0] if j.data else {}
+
+
+def get_versions() -> List[Dict]:
+    if snapshot is not None:
+        return sorted(snapshot.rows("rate_versions", ["id", "effective_date"]),
+                      key=lambda v: str(v["effective_date"]))
+    return supabase.table("rate_versions").select("id, effective_date").order("effective_date").execute().data
 
 
 def get_rate_count(version_id: int) -> int:
-    """Get exact count of rates for a version."""
+    """Get exact count of the rates stored under a version."""
+    if snapshot is not None:
+        return len(snapshot.stored_rates(version_id))
     result = (
         supabase.table("rates")
         .select("id", count="exact")
@@ -61,6 +85,8 @@ def get_rate_count(version_id: int) -> int:
 
 def delete_rates_for_version(version_id: int, dry_run: bool) -> int:
     """Delete all rates for a version, paginated. Returns count deleted."""
+    if dry_run:
+        return get_rate_count(version_id)
     total = 0
     while True:
         # Get a batch of rate IDs
@@ -75,13 +101,6 @@ def delete_rates_for_version(version_id: int, dry_run: bool) -> int:
             break
 
         ids = [r["id"] for r in result.data]
-        if dry_run:
-            total += len(ids)
-            # In dry run, we can't keep looping since nothing gets deleted
-            # Get total count instead
-            remaining = get_rate_count(version_id)
-            return remaining
-
         for i in range(0, len(ids), 100):
             batch_ids = ids[i:i + 100]
             supabase.table("rates").delete().in_("id", batch_ids).execute()
@@ -117,13 +136,12 @@ def merge_unique_rates_from_list(records: List[Dict], target_vid: int, dry_run:
         print(f"    [DRY RUN] Would insert {len(to_insert)} rates into v{target_vid}")
         return len(to_insert)
 
-    inserted = 0
-    for i in range(0, len(to_insert), 500):
-        batch = to_insert[i:i + 500]
-        supabase.table("rates").insert(batch).execute()
-        inserted += len(batch)
+    # Raises on any failed row, so the caller never deletes a source version
+    # whose rates didn't make it across
+    inserted = BatchWriter.for_table(supabase, "rates").write(to_insert).check().written
 
     print(f"    Inserted {inserted} rates into v{target_vid}")
+    refresh_hashes(supabase, target_vid)
     return inserted
 
 
@@ -162,14 +180,11 @@ def merge_unique_rates(source_vid: int, target_vid: int, dry_run: bool) -> int:
             print(f"      ... and {len(to_insert) - 5} more")
         return len(to_insert)
 
-    # Insert in batches
-    inserted = 0
-    for i in range(0, len(to_insert), 500):
-        batch = to_insert[i:i + 500]
-        supabase.table("rates").insert(batch).execute()
-        inserted += len(batch)
+    # Insert in batches (raises on any failed row, like the old sequential loop)
+    inserted = BatchWriter.for_table(supabase, "rates").write(to_insert).check().written
 
     print(f"    Merged {inserted} unique rates from v{source_vid} -> v{target_vid}")
+    refresh_hashes(supabase, target_vid)
     return inserted
 
 
@@ -181,16 +196,36 @@ def safe_check_before_delete(source_vids: List[int], target_vid: int, label: str
 
     Returns (unique_count, records_to_merge).
     Raises if any records would be lost.
+
+    With stored row hashes (taxrates/version_hashes.py) only the
+    jurisdictions whose key hashes differ between a source and the target
+    are downloaded; a source bucket with the same keys as the target's is
+    covered as a whole.
     """
-    # Get all target keys (paginated)
-    target_rates = get_all_rates(target_vid)
+    hashes = load_hashes(supabase, source_vids + [target_vid]) if snapshot is None else {}
+    drill = None  # jurisdictions to compare row by row; None = all
+    skipped_pairs = 0
+    if all(vid in hashes for vid in source_vids + [target_vid]):
+        target = hashes[target_vid]
+        drill, same = set(), set()
+        for vid in source_vids:
+            differing = set(hashes[vid].differing(target, keys_only=True))
+            drill |= differing & set(hashes[vid].buckets)
+            same |= set(hashes[vid].buckets) - differing
+        skipped_pairs = sum(target.buckets[jid][0] for jid in same - drill)
+        print(f"    Hashes: comparing {len(drill)} jurisdictions, "
+              f"{len(same - drill)} identical to v{target_vid}")
+
+    # Get target keys (paginated)
+    target_rates = get_all_rates(target_vid, jurisdiction_ids=drill)
     target_keys = {(r["jurisdiction_id"], r["business_code"]) for r in target_rates}
-    print(f"    Target v{target_vid}: {len(target_keys)} unique (jid, biz) pairs")
+    target_pairs = hashes[target_vid].rows if drill is not None else len(target_keys)
+    print(f"    Target v{target_vid}: {target_pairs} unique (jid, biz) pairs")
 
     # Collect all unique records across source versions
     all_source_keys: Dict[Tuple, Dict] = {}
     for vid in source_vids:
-        rates = get_all_rates(vid)
+        rates = get_all_rates(vid, jurisdiction_ids=drill)
         for r in rates:
             key = (r["jurisdiction_id"], r["business_code"])
             if key not in all_source_keys:
@@ -202,16 +237,15 @@ def safe_check_before_delete(source_vids: List[int], target_vid: int, label: str
         if key not in target_keys:
             missing.append(rate)
 
-    covered = len(all_source_keys) - len(missing)
-    print(f"    Source v{source_vids}: {len(all_source_keys)} unique pairs")
+    covered = len(all_source_keys) + skipped_pairs - len(missing)
+    print(f"    Source v{source_vids}: {len(all_source_keys) + skipped_pairs} unique pairs")
     print(f"    Already in target: {covered}")
     print(f"    Need to merge: {len(missing)}")
 
     if missing:
         print(f"    Records to merge into v{target_vid}:")
         for r in missing[:10]:
-            j = supabase.table("jurisdictions").select("region_code, city_name, county_name, level").eq("id", r["jurisdiction_id"]).execute()
-            jinfo = j.data[0] if j.data else {}
+            jinfo = get_jurisdiction(r["jurisdiction_id"])
             name = jinfo.get("city_name") or jinfo.get("county_name", "?")
             print(f"      jid={r['jurisdiction_id']} ({jinfo.get('region_code', '?')}/{name}/{jinfo.get('level', '?')}) biz={r['business_code']} city={r['city_rate']} county={r['county_rate']}")
         if len(missing) > 10:
@@ -283,15 +317,10 @@ def cleanup(dry_run: bool):
 
     # Step 4: Verify — check for any remaining duplicate effective dates
     print("\n--- Verification ---")
-    versions = (
-        supabase.table("rate_versions")
-        .select("id, effective_date")
-        .order("effective_date")
-        .execute()
-    )
+    versions = get_versions()
 
     from collections import Counter
-    date_counts = Counter(v["effective_date"] for v in versions.data)
+    date_counts = Counter(v["effective_date"] for v in versions)
     dupes = {d: c for d, c in date_counts.items() if c > 1}
 
     if dupes:
@@ -303,8 +332,8 @@ def cleanup(dry_run: bool):
 
     # Show final rate counts for 2025-10 period
     print("\n    Rate counts for recent versions:")
-    for v in versions.data:
-        if v["effective_date"] >= "2025-08-01":
+    for v in versions:
+        if str(v["effective_date"]) >= "2025-08-01":
             count = get_rate_count(v["id"])
             print(f"      v{v['id']:>3}  {v['effective_date']}  -> {count:>5} rates")
 
@@ -313,6 +342,24 @@ def cleanup(dry_run: bool):
     print("=" * 60)
 
 
-if __name__ == "__main__":
+def main():
+    global supabase, snapshot
     dry_run = "--dry-run" in sys.argv
+    snapshot_path = next((a.split("=", 1)[1] for a in sys.argv[1:]
+                          if a.startswith("--snapshot=")), None)
+    if snapshot_path:
+        if not dry_run:
+            print("ERROR: --snapshot is read-only; use it with --dry-run.")
+            sys.exit(1)
+        if not os.path.isfile(snapshot_path):
+            print(f"ERROR: Snapshot not found: {snapshot_path}")
+            sys.exit(1)
+        snapshot = Snapshot.open(snapshot_path)
+        print(f"Source: snapshot {snapshot_path} ({snapshot.header['created_at'][:19]})")
+    else:
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
     cleanup(dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,29 @@ Usage:
     python scripts/007_sync_stripe_tax_rates.py              # Check & sync now
     python scripts/007_sync_stripe_tax_rates.py --dry-run     # Preview changes without applying
     python scripts/007_sync_stripe_tax_rates.py --force       # Force update even if rates unchanged
+    python scripts/007_sync_stripe_tax_rates.py --per-customer [--dry-run]
+                                                              # Tax each subscription by its customer's jurisdiction
 
 Requires STRIPE_SECRET_KEY in .env (or environment variable).
+
+Our Stripe tax rates are listed once per run into a TaxRateIndex
+(taxrates/stripe_rates.py). Set STRIPE_TAX_RATE_CACHE to a JSON file path to
+persist it between runs; cached entries are checked by object id before use.
+
+Subscriptions are updated concurrently (STRIPE_WORKERS threads, at most
+STRIPE_RATE_LIMIT requests/s) with idempotency keys, and progress is
+checkpointed to SUBSCRIPTION_CHECKPOINT: an interrupted sync picks up where
+it stopped when re-run (taxrates/stripe_subscriptions.py).
+
+--per-customer taxes each subscription where its customer is instead of at
+our Peoria address: subscriptions are grouped by the customer's (city,
+county, business code) — from cactuscomply_region_code /
+cactuscomply_business_code metadata or the customer's Arizona address (its
+ZIP through ZIP_JURISDICTION_PATH when set, else its city name) —
+each group's rate is looked up once in the combined rate matrix
+(RATE_MATRIX_PATH while it matches the rates, else built from Supabase), and every distinct combined
+percentage gets one Stripe tax rate (taxrates/customer_tax.py). Customers
+that can't be resolved are listed and left untouched.
 """
 
 import json
@@ -25,9 +46,20 @@ import sys
 from datetime import date, datetime
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.customer_tax import CustomerTaxResolver
+from taxrates.db import fetch_all
+from taxrates.jurisdictions import JURISDICTION_COLUMNS
+from taxrates.rate_deltas import VersionStore
+from taxrates.rate_matrix import RateMatrix, current_rate_matrix
+from taxrates.stripe_rates import TaxRateIndex
+from taxrates.stripe_subscriptions import SubscriptionUpdater
+from taxrates.zip_index import ZipIndex
+
 load_dotenv()
 
 # --- Config ---
@@ -35,6 +67,9 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_TAX_RATE_CACHE = os.getenv("STRIPE_TAX_RATE_CACHE") or None
+RATE_MATRIX_PATH = os.getenv("RATE_MATRIX_PATH") or None
+ZIP_JURISDICTION_PATH = os.getenv("ZIP_JURISDICTION_PATH") or None
 
 # CactusComply business address: 8427 W Salter Dr, Peoria, AZ 85382
 PEORIA_JURISDICTION_ID = 198       # PE - Peoria (city)
@@ -51,6 +86,9 @@ CACTUSCOMPLY_PRODUCT_IDS = [
 # File to track last-synced rates (stored alongside this script)
 STATE_FILE = Path(__file__).parent / ".stripe_tax_sync_state.json"
 
+# Progress of the subscription update, removed once a run finishes cleanly
+SUBSCRIPTION_CHECKPOINT = Path(__file__).parent / ".stripe_subscription_checkpoint.jsonl"
+
 # --- Helpers ---
 
 def get_supabase() -> Client:
@@ -111,41 +149,30 @@ def get_current_version(sb: Client) -> dict:
 
 
 def fetch_current_rates(sb: Client) -> dict:
-    """Fetch Peoria (214) + Maricopa County (014) rates from the live version."""
+    """Fetch Peoria (214) + Maricopa County (014) rates from the live version.
+
+    Delta-stored versions only hold changed rows, so each pair is read
+    through the version's chain (VersionStore.rate_for).
+    """
     version = get_current_version(sb)
     vid, eff = version["id"], version["effective_date"]
+    store = VersionStore(sb)
     rates = {}
 
-    peoria = (
-        sb.table("rates")
-        .select("city_rate, county_rate")
-        .eq("rate_version_id", vid)
-        .eq("jurisdiction_id", PEORIA_JURISDICTION_ID)
-        .eq("business_code", PEORIA_BUSINESS_CODE)
-        .limit(1)
-        .execute()
-    )
-    if peoria.data:
+    peoria = store.rate_for(vid, PEORIA_JURISDICTION_ID, PEORIA_BUSINESS_CODE)
+    if peoria:
         rates["peoria"] = {
-            "rate": float(peoria.data[0]["city_rate"]),
+            "rate": float(peoria["city_rate"]),
             "effective_date": eff,
             "jurisdiction": "Peoria",
             "business_code": PEORIA_BUSINESS_CODE,
             "description": "Rental, Leasing and Licensing for Use of TPP",
         }
 
-    maricopa = (
-        sb.table("rates")
-        .select("city_rate, county_rate")
-        .eq("rate_version_id", vid)
-        .eq("jurisdiction_id", MARICOPA_JURISDICTION_ID)
-        .eq("business_code", MARICOPA_BUSINESS_CODE)
-        .limit(1)
-        .execute()
-    )
-    if maricopa.data:
+    maricopa = store.rate_for(vid, MARICOPA_JURISDICTION_ID, MARICOPA_BUSINESS_CODE)
+    if maricopa:
         rates["maricopa"] = {
-            "rate": float(maricopa.data[0]["county_rate"]),
+            "rate": float(maricopa["county_rate"]),
             "effective_date": eff,
             "description": "Personal Property Rental",
             "jurisdiction": "Maricopa County",
@@ -167,33 +194,35 @@ def rates_changed(current: dict, previous: dict) -> bool:
     return False
 
 
-def find_or_create_tax_rate(stripe, display_name: str, percentage: float, jurisdiction: str, metadata: dict) -> str:
+def find_or_create_tax_rate(stripe, index: TaxRateIndex, display_name: str, percentage: float,
+                            jurisdiction: str, metadata: dict) -> str:
     """Find existing Stripe tax rate matching our metadata, or create a new one.
 
     Stripe tax rates are immutable — if rate changes, we create a new one and
-    archive the old. We match on metadata['cactuscomply_key'] to find ours.
+    archive the old. We match on metadata['cactuscomply_key'] to find ours,
+    through ``index`` (one listing pass per run).
     """
     cc_key = metadata.get("cactuscomply_key", "")
 
-    # Search existing active tax rates
-    tax_rates = stripe.TaxRate.list(active=True, limit=100)
-    for tr in tax_rates.auto_paging_iter():
-        if tr.metadata.get("cactuscomply_key") == cc_key:
-            # Found our rate — check if percentage matches
-            if float(tr.percentage) == round(percentage * 100, 4):
-                print(f"  [OK] Existing Stripe tax rate {tr.id} matches ({tr.percentage}%)")
-                return tr.id
-            else:
-                # Rate changed — archive old one
-                print(f"  -> Archiving old tax rate {tr.id} ({tr.percentage}%)")
-                stripe.TaxRate.modify(tr.id, active=False)
-                break
+    existing = index.get(cc_key)
+    if existing:
+        # Found our rate — check if percentage matches
+        if existing["percentage"] == round(percentage * 100, 4):
+            print(f"  [OK] Existing Stripe tax rate {existing['id']} matches ({existing['percentage']}%)")
+            return existing["id"]
+        # Rate changed — archive old one
+        print(f"  -> Archiving old tax rate {existing['id']} ({existing['percentage']}%)")
+        stripe.TaxRate.modify(existing["id"], active=False)
+        index.drop(cc_key)
 
     # Create new tax rate
     pct = round(percentage * 100, 4)  # Convert decimal to percentage (0.018 -> 1.8)
+    description = f"AZ TPT - {jurisdiction}"
+    if metadata.get("business_code"):
+        description += f" ({metadata['business_code']})"
     tr = stripe.TaxRate.create(
         display_name=display_name,
-        description=f"AZ TPT - {jurisdiction} ({metadata.get('business_code', '')})",
+        description=description,
         percentage=pct,
         inclusive=False,
         jurisdiction="AZ",
@@ -201,6 +230,7 @@ def find_or_create_tax_rate(stripe, display_name: str, percentage: float, jurisd
         metadata=metadata,
     )
     print(f"  [OK] Created new Stripe tax rate {tr.id} ({pct}%)")
+    index.put(cc_key, tr)
     return tr.id
 
 
@@ -220,38 +250,121 @@ def update_product_metadata(stripe, tax_rate_ids: list, dry_run: bool = False):
             print(f"  ERROR: Could not update product {pid}: {e}")
 
 
-def update_all_subscriptions(stripe, tax_rate_ids: list, dry_run: bool = False):
-    """Update active CactusComply subscriptions to use the given tax rates."""
-    updated = 0
-    skipped = 0
-    ignored = 0
-
-    subs = stripe.Subscription.list(status="active", limit=100)
-    for sub in subs.auto_paging_iter():
-        # Only update subscriptions for CactusComply products
-        sub_product_ids = {item.price.product for item in sub["items"]["data"]}
-        if not sub_product_ids.intersection(CACTUSCOMPLY_PRODUCT_IDS):
-            ignored += 1
-            continue
-
-        current_rate_ids = [tr.id for tr in (sub.default_tax_rates or [])]
-        if set(current_rate_ids) == set(tax_rate_ids):
-            skipped += 1
-            continue
+def update_all_subscriptions(stripe, tax_rate_ids: list, dry_run: bool = False) -> bool:
+    """Update active CactusComply subscriptions to use the given tax rates.
 
-        if dry_run:
-            print(f"  [DRY RUN] Would update subscription {sub.id}")
-            updated += 1
-            continue
-
-        stripe.Subscription.modify(sub.id, default_tax_rates=tax_rate_ids)
-        updated += 1
+    Returns False if any subscription could not be updated (re-run to resume).
+    """
+    updater = SubscriptionUpdater(stripe, CACTUSCOMPLY_PRODUCT_IDS, tax_rate_ids,
+                                  checkpoint_path=str(SUBSCRIPTION_CHECKPOINT))
+    return report_subscriptions(updater.run(dry_run=dry_run))
+
+
+def report_subscriptions(result) -> bool:
+    """Print an UpdateResult; False if any subscription failed."""
+    print(f"\n  CactusComply subscriptions updated: {result.updated}")
+    if result.resumed:
+        print(f"  Updated by the interrupted previous run: {result.resumed}")
+    if result.skipped:
+        print(f"  Already correct: {result.skipped}")
+    if result.ignored:
+        print(f"  Non-CactusComply subscriptions skipped: {result.ignored}")
+    if result.unresolved:
+        print(f"  WARNING: {result.unresolved} subscriptions left alone (customer jurisdiction not resolved)")
+    if result.failed:
+        print(f"  ERROR: {len(result.failed)} subscriptions failed (re-run to resume):")
+        for sub_id, error in result.failed[:10]:
+            print(f"    {sub_id}: {error}")
+    return not result.failed
+
+
+def load_rate_matrix(sb: Client) -> RateMatrix:
+    """The combined rate matrix from RATE_MATRIX_PATH while it matches the rates, else from Supabase."""
+    return current_rate_matrix(sb, RATE_MATRIX_PATH)
+
+
+def customer_of(stripe, sub, cache: dict):
+    """The subscription's customer (expanded by the listing, else retrieved once per id)."""
+    customer = sub.customer
+    if not isinstance(customer, str):
+        return customer
+    if customer not in cache:
+        cache[customer] = stripe.Customer.retrieve(customer)
+    return cache[customer]
+
+
+def sync_per_customer(dry_run: bool = False) -> bool:
+    """Tax every subscription by its customer's jurisdiction (one Stripe rate per percentage)."""
+    print("\n1. Loading jurisdictions and the combined rate matrix...")
+    sb = get_supabase()
+    jurisdictions = fetch_all(sb, "jurisdictions", JURISDICTION_COLUMNS)
+    zip_index = ZipIndex.load(ZIP_JURISDICTION_PATH, jurisdictions) if ZIP_JURISDICTION_PATH else None
+    if zip_index is not None:
+        print(f"  ZIP index: {len(zip_index)} ZIPs, {len(zip_index.starts)} ZIP+4 ranges")
+    resolver = CustomerTaxResolver(jurisdictions, load_rate_matrix(sb), PEORIA_BUSINESS_CODE,
+                                   zip_index=zip_index)
+    version = resolver.version()
+    if version is None:
+        print(f"ERROR: no rate_version in force on {resolver.on_date}")
+        sys.exit(1)
+    print(f"  Rates as of version {version[0]} (effective {version[1]})")
 
-    print(f"\n  CactusComply subscriptions updated: {updated}")
-    if skipped:
-        print(f"  Already correct: {skipped}")
-    if ignored:
-        print(f"  Non-CactusComply subscriptions skipped: {ignored}")
+    stripe = get_stripe()
+    index = TaxRateIndex(stripe, cache_path=STRIPE_TAX_RATE_CACHE)
+    by_percentage = {}   # percentage -> Stripe tax rate id
+    members = {}         # TaxGroup -> subscriptions assigned to it
+    unresolved = []
+    customers = {}
+
+    def tax_rate_for(group_rate) -> str:
+        pct = group_rate.percentage
+        if pct not in by_percentage:
+            key = f"az_tpt_{pct:g}"
+            existing = index.get(key)
+            if dry_run and not existing:
+                print(f"  [DRY RUN] Would create Stripe tax rate {key} ({pct}%)")
+                by_percentage[pct] = f"<new {key}>"
+            else:
+                by_percentage[pct] = find_or_create_tax_rate(
+                    stripe,
+                    index,
+                    display_name="AZ TPT",
+                    percentage=group_rate.rate,
+                    jurisdiction="city + county",
+                    metadata={
+                        "cactuscomply_key": key,
+                        "combined_rate": str(group_rate.rate),
+                        "effective_date": group_rate.effective_date,
+                    },
+                )
+        return by_percentage[pct]
+
+    def assign(sub):
+        customer = customer_of(stripe, sub, customers)
+        group = resolver.group_for(customer, sub.metadata)
+        group_rate = resolver.rate_for(group) if group else None
+        if group_rate is None:
+            unresolved.append((sub.id, getattr(customer, "id", customer), group))
+            return None
+        members[group] = members.get(group, 0) + 1
+        return [tax_rate_for(group_rate)]
+
+    print("\n2. Assigning tax rates to active CactusComply subscriptions...")
+    updater = SubscriptionUpdater(stripe, CACTUSCOMPLY_PRODUCT_IDS, [],
+                                  checkpoint_path=str(SUBSCRIPTION_CHECKPOINT),
+                                  assign=assign, target=f"per-customer:{version[0]}",
+                                  list_params={"expand": ["data.customer"]})
+    complete = report_subscriptions(updater.run(dry_run=dry_run))
+
+    print(f"\n3. Jurisdiction groups ({len(members)}), {len(by_percentage)} distinct Stripe tax rates:")
+    for group, count in sorted(members.items(), key=lambda item: -item[1]):
+        print(f"  {resolver.label(group):<45} {resolver.rate_for(group).percentage:>7}%  "
+              f"{count} subscriptions")
+    for sub_id, customer_id, group in unresolved[:20]:
+        reason = f"no rate for {resolver.label(group)}" if group else "no Arizona jurisdiction"
+        print(f"  UNRESOLVED {sub_id} (customer {customer_id}): {reason}")
+    print(f"  (Stripe tax rate listings this run: {index.listings})")
+    return complete
 
 
 # --- Main ---
@@ -264,6 +377,16 @@ def run_stripe_sync(dry_run: bool = False, force: bool = False):
 def main():
     dry_run = "--dry-run" in sys.argv
     force = "--force" in sys.argv
+    if "--per-customer" in sys.argv:
+        print("=" * 60)
+        print("CactusComply -> Stripe Tax Rate Sync (per customer)")
+        print(f"Run time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if dry_run:
+            print("MODE: DRY RUN (no changes will be made)")
+        print("=" * 60)
+        if not sync_per_customer(dry_run=dry_run):
+            sys.exit(1)
+        return
     _sync(dry_run=dry_run, force=force)
 
 
@@ -316,9 +439,11 @@ def _sync(dry_run: bool = False, force: bool = False):
     # 3. Create/update Stripe tax rates
     print("\n3. Syncing Stripe tax rates...")
     stripe = get_stripe()
+    index = TaxRateIndex(stripe, cache_path=STRIPE_TAX_RATE_CACHE)
 
     peoria_tr_id = find_or_create_tax_rate(
         stripe,
+        index,
         display_name="AZ TPT - Peoria",
         percentage=peoria["rate"],
         jurisdiction="Peoria",
@@ -332,6 +457,7 @@ def _sync(dry_run: bool = False, force: bool = False):
 
     maricopa_tr_id = find_or_create_tax_rate(
         stripe,
+        index,
         display_name="AZ TPT - Maricopa County",
         percentage=maricopa["rate"],
         jurisdiction="Maricopa County",
@@ -344,6 +470,7 @@ def _sync(dry_run: bool = False, force: bool = False):
     )
 
     tax_rate_ids = [peoria_tr_id, maricopa_tr_id]
+    print(f"  (Stripe tax rate listings this run: {index.listings})")
 
     # 4. Update CactusComply product metadata
     print("\n4. Updating CactusComply product metadata...")
@@ -351,10 +478,12 @@ def _sync(dry_run: bool = False, force: bool = False):
 
     # 5. Update active CactusComply subscriptions
     print("\n5. Updating active CactusComply subscriptions...")
-    update_all_subscriptions(stripe, tax_rate_ids, dry_run=dry_run)
+    complete = update_all_subscriptions(stripe, tax_rate_ids, dry_run=dry_run)
 
-    # 6. Save state
-    if not dry_run:
+    # 6. Save state (only once every subscription is done, so a re-run retries the rest)
+    if not complete:
+        print("\n  State not saved: some subscriptions still need the new tax rates.")
+    elif not dry_run:
         save_state({
             "rates": current_rates,
             "stripe_tax_rate_ids": {
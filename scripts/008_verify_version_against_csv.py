@@ -8,10 +8,16 @@ in place (only city_rate / county_rate; total_rate is generated).
 
 Default is a dry run — writes nothing unless --apply is passed.
 
+When the version has stored row hashes (taxrates/version_hashes.py), the CSV
+is hashed the same way and only jurisdictions whose buckets differ are
+downloaded and compared. Pass --full to compare every stored row anyway
+(e.g. after rows were edited outside these scripts).
+
 Usage:
     python scripts/008_verify_version_against_csv.py <version_id> <csv_path>
     python scripts/008_verify_version_against_csv.py 115 "C:/Users/noson/Downloads/TPT_RATETABLE_ALL_04012026.csv"
     python scripts/008_verify_version_against_csv.py 115 "...04012026.csv" --apply
+    python scripts/008_verify_version_against_csv.py 115 "...04012026.csv" --full
 """
 
 import csv
@@ -19,14 +25,24 @@ import os
 import sys
 from typing import Dict, List, Tuple
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.db import fetch_all
+from taxrates.jurisdictions import JurisdictionResolver
+from taxrates.rate_deltas import VersionStore
+from taxrates.version_hashes import VersionHashes, load_hashes, refresh_hashes
+
 load_dotenv()
 
 supabase: Client = create_client(
     os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
 
+# Region code -> (id, level, name); county records win on code clashes
+jurisdictions = JurisdictionResolver.for_client(supabase)
+
 
 def parse_rate(rate_str: str) -> float:
     """Identical to 004_add_monthly_rates.parse_rate (the fixed version)."""
@@ -39,33 +55,12 @@ def parse_rate(rate_str: str) -> float:
         return 0.0
 
 
-def build_jurisdiction_cache() -> Dict[str, Tuple[int, str, str]]:
-    """Copy of 004's build_jurisdiction_cache — county records win on code clashes."""
-    result = supabase.table("jurisdictions").select(
-        "id, city_code, region_code, level, city_name, county_name").execute()
-    candidates: Dict[str, List[Tuple[int, str, str]]] = {}
-    for j in result.data:
-        level = j.get("level", "city")
-        name = j.get("county_name", "") if level == "county" else j.get("city_name", "")
-        entry = (j["id"], level, name)
-        for code in [j.get("city_code"), j.get("region_code")]:
-            if code:
-                candidates.setdefault(code, []).append(entry)
-    cache = {}
-    for code, entries in candidates.items():
-        if len(entries) == 1:
-            cache[code] = entries[0]
-        else:
-            county = [e for e in entries if e[1] == "county"]
-            cache[code] = county[0] if county else entries[0]
-    return cache
-
-
 def main():
     args = [a for a in sys.argv[1:] if not a.startswith("--")]
     apply = "--apply" in sys.argv
+    full = "--full" in sys.argv
     if len(args) < 2:
-        print("Usage: python scripts/008_verify_version_against_csv.py <version_id> <csv_path> [--apply]")
+        print("Usage: python scripts/008_verify_version_against_csv.py <version_id> <csv_path> [--apply] [--full]")
         return
 
     version_id = int(args[0])
@@ -79,10 +74,11 @@ def main():
     print(f"MODE: {'APPLY (will write)' if apply else 'DRY RUN (read only)'}")
     print("=" * 64)
 
-    cache = build_jurisdiction_cache()
+    cache = jurisdictions.mapping()
 
     # Correct rates from the CSV, keyed (jurisdiction_id, business_code)
     csv_rates: Dict[Tuple[int, str], float] = {}
+    csv_levels: Dict[int, str] = {}
     for row in csv.DictReader(open(csv_path, 'r', encoding='utf-8-sig')):
         region = (row.get('RegionCode') or '').strip()
         bcode = (row.get('BusinessCode') or '').strip()
@@ -92,20 +88,29 @@ def main():
         lookup = cache.get(region)
         if lookup:
             csv_rates[(lookup[0], bcode)] = rate
+            csv_levels[lookup[0]] = lookup[1]
+
+    # Only jurisdictions whose stored hashes differ from the CSV's need reading.
+    # Hashes cover the resolved rate set, which is the stored rows only for a full version.
+    filters = {}
+    hashes = None if full else load_hashes(supabase, [version_id]).get(version_id)
+    if hashes is not None and VersionStore(supabase).versions().get(version_id, {}).get('storage') != 'delta':
+        expected = VersionHashes.from_rows(
+            {"jurisdiction_id": jid, "business_code": bcode, "state_rate": 0.0,
+             "county_rate": rate if csv_levels[jid] == 'county' else 0.0,
+             "city_rate": 0.0 if csv_levels[jid] == 'county' else rate}
+            for (jid, bcode), rate in csv_rates.items())
+        filters["jurisdiction_id"] = hashes.differing(expected)
+        print(f"Row hashes: {len(filters['jurisdiction_id'])} of {len(hashes.buckets)} "
+              f"jurisdictions differ from the CSV")
 
     # Stored rows for the version
     stored: List[dict] = []
-    start, page = 0, 1000
-    while True:
-        res = supabase.table("rates").select(
-            "id, jurisdiction_id, business_code, city_rate, county_rate"
-        ).eq("rate_version_id", version_id).order("id").range(
-            start, start + page - 1).execute()
-        stored.extend(res.data)
-        if len(res.data) < page:
-            break
-        start += page
-    print(f"Stored rows: {len(stored)}   CSV resolved rates: {len(csv_rates)}\n")
+    if filters.get("jurisdiction_id", True):
+        stored = fetch_all(supabase, "rates", "id, jurisdiction_id, business_code, city_rate, county_rate",
+                           rate_version_id=version_id, **filters)
+    stored_label = f"{len(stored)} read of {hashes.rows}" if filters else str(len(stored))
+    print(f"Stored rows: {stored_label}   CSV resolved rates: {len(csv_rates)}\n")
 
     juris = {j["id"]: j for j in supabase.table("jurisdictions").select(
         "id, city_name, county_name, level").execute().data}
@@ -166,6 +171,7 @@ def main():
         if fixed % 100 == 0:
             print(f"  ...{fixed}/{len(mismatches)}")
     print(f"Done — {fixed} rows corrected in rate_version {version_id}.")
+    refresh_hashes(supabase, version_id)
 
 
 if __name__ == "__main__":
@@ -7,27 +7,45 @@ pair and deletes the rest.
 
 Safety: if any duplicate group has DIFFERING rate values, that group is NOT
 touched and is reported — dedup only proceeds where the extra rows are proven
-redundant. Default is a dry run; pass --apply to delete.
+redundant. Default is a dry run; pass --apply to delete. A dry run can read
+from a local snapshot (011_snapshot_rates.py) with --snapshot=<path>.
+
+--server runs the same grouping, conflict check and delete inside the
+database (the dedup_version_rates function, docs/server-side-dedup.md):
+one round trip per run however large the version, and --all sweeps every
+version at once.
 
 Usage:
     python scripts/009_dedup_version_rows.py <version_id>
+    python scripts/009_dedup_version_rows.py 10 --snapshot=rates.ccrs
     python scripts/009_dedup_version_rows.py 10 --apply
+    python scripts/009_dedup_version_rows.py 10 --server [--apply]
+    python scripts/009_dedup_version_rows.py --all --server [--apply]
 """
 
 import os
 import sys
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates.dedup import dedup_on_server
+from taxrates.snapshot import Snapshot
+from taxrates.version_hashes import refresh_hashes
+
 load_dotenv()
 
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
+supabase: Optional[Client] = None
+snapshot: Optional[Snapshot] = None
 
 
 def fetch_all(version_id: int) -> List[dict]:
+    """The rows stored under the version (a delta version's own rows, not its rebuilt set)."""
+    if snapshot is not None:
+        return snapshot.stored_rates(version_id)
     rows: List[dict] = []
     start, page = 0, 1000
     while True:
@@ -42,13 +60,66 @@ def fetch_all(version_id: int) -> List[dict]:
     return rows
 
 
+def dedup_server(version_id: Optional[int], apply: bool):
+    """--server: one RPC does the grouping / conflict check / delete; print its report."""
+    scope = f"rate_version {version_id}" if version_id is not None else "ALL rate_versions"
+    print("=" * 60)
+    print(f"DEDUP {scope} (server-side)   MODE: {'APPLY' if apply else 'DRY RUN'}")
+    print("=" * 60)
+
+    report = dedup_on_server(supabase, version_id, apply)
+    for v in report.versions:
+        print(f"  v{v['rate_version_id']:>4}: {v['rows']} rows, {v['duplicates']} duplicates, "
+              f"{v['conflict_groups']} conflict groups")
+    for c in report.conflicts:
+        print(f"  CONFLICT (left untouched): v{c['rate_version_id']} juris={c['jurisdiction_id']} "
+              f"code={c['business_code']} -> {c['rows']} rows with {c['rate_sets']} distinct rate sets")
+
+    print(f"\nDuplicate rows{' deleted' if report.applied else ' to delete'}: "
+          f"{report.deleted if report.applied else report.duplicates}")
+    print(f"Conflict groups skipped : {len(report.conflicts)}")
+    if not report.duplicates:
+        print("\nNothing to dedup.")
+    elif not apply:
+        print("\nDRY RUN — re-run with --apply to delete.")
+    for changed in report.changed_versions():
+        refresh_hashes(supabase, changed)
+
+
 def main():
+    global supabase, snapshot
     args = [a for a in sys.argv[1:] if not a.startswith("--")]
     apply = "--apply" in sys.argv
-    if not args:
-        print("Usage: python scripts/009_dedup_version_rows.py <version_id> [--apply]")
+    server = "--server" in sys.argv
+    sweep = "--all" in sys.argv
+    snapshot_path = next((a.split("=", 1)[1] for a in sys.argv[1:]
+                          if a.startswith("--snapshot=")), None)
+    if not args and not sweep:
+        print("Usage: python scripts/009_dedup_version_rows.py <version_id> "
+              "[--apply | --snapshot=<path>] [--server]\n"
+              "       python scripts/009_dedup_version_rows.py --all --server [--apply]")
+        return
+    if snapshot_path and apply:
+        print("ERROR: --apply deletes live rows; run it against Supabase, not a snapshot.")
+        return
+    if snapshot_path and server:
+        print("ERROR: --server runs in the database; it can't read a snapshot.")
+        return
+    if sweep and not server:
+        print("ERROR: --all is only supported with --server.")
+        return
+    if server:
+        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
+        dedup_server(None if sweep else int(args[0]), apply)
         return
     version_id = int(args[0])
+    if snapshot_path:
+        if not os.path.isfile(snapshot_path):
+            print(f"ERROR: Snapshot not found: {snapshot_path}")
+            sys.exit(1)
+        snapshot = Snapshot.open(snapshot_path)
+    else:
+        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
 
     print("=" * 60)
     print(f"DEDUP rate_version {version_id}   "
@@ -99,6 +170,7 @@ def main():
         deleted += len(batch)
         print(f"  ...{deleted}/{len(delete_ids)}")
     print(f"Done — {deleted} duplicate rows removed from rate_version {version_id}.")
+    refresh_hashes(supabase, version_id)
 
 
 if __name__ == "__main__":
@@ -10,47 +10,112 @@ No legitimate AZ TPT rate approaches 20%, so any stored rate above the
 threshold (default 0.20) is certainly the bug and is divided by 100.
 Default is a dry run; pass --apply to write.
 
+--all sweeps every rate_version in one pass and reports per-version counts.
+With --direct (DATABASE_URL, see taxrates/pg_copy.py) the fix is a single
+set-based UPDATE instead of one PostgREST request per row.
+
 Usage:
     python scripts/010_fix_high_rate_100x.py <version_id>
     python scripts/010_fix_high_rate_100x.py 112 --apply
     python scripts/010_fix_high_rate_100x.py 9 --apply --threshold 0.20
+    python scripts/010_fix_high_rate_100x.py --all --direct --apply
 """
 
 import os
 import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from taxrates import pg_copy
+from taxrates.db import PAGE_SIZE
+from taxrates.version_hashes import refresh_hashes
+
 load_dotenv()
 
 supabase: Client = create_client(
     os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
 
 
+def fetch_high_rows(version_id: Optional[int], threshold: float) -> List[dict]:
+    """Rows above the threshold in one version (or all, paged)."""
+    rows: List[dict] = []
+    start = 0
+    while True:
+        query = supabase.table("rates").select(
+            "id, rate_version_id, jurisdiction_id, business_code, state_rate, "
+            "county_rate, city_rate, total_rate"
+        ).gt("total_rate", threshold)
+        if version_id is not None:
+            query = query.eq("rate_version_id", version_id)
+        res = query.order("id").range(start, start + PAGE_SIZE - 1).execute()
+        rows.extend(res.data)
+        if len(res.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def print_counts(counts: Dict[int, int], verb: str):
+    for vid in sorted(counts):
+        print(f"  v{vid:>4}: {counts[vid]} rows {verb}")
+    print(f"  {sum(counts.values())} rows in {len(counts)} versions")
+
+
+def fix_direct(version_id: Optional[int], threshold: float, apply: bool):
+    """--direct: count, or fix, every affected row in one set-based statement."""
+    started = time.monotonic()
+    conn = pg_copy.connect()
+    try:
+        counts = pg_copy.scale_high_rates(conn, threshold, version_id, apply=apply)
+    finally:
+        conn.close()
+    print_counts(counts, "corrected" if apply else "above threshold (will be /100)")
+    print(f"  ({time.monotonic() - started:.1f}s)")
+    if not counts:
+        print("\nNothing to fix.")
+    elif not apply:
+        print("\nDRY RUN — re-run with --apply to fix.")
+    else:
+        for vid in counts:
+            refresh_hashes(supabase, vid)
+
+
 def main():
     args = [a for a in sys.argv[1:] if not a.startswith("--")]
     apply = "--apply" in sys.argv
+    sweep = "--all" in sys.argv
+    direct = "--direct" in sys.argv
     threshold = 0.20
     if "--threshold" in sys.argv:
         threshold = float(sys.argv[sys.argv.index("--threshold") + 1])
-    if not args:
+        args = [a for a in args if a != sys.argv[sys.argv.index("--threshold") + 1]]
+    if not args and not sweep:
         print("Usage: python scripts/010_fix_high_rate_100x.py <version_id> "
-              "[--apply] [--threshold 0.20]")
+              "[--apply] [--threshold 0.20] [--direct]\n"
+              "       python scripts/010_fix_high_rate_100x.py --all [--direct] [--apply]")
         return
-    version_id = int(args[0])
+    version_id = None if sweep else int(args[0])
 
     print("=" * 60)
-    print(f"FIX 100x rows  version {version_id}  threshold>{threshold}  "
-          f"MODE: {'APPLY' if apply else 'DRY RUN'}")
+    print(f"FIX 100x rows  {'ALL versions' if sweep else f'version {version_id}'}  "
+          f"threshold>{threshold}  MODE: {'APPLY' if apply else 'DRY RUN'}"
+          f"{' (direct)' if direct else ''}")
     print("=" * 60)
 
-    rows = supabase.table("rates").select(
-        "id, jurisdiction_id, business_code, state_rate, county_rate, "
-        "city_rate, total_rate"
-    ).eq("rate_version_id", version_id).gt("total_rate", threshold).execute().data
+    if direct:
+        fix_direct(version_id, threshold, apply)
+        return
+
+    rows = fetch_high_rows(version_id, threshold)
 
     print(f"Rows above threshold (will be /100): {len(rows)}")
+    if sweep:
+        print_counts(Counter(r["rate_version_id"] for r in rows), "above threshold")
     if not rows:
         print("\nNothing to fix.")
         return
@@ -77,7 +142,13 @@ def main():
             "city_rate": round(float(r["city_rate"] or 0) / 100, 6),
         }).eq("id", r["id"]).execute()
         fixed += 1
-    print(f"Done — {fixed} rows corrected in rate_version {version_id}.")
+    if sweep:
+        print(f"Done — {fixed} rows corrected.")
+        print_counts(Counter(r["rate_version_id"] for r in rows), "corrected")
+    else:
+        print(f"Done — {fixed} rows corrected in rate_version {version_id}.")
+    for vid in sorted({r["rate_version_id"] for r in rows}):
+        refresh_hashes(supabase, vid)
 
 
 if __name__ == "__main__":
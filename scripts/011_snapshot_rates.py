@@ -0,0 +1,94 @@
+"""
+Export / import a local columnar snapshot of the rates database.
+
+The snapshot holds jurisdictions, business_class_codes, rate_versions and
+rates as memory-mappable typed arrays plus a shared string table (see
+taxrates/snapshot.py). Analysis scripts accept --snapshot=<path> so they can
+run offline against it instead of paging Supabase 1,000 rows at a time.
+
+Usage:
+    python scripts/011_snapshot_rates.py export rates.ccrs
+    python scripts/011_snapshot_rates.py info rates.ccrs
+    python scripts/011_snapshot_rates.py import rates.ccrs [--tables=jurisdictions,rates] [--apply]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+from taxrates.snapshot import TABLES, Snapshot, export_snapshot, import_snapshot
+
+load_dotenv()
+
+
+def get_client():
+    return create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
+
+
+def cmd_export(path: str):
+    print(f"Exporting Supabase -> {path}")
+    started = time.monotonic()
+    counts = export_snapshot(get_client(), path)
+    size = os.path.getsize(path)
+    print(f"Done — {sum(counts.values())} rows, {size / 1024:.0f} KiB "
+          f"in {time.monotonic() - started:.1f}s")
+
+
+def cmd_info(path: str):
+    with Snapshot.open(path) as snap:
+        print(f"Snapshot {path}")
+        print(f"  created : {snap.header['created_at']}")
+        if snap.header['meta'].get('source'):
+            print(f"  source  : {snap.header['meta']['source']}")
+        for name, table in snap.tables.items():
+            print(f"  {name:<22} {len(table):>8} rows")
+        print(f"  {'strings':<22} {snap.header['strings']['count']:>8} distinct")
+
+
+def cmd_import(path: str, tables, apply: bool):
+    with Snapshot.open(path) as snap:
+        if not apply:
+            print("DRY RUN — would upsert:")
+            for name in tables:
+                print(f"  {name}: {len(snap[name])} rows")
+            print("Re-run with --apply to write to Supabase.")
+            return
+        print(f"Importing {path} -> Supabase")
+        import_snapshot(snap, get_client(), tables)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) < 2 or args[0] not in ("export", "import", "info"):
+        print("Usage: python scripts/011_snapshot_rates.py export|info|import <path> "
+              "[--tables=a,b] [--apply]")
+        return
+    command, path = args[0], args[1]
+
+    tables = list(TABLES)
+    for a in sys.argv[1:]:
+        if a.startswith("--tables="):
+            tables = [t for t in a.split("=", 1)[1].split(",") if t]
+    unknown = [t for t in tables if t not in TABLES]
+    if unknown:
+        print(f"ERROR: unknown table(s): {', '.join(unknown)}")
+        return
+    tables = [t for t in TABLES if t in tables]  # parents before children
+
+    if command == "export":
+        cmd_export(path)
+    elif not os.path.isfile(path):
+        print(f"ERROR: File not found: {path}")
+    elif command == "info":
+        cmd_info(path)
+    else:
+        cmd_import(path, tables, "--apply" in sys.argv)
+
+
+if __name__ == "__main__":
+    main()
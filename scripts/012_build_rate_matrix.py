@@ -0,0 +1,69 @@
+"""
+Materialise the per-version combined rate matrix.
+
+Builds the dense (jurisdiction x business code) grid of state / county /
+city rates for every rate_version — city rows stacked with their county's
+row, 214 -> 014 code mapping applied (see taxrates/rate_matrix.py) — and
+writes it where the app reads it (RATE_MATRIX_PATH). Run after each load;
+004_add_monthly_rates.py does this itself when RATE_MATRIX_PATH is set.
+
+Usage:
+    python scripts/012_build_rate_matrix.py                       # -> $RATE_MATRIX_PATH
+    python scripts/012_build_rate_matrix.py rates.ccrm
+    python scripts/012_build_rate_matrix.py rates.ccrm --snapshot=rates.ccrs   # offline
+    python scripts/012_build_rate_matrix.py rates.ccrm --check=PE:214[:2026-05-01]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+from taxrates.rate_matrix import RateMatrix
+from taxrates.snapshot import Snapshot
+
+load_dotenv()
+
+
+def build(snapshot_path: str = None) -> RateMatrix:
+    if snapshot_path:
+        with Snapshot.open(snapshot_path) as snap:
+            return RateMatrix.from_rows(snap.rows('jurisdictions'), snap.rows('rate_versions'),
+                                        snap.rows('rates'), removals=snap.rows('rate_removals'))
+    return RateMatrix.load(create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY')))
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    snapshot_path = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--snapshot=")), None)
+    check = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--check=")), None)
+    path = args[0] if args else os.getenv('RATE_MATRIX_PATH')
+    if not path:
+        print("Usage: python scripts/012_build_rate_matrix.py <out.ccrm> [--snapshot=<path>] [--check=CODE:BIZ[:DATE]]")
+        print("       (or set RATE_MATRIX_PATH)")
+        return
+
+    started = time.monotonic()
+    matrix = build(snapshot_path)
+    size = matrix.save(path)
+    print(f"Wrote {path}: {len(matrix.jurisdiction_ids)} jurisdictions x {len(matrix.codes)} codes, "
+          f"{len(matrix.versions)} versions in {matrix.header['slabs']} slabs, "
+          f"{size / 1024:.0f} KiB in {time.monotonic() - started:.1f}s")
+
+    if check:
+        region_code, business_code, *on_date = check.split(":")
+        rate = RateMatrix.open(path).lookup(region_code, business_code, on_date[0] if on_date else None)
+        if rate is None:
+            print(f"  {region_code}/{business_code}: no rate")
+        else:
+            print(f"  {region_code}/{business_code} (version {rate.rate_version_id}, {rate.effective_date}): "
+                  f"county {rate.county_rate * 100:.3f}% + city {rate.city_rate * 100:.3f}% "
+                  f"= {rate.total_rate * 100:.3f}%")
+
+
+if __name__ == "__main__":
+    main()
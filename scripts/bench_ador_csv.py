@@ -0,0 +1,121 @@
+"""
+Benchmark: row-by-row DictReader parsing vs the columnar ADOR parser.
+
+Generates a synthetic AZTaxesRpt-style file (or uses the one given) and
+times the old per-row path (DictReader, .get() with BOM fallback, per-row
+strptime / float) against taxrates.ador_csv.AdorColumns. Both must produce
+the same records.
+
+Usage:
+    python scripts/bench_ador_csv.py                 # 300,000 synthetic rows
+    python scripts/bench_ador_csv.py --rows=1000000 --memory   # also report peak memory (slower)
+    python scripts/bench_ador_csv.py "C:/Users/noson/Downloads/AZTaxesRpt - SpRates.csv"
+"""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from taxrates.ador_csv import AdorColumns
+
+HEADER = ['RegionCode', 'RegionName', 'BusinessCode', 'BusinessCodesName', 'TaxRate',
+          'RateStartDate', 'RateEndDate']
+
+
+def write_synthetic(path: str, rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    regions = [(f"R{i:02d}", f"Region {i}") for i in range(120)]
+    codes = [(f"{i:03d}", f"Business {i}") for i in range(60)]
+    dates = [f"{m}/1/{y} 12:00:00 AM" for y in range(1990, 2026) for m in (1, 7)]
+    rates = [f"{rng.randint(0, 600) / 100:.2f}" for _ in range(300)]
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for _ in range(rows):
+            region, code = rng.choice(regions), rng.choice(codes)
+            w.writerow([region[0], region[1], code[0], code[1], rng.choice(rates), rng.choice(dates), ''])
+
+
+def parse_rowwise(path: str):
+    """The pre-columnar path (as in 003.parse_historical_csv / 004b)."""
+    records = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            try:
+                region_code = row.get('RegionCode', row.get('\ufeffRegionCode', '')).strip()
+                business_code = row.get('BusinessCode', '').strip()
+                date_str = row.get('RateStartDate', '').strip()
+                start_date = None
+                for fmt in ['%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M', '%m/%d/%Y']:
+                    try:
+                        start_date = datetime.strptime(date_str, fmt)
+                        break
+                    except ValueError:
+                        continue
+                if not start_date:
+                    continue
+                rate = round(float(row.get('TaxRate', '0').strip().replace('%', '')) / 100.0, 6)
+                if region_code and business_code and rate > 0:
+                    records.append((region_code, business_code, rate, start_date.strftime('%Y-%m-%d')))
+            except ValueError:
+                continue
+    return records
+
+
+def parse_columnar(path: str):
+    table = AdorColumns.from_path(path)
+    return [(r['region_code'], r['business_code'], r['rate'], r['effective_date'])
+            for r in table.records(require_date=True)]
+
+
+def measure(fn, path, memory=False):
+    started = time.perf_counter()
+    result = fn(path)
+    elapsed = time.perf_counter() - started
+    peak = None
+    if memory:  # separate run: tracemalloc slows parsing several-fold
+        tracemalloc.start()
+        fn(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    memory = "--memory" in sys.argv
+    rows = next((int(a.split("=", 1)[1]) for a in sys.argv[1:] if a.startswith("--rows=")), 300_000)
+
+    tmp_dir = None
+    if args:
+        path = args[0]
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp_dir.name, 'synthetic.csv')
+        print(f"Writing {rows:,} synthetic rows...")
+        write_synthetic(path, rows)
+
+    print(f"File: {path} ({os.path.getsize(path) / 1e6:.1f} MB)\n")
+    old, old_s, old_peak = measure(parse_rowwise, path, memory)
+    new, new_s, new_peak = measure(parse_columnar, path, memory)
+
+    print(f"{'parser':<10} {'records':>10} {'seconds':>9} {'rows/s':>11} {'peak MB':>9}")
+    for name, recs, secs, peak in (("row-wise", old, old_s, old_peak), ("columnar", new, new_s, new_peak)):
+        peak_s = f"{peak / 1e6:.1f}" if peak is not None else "-"
+        print(f"{name:<10} {len(recs):>10,} {secs:>9.2f} {len(recs) / secs:>11,.0f} {peak_s:>9}")
+    print(f"\nSpeed-up: {old_s / new_s:.1f}x")
+    print("Outputs match." if old == new else "WARNING: outputs differ!")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared helpers for the tax rates app and the scripts in ``scripts/``."""
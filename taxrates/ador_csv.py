@@ -0,0 +1,253 @@
+"""
+Columnar parser for ADOR TPT rate tables.
+
+Both the monthly ``TPT_RATETABLE_ALL_*.csv`` files and the historical
+``AZTaxesRpt - SpRates*.csv`` exports share the RegionCode / RegionName /
+BusinessCode / BusinessCodesName / TaxRate (/ RateStartDate) layout.
+
+Instead of a ``csv.DictReader`` plus per-row ``.get()``, BOM fallbacks and
+float / strptime calls, the file is read once and transposed into columns.
+TaxRate and RateStartDate are then converted in bulk: these columns hold a
+few hundred distinct strings across hundreds of thousands of rows, so each
+distinct value is parsed once and the column is mapped through the result.
+Rates land in a typed ``array('d')`` (NaN where unparseable).
+
+AZDOR rates are always percentages: "2.0" means 2%, so the value is always
+divided by 100 (the old ``> 1`` threshold stored 1% as 100%).
+
+For the multi-decade historical files, ``iter_date_batches`` streams the
+file instead: the exports are grouped by RateStartDate, so it yields one
+batch of records per run of equal dates and never holds more than that.
+"""
+
+import csv
+import io
+import math
+from array import array
+from datetime import date, datetime
+from itertools import zip_longest
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+# attribute -> CSV header
+COLUMNS = {
+    'region_code': 'RegionCode',
+    'region_name': 'RegionName',
+    'business_code': 'BusinessCode',
+    'business_name': 'BusinessCodesName',
+    'tax_rate': 'TaxRate',
+    'rate_start': 'RateStartDate',
+}
+
+DATE_FORMATS = ('%m/%d/%Y', '%Y-%m-%d', '%m-%d-%Y', '%Y/%m/%d')
+
+
+def parse_rate(value) -> float:
+    """"2.4%" / "2.4" -> 0.024 (6 decimal places); 0.0 if unparseable."""
+    rate = _rate_or_nan(value)
+    return 0.0 if math.isnan(rate) else rate
+
+
+def _rate_or_nan(value) -> float:
+    if not value:
+        return math.nan
+    try:
+        return round(float(str(value).strip().replace('%', '')) / 100.0, 6)
+    except ValueError:
+        return math.nan
+
+
+def parse_rate_date(value) -> Optional[str]:
+    """ADOR date ("1/1/2021 12:00:00 AM", "1/01/2021 0:00", "2021-01-01") -> ISO date."""
+    if not value:
+        return None
+    text = str(value).strip().split(' ', 1)[0]
+    parts = text.split('/')
+    if len(parts) == 3 and len(parts[2]) == 4:
+        try:
+            return date(int(parts[2]), int(parts[0]), int(parts[1])).isoformat()
+        except ValueError:
+            pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def header_positions(header: Sequence[str]) -> Dict[str, int]:
+    """Attribute -> column index for a header row; raises if a required column is missing."""
+    header = [h.lstrip('\ufeff').strip() for h in header]
+    positions = {attr: header.index(name) for attr, name in COLUMNS.items() if name in header}
+    missing = {'region_code', 'business_code', 'tax_rate'} - set(positions)
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(COLUMNS[m] for m in sorted(missing))}")
+    return positions
+
+
+def convert_distinct(values: Sequence[str], fn: Callable) -> list:
+    """Apply ``fn`` once per distinct value and map the column through the results."""
+    converted = {v: fn(v) for v in set(values)}
+    return list(map(converted.__getitem__, values))
+
+
+class AdorColumns:
+    """An ADOR rate table held as columns (one list / typed array per field)."""
+
+    def __init__(self, region_code: List[str], region_name: List[str], business_code: List[str],
+                 business_name: List[str], rate: array, effective_date: Optional[List[Optional[str]]] = None):
+        self.region_code = region_code
+        self.region_name = region_name
+        self.business_code = business_code
+        self.business_name = business_name
+        self.rate = rate
+        self.effective_date = effective_date
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[str]]) -> 'AdorColumns':
+        """Build from ``csv.reader`` rows, the first being the header."""
+        rows = iter(rows)
+        header = next(rows, [])
+        positions = header_positions(header)
+
+        body = [r for r in rows if r]
+        columns = list(zip_longest(*body, fillvalue='')) if body else [()] * len(header)
+
+        def column(attr) -> List[str]:
+            if attr not in positions or positions[attr] >= len(columns):
+                return [''] * len(body)
+            return list(map(str.strip, columns[positions[attr]]))
+
+        effective_date = None
+        if 'rate_start' in positions:
+            effective_date = convert_distinct(column('rate_start'), parse_rate_date)
+        return cls(
+            region_code=column('region_code'),
+            region_name=column('region_name'),
+            business_code=column('business_code'),
+            business_name=column('business_name'),
+            rate=array('d', convert_distinct(column('tax_rate'), _rate_or_nan)),
+            effective_date=effective_date,
+        )
+
+    @classmethod
+    def from_file(cls, f: TextIO) -> 'AdorColumns':
+        return cls.from_rows(csv.reader(f))
+
+    @classmethod
+    def from_text(cls, text: str) -> 'AdorColumns':
+        return cls.from_file(io.StringIO(text))
+
+    @classmethod
+    def from_path(cls, path: str) -> 'AdorColumns':
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            return cls.from_file(f)
+
+    def __len__(self) -> int:
+        return len(self.rate)
+
+    def valid_indices(self, require_date: bool = False, positive_only: bool = True) -> List[int]:
+        """Rows with a region code, a business code and a parseable rate (> 0 unless
+        ``positive_only`` is off), plus a parseable date when ``require_date`` is set."""
+        dates = self.effective_date if require_date else None
+        if require_date and dates is None:
+            return []
+        floor = 0.0 if positive_only else -1.0
+        # NaN compares False, so unparseable rates drop out either way
+        return [
+            i for i, (region, code, rate) in enumerate(zip(self.region_code, self.business_code, self.rate))
+            if region and code and rate > floor and (dates is None or dates[i])
+        ]
+
+    def record(self, i: int, **extra) -> Dict:
+        rec = {
+            'region_code': self.region_code[i],
+            'region_name': self.region_name[i],
+            'business_code': self.business_code[i],
+            'business_name': self.business_name[i],
+            'rate': self.rate[i],
+        }
+        if self.effective_date is not None:
+            rec['effective_date'] = self.effective_date[i]
+        rec.update(extra)
+        return rec
+
+    def records(self, require_date: bool = False, positive_only: bool = True, **extra) -> Iterator[Dict]:
+        """Validated rows as dicts (``extra`` keys are added to every record)."""
+        for i in self.valid_indices(require_date, positive_only):
+            yield self.record(i, **extra)
+
+    def batches(self, size: int, require_date: bool = False, positive_only: bool = True,
+                **extra) -> Iterator[List[Dict]]:
+        """Validated rows in lists of at most ``size`` records."""
+        batch = []
+        for rec in self.records(require_date, positive_only, **extra):
+            batch.append(rec)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def indices_by_date(self, positive_only: bool = True) -> Dict[str, List[int]]:
+        """Validated row indices grouped by effective date (historical files)."""
+        groups: Dict[str, List[int]] = {}
+        for i in self.valid_indices(require_date=True, positive_only=positive_only):
+            groups.setdefault(self.effective_date[i], []).append(i)
+        return groups
+
+
+def iter_date_batches(source, positive_only: bool = True) -> Iterator[Tuple[str, List[Dict]]]:
+    """Stream (effective_date, records) batches from a historical CSV path or file.
+
+    A batch ends whenever RateStartDate changes, so a date that shows up in
+    two separate runs is yielded twice; callers must treat batches for the
+    same date as additive. Rows failing validation are dropped.
+    """
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8-sig', newline='') as f:
+            yield from iter_date_batches(f, positive_only)
+        return
+
+    reader = csv.reader(source)
+    positions = header_positions(next(reader, []))
+    if 'rate_start' not in positions:
+        raise ValueError("CSV is missing column(s): RateStartDate")
+    width = max(positions.values()) + 1
+    region_i, code_i, rate_i, date_i = (positions[a] for a in ('region_code', 'business_code', 'tax_rate',
+                                                                  'rate_start'))
+    name_i, bname_i = positions.get('region_name'), positions.get('business_name')
+    floor = 0.0 if positive_only else -1.0
+    rates: Dict[str, float] = {}
+    dates: Dict[str, Optional[str]] = {}
+
+    current, batch = None, []
+    for row in reader:
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        raw_date = row[date_i]
+        effective_date = dates.get(raw_date)
+        if effective_date is None and raw_date not in dates:
+            effective_date = dates[raw_date] = parse_rate_date(raw_date)
+        raw_rate = row[rate_i]
+        rate = rates.get(raw_rate)
+        if rate is None:
+            rate = rates[raw_rate] = _rate_or_nan(raw_rate)
+        region, code = row[region_i].strip(), row[code_i].strip()
+        if not (effective_date and region and code and rate > floor):
+            continue
+
+        if effective_date != current:
+            if batch:
+                yield current, batch
+            current, batch = effective_date, []
+        batch.append({
+            'region_code': region,
+            'region_name': row[name_i].strip() if name_i is not None else '',
+            'business_code': code,
+            'business_name': row[bname_i].strip() if bname_i is not None else '',
+            'rate': rate,
+            'effective_date': effective_date,
+        })
+    if batch:
+        yield current, batch
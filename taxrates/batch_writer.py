@@ -0,0 +1,244 @@
+"""
+Concurrent batch writer for PostgREST inserts.
+
+The loaders used to send one 500-row insert, wait for the round trip, then
+send the next, so a load was bound by latency rather than bandwidth.
+``BatchWriter`` keeps up to ``workers`` batches in flight on a thread pool
+(the Supabase client's HTTP session is safe to share between threads):
+
+- rows are cut into batches lazily, so a generator source (e.g. a dump
+  being streamed) never holds more than the in-flight batches in memory;
+- failures that cannot have written anything (connection refused, 429 /
+  503, PostgREST pool errors) are retried with exponential backoff, and
+  shrink the batch size for the batches that follow; a run of clean
+  batches grows it back;
+- other transient failures (read timeouts, 500 / 502 / 504, statement
+  timeouts) may have committed the batch already, and plain inserts have
+  no conflict target to absorb a resend: they are only retried once
+  ``landed(batch)`` reports the rows are not there (``for_table`` checks
+  the table's natural key, see ``taxrates.db.rows_present``), and without
+  ``landed`` they fail the batch;
+- a batch rejected for its content (a Postgres data exception or
+  constraint violation, SQLSTATE class 22 / 23, e.g. a duplicate key) is
+  split in half and retried until the offending rows are isolated, so one
+  bad row no longer drops the other 499;
+- any other error (a missing column, bad credentials, a permission
+  denied) would fail every batch, so it is raised from ``write`` straight
+  away instead of being bisected down to single rows;
+- failures are reported in source order as ``BatchError(start, size,
+  error)`` ranges, regardless of which thread finished first.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+TRANSIENT_CODES = {'408', '429', '500', '502', '503', '504', '57014', 'PGRST000', 'PGRST001', 'PGRST003'}
+UNSENT_CODES = {'429', '503', 'PGRST000', 'PGRST001', 'PGRST003'}  # rejected before the write ran
+ROW_ERROR_CLASSES = ('22', '23')  # SQLSTATE data exception / integrity constraint violation
+
+
+class BatchError(NamedTuple):
+    start: int  # offset of the first failed row in the source
+    size: int
+    error: Exception
+
+
+class WriteResult(NamedTuple):
+    written: int
+    errors: List[BatchError]
+
+    @property
+    def failed_rows(self) -> int:
+        return sum(e.size for e in self.errors)
+
+    def check(self) -> 'WriteResult':
+        """Raise ``BatchWriteError`` if any rows failed."""
+        if self.errors:
+            raise BatchWriteError(self)
+        return self
+
+
+class BatchWriteError(Exception):
+    def __init__(self, result: WriteResult):
+        first = result.errors[0]
+        super().__init__(f"{result.failed_rows} row(s) failed to write; first at row {first.start + 1}: "
+                         f"{first.error}")
+        self.result = result
+
+
+def is_transient(exc: Exception) -> bool:
+    """Worth retrying as-is: network trouble, throttling or an overloaded server."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:  # pragma: no cover - httpx ships with supabase
+        pass
+    code = getattr(exc, 'code', None) or getattr(exc, 'status_code', None)
+    return str(code) in TRANSIENT_CODES
+
+
+def is_unsent(exc: Exception) -> bool:
+    """Failed before the write could run, so resending it can't duplicate rows."""
+    if isinstance(exc, ConnectionRefusedError):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+    except ImportError:  # pragma: no cover - httpx ships with supabase
+        pass
+    code = getattr(exc, 'code', None) or getattr(exc, 'status_code', None)
+    return str(code) in UNSENT_CODES
+
+
+def is_row_error(exc: Exception) -> bool:
+    """Rejected for the content of some row, so the rest of the batch can still be written."""
+    return str(getattr(exc, 'code', None) or '').startswith(ROW_ERROR_CLASSES)
+
+
+def default_workers() -> int:
+    return max(1, int(os.getenv('WRITE_WORKERS', 4)))
+
+
+class BatchWriter:
+    """Write rows through ``write(batch)`` with bounded concurrency."""
+
+    def __init__(self, write: Callable[[List[Dict]], object], batch_size: int = 500,
+                 workers: Optional[int] = None, retries: int = 3, backoff: float = 0.5,
+                 min_batch_size: int = 50, max_batch_size: Optional[int] = None,
+                 grow_after: int = 10, sleep: Callable[[float], None] = time.sleep,
+                 landed: Optional[Callable[[List[Dict]], bool]] = None):
+        self.write_batch = write
+        self.landed = landed
+        self.batch_size = batch_size
+        self.workers = workers or default_workers()
+        self.retries = retries
+        self.backoff = backoff
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.max_batch_size = max_batch_size or batch_size
+        self.grow_after = grow_after
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._clean = 0
+
+    @classmethod
+    def for_table(cls, client, table: str, key: Optional[Sequence[str]] = None, **kwargs) -> 'BatchWriter':
+        """Plain inserts into ``table``; ``key`` (default: the table's natural key) checks
+        whether a batch landed after an ambiguous failure."""
+        from taxrates.db import NATURAL_KEYS, rows_present  # taxrates.db imports this module
+        key = key or NATURAL_KEYS.get(table)
+        if key and 'landed' not in kwargs:
+            kwargs['landed'] = lambda batch: rows_present(client, table, batch, key)
+        return cls(lambda batch: client.table(table).insert(batch).execute(), **kwargs)
+
+    # -- adaptive sizing -------------------------------------------------
+
+    def _shrink(self):
+        with self._lock:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self._clean = 0
+
+    def _succeeded(self):
+        with self._lock:
+            self._clean += 1
+            if self._clean >= self.grow_after and self.batch_size < self.max_batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+                self._clean = 0
+
+    # -- one batch -------------------------------------------------------
+
+    def _send(self, batch: List[Dict]):
+        """Write with retries on transient errors; raises the last error otherwise.
+
+        A failure that may have committed is only resent once ``landed``
+        says the rows are missing; if they are there the batch is done.
+        """
+        ambiguous = False
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._shrink()
+                self.sleep(self.backoff * (2 ** (attempt - 1)))
+                if ambiguous and self.landed(batch):
+                    self._succeeded()
+                    return
+            try:
+                self.write_batch(batch)
+                self._succeeded()
+                return
+            except Exception as e:
+                if not is_transient(e) or attempt == self.retries:
+                    raise
+                ambiguous = not is_unsent(e)
+                if ambiguous and self.landed is None:
+                    raise
+
+    def _write(self, start: int, batch: List[Dict]) -> Tuple[int, List[BatchError]]:
+        """Write one batch, bisecting on row errors. Returns (written, errors).
+
+        Errors that are neither transient nor row-level are raised.
+        """
+        try:
+            self._send(batch)
+            return len(batch), []
+        except Exception as e:
+            if not is_transient(e) and not is_row_error(e):
+                raise
+            if len(batch) == 1 or is_transient(e):
+                return 0, [BatchError(start, len(batch), e)]
+        mid = len(batch) // 2
+        left = self._write(start, batch[:mid])
+        right = self._write(start + mid, batch[mid:])
+        return left[0] + right[0], left[1] + right[1]
+
+    # -- the stream ------------------------------------------------------
+
+    def _batches(self, rows: Iterable[Dict]) -> Iterator[Tuple[int, List[Dict]]]:
+        start, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield start, batch
+                start, batch = start + len(batch), []
+        if batch:
+            yield start, batch
+
+    def write(self, rows: Iterable[Dict], progress: Optional[Callable[[int], None]] = None,
+              stop_on_error: bool = False) -> WriteResult:
+        """Write every row; ``progress(written_so_far)`` is called as batches complete.
+
+        With ``stop_on_error`` no new batch is started once one has failed
+        (those already in flight finish), so the caller can abort early.
+        An error that is neither transient nor row-level is raised once the
+        batches in flight have finished.
+        """
+        written = 0
+        errors: List[BatchError] = []
+
+        def collect(done):
+            nonlocal written
+            for future in done:
+                count, errs = future.result()
+                written += count
+                errors.extend(errs)
+                if progress and count:
+                    progress(written)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            for start, batch in self._batches(rows):
+                if len(pending) >= self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if stop_on_error and errors:
+                    break
+                pending.add(pool.submit(self._write, start, batch))
+            collect(wait(pending)[0])
+
+        errors.sort(key=lambda e: e.start)
+        return WriteResult(written, errors)
@@ -0,0 +1,147 @@
+"""
+Per-customer tax jurisdiction for the Stripe sync.
+
+007_sync_stripe_tax_rates.py used to apply one address's rates (Peoria 214
+plus Maricopa County 014) to every subscription. In ``--per-customer`` mode
+each subscription is taxed where its customer is instead:
+
+- ``group_for`` resolves a customer to a ``TaxGroup`` — (city, county,
+  business code) jurisdiction ids — from ``cactuscomply_region_code`` /
+  ``cactuscomply_business_code`` metadata (subscription first, then
+  customer) or else the customer's Arizona billing/shipping address: its
+  postal code through the offline ``ZipIndex`` when one is loaded
+  (taxrates/zip_index.py), otherwise its city matched against
+  ``jurisdictions.city_name``, with the city's ``county_name`` parent as
+  the county;
+- ``rate_for`` looks each distinct group up once in a ``RateMatrix`` (city
+  row plus the county row under its mapped code, see
+  taxrates/rate_matrix.py) and memoises it, so thousands of customers in a
+  handful of cities cost a handful of lookups and no Supabase round trips.
+
+The caller then needs one Stripe tax rate per distinct combined percentage,
+not per customer.
+"""
+
+from datetime import date
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from taxrates.rate_index import build_code_map
+from taxrates.rate_matrix import RateMatrix, county_parents
+from taxrates.zip_index import ZipIndex
+
+REGION_FIELD = 'cactuscomply_region_code'
+BUSINESS_CODE_FIELD = 'cactuscomply_business_code'
+ARIZONA = {'az', 'arizona'}
+
+
+class TaxGroup(NamedTuple):
+    city_id: Optional[int]   # None: unincorporated, county rate only
+    county_id: Optional[int]
+    business_code: str
+
+
+class GroupRate(NamedTuple):
+    rate_version_id: int
+    effective_date: str
+    county_rate: float
+    city_rate: float
+
+    @property
+    def rate(self) -> float:
+        """City + county, as charged on subscriptions (state TPT is not collected through Stripe)."""
+        return round(self.county_rate + self.city_rate, 6)
+
+    @property
+    def percentage(self) -> float:
+        return round(self.rate * 100, 4)
+
+
+def _field(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _norm(value) -> str:
+    return ' '.join(str(value or '').split()).lower()
+
+
+class CustomerTaxResolver:
+    """Customer -> TaxGroup -> combined rate (see module docstring)."""
+
+    def __init__(self, jurisdictions: Iterable[Dict], matrix: RateMatrix, business_code: str,
+                 on_date=None, zip_index: Optional[ZipIndex] = None):
+        jurisdictions = list(jurisdictions)
+        self.matrix = matrix
+        self.zip_index = zip_index
+        self.business_code = business_code
+        self.on_date = on_date or date.today()
+        self.parents = county_parents(jurisdictions)
+        self.code_map = build_code_map(jurisdictions)
+        self.levels = {j['id']: j.get('level') or 'city' for j in jurisdictions}
+        self.names = {j['id']: (j.get('county_name') if j.get('level') == 'county' else j.get('city_name')) or ''
+                      for j in jurisdictions}
+        self.cities: Dict[str, int] = {}
+        for j in jurisdictions:
+            if (j.get('level') or 'city') == 'city' and j.get('city_name') \
+                    and _norm(j.get('state_code') or 'AZ') in ARIZONA:
+                self.cities.setdefault(_norm(j['city_name']), j['id'])
+        self._rates: Dict[TaxGroup, Optional[GroupRate]] = {}
+
+    def _group(self, jurisdiction_id: int, business_code: str) -> TaxGroup:
+        if self.levels.get(jurisdiction_id) == 'county':
+            return TaxGroup(None, jurisdiction_id, business_code)
+        return TaxGroup(jurisdiction_id, self.parents.get(jurisdiction_id), business_code)
+
+    def group_for(self, customer, metadata: Optional[Dict] = None) -> Optional[TaxGroup]:
+        """The customer's jurisdiction group, or None if it can't be resolved."""
+        sources = (metadata or {}, _field(customer, 'metadata') or {})
+        business_code = next((str(m[BUSINESS_CODE_FIELD]).strip() for m in sources
+                              if m.get(BUSINESS_CODE_FIELD)), self.business_code)
+
+        region = next((str(m[REGION_FIELD]).strip() for m in sources if m.get(REGION_FIELD)), None)
+        if region:
+            jurisdiction_id = self.code_map.get(region)
+            return self._group(jurisdiction_id, business_code) if jurisdiction_id is not None else None
+
+        fallback = None
+        for address in (_field(customer, 'address'), _field(_field(customer, 'shipping'), 'address')):
+            if not address or _norm(_field(address, 'state')) not in ARIZONA:
+                continue
+            place = self.zip_index.lookup(_field(address, 'postal_code')) if self.zip_index else None
+            if place is not None and not place.ambiguous:
+                return TaxGroup(place.city_id, place.county_id, business_code)
+            city_id = self.cities.get(_norm(_field(address, 'city')))
+            if city_id is not None:
+                return self._group(city_id, business_code)
+            if place is not None and fallback is None:
+                # ZIP spans several jurisdictions and the city name didn't settle it
+                fallback = TaxGroup(place.city_id, place.county_id, business_code)
+        return fallback
+
+    def rate_for(self, group: TaxGroup) -> Optional[GroupRate]:
+        """Combined rate in force for ``group`` on ``on_date`` (memoised per group)."""
+        if group not in self._rates:
+            self._rates[group] = self._lookup(group)
+        return self._rates[group]
+
+    def _lookup(self, group: TaxGroup) -> Optional[GroupRate]:
+        found = self.matrix.lookup_place(group.city_id, group.county_id, group.business_code, self.on_date)
+        if found is None:
+            return None
+        return GroupRate(found.rate_version_id, found.effective_date, found.county_rate, found.city_rate)
+
+    def label(self, group: TaxGroup) -> str:
+        names = [self.names.get(j, str(j)) for j in (group.city_id, group.county_id) if j is not None]
+        return f"{' / '.join(names) or '?'} ({group.business_code})"
+
+    def groups(self) -> Dict[TaxGroup, Optional[GroupRate]]:
+        """Every group resolved so far and its rate."""
+        return dict(self._rates)
+
+    def version(self) -> Optional[Tuple[int, str]]:
+        """(rate_version_id, effective_date) the lookups read from."""
+        pos = self.matrix.version_at(self.on_date)
+        return None if pos is None else self.matrix.versions[pos][:2]
@@ -0,0 +1,66 @@
+"""Small Supabase helpers shared by the app, the loaders and the scripts."""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from taxrates.batch_writer import BatchWriter
+
+PAGE_SIZE = 1000  # PostgREST caps a single response at 1000 rows
+
+# Columns identifying a row for the "did this batch land?" check (tables have no unique constraint)
+NATURAL_KEYS = {
+    'rates': ('rate_version_id', 'jurisdiction_id', 'business_code'),
+    'rate_removals': ('rate_version_id', 'jurisdiction_id', 'business_code'),
+    'rate_versions': ('id',),
+}
+
+
+def fetch_all(client, table: str, columns: str, order: str = 'id', **filters) -> List[Dict]:
+    """Page through every row of ``table`` (optionally filtered), ordered by ``order``.
+
+    A filter value that is a list / tuple / set becomes ``in_``, anything else ``eq``.
+
+    An explicit order keeps pages stable between requests (see the 008 note in
+    docs/2026-05-21-rate-100x-bug-cleanup-and-date-aware-versioning.md).
+    """
+    rows: List[Dict] = []
+    start = 0
+    while True:
+        query = client.table(table).select(columns)
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                query = query.in_(column, list(value))
+            else:
+                query = query.eq(column, value)
+        res = query.order(order).range(start, start + PAGE_SIZE - 1).execute()
+        rows.extend(res.data)
+        if len(res.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def rows_present(client, table: str, rows: List[Dict], key: Sequence[str]) -> bool:
+    """True if every row's ``key`` values are already in ``table`` (one ``in_`` query per page)."""
+    wanted = {tuple(r.get(k) for k in key) for r in rows}
+    filters = {k: sorted({w[i] for w in wanted}, key=str) for i, k in enumerate(key)}
+    found = fetch_all(client, table, ', '.join(key), order=key[0], **filters)
+    return wanted <= {tuple(r.get(k) for k in key) for r in found}
+
+
+def insert_batches(client, table: str, rows: Iterable[Dict], batch_size: int = 500,
+                   log: Callable = print, progress: Optional[Callable[[int], None]] = None,
+                   **writer_options) -> Tuple[int, int]:
+    """Insert ``rows`` through a concurrent ``BatchWriter``; returns (rows inserted, rows failed).
+
+    Failed rows are logged in source order and skipped so one bad chunk
+    doesn't abort a load; an error that would fail every chunk (see
+    ``BatchWriter``) is raised instead. A batch that may have committed before failing is
+    only resent after ``rows_present`` finds it missing (``key=`` overrides
+    the table's entry in ``NATURAL_KEYS``).
+    """
+    writer = BatchWriter.for_table(client, table, batch_size=batch_size, **writer_options)
+    result = writer.write(rows, progress=progress)
+    for err in result.errors[:10]:
+        log(f"ERROR: Failed to insert rows {err.start + 1}-{err.start + err.size}: {err.error}")
+    if len(result.errors) > 10:
+        log(f"ERROR: ... and {len(result.errors) - 10} more failed ranges")
+    return result.written, result.failed_rows
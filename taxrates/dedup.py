@@ -0,0 +1,49 @@
+"""
+Set-based de-duplication of rate rows, run inside the database.
+
+009_dedup_version_rows.py's original mode pages every row of a version into
+Python, groups them and deletes the redundant ones 200 ids at a time. The
+``dedup_version_rates`` function (SQL in docs/server-side-dedup.md) does the
+grouping, the conflict check and the delete in one statement and returns
+only the report, so one RPC dedups a version — or every version — whatever
+its size. The rules are the script's: keep the lowest id of each
+(rate_version_id, jurisdiction_id, business_code) group, and leave groups
+whose rows carry differing rates untouched.
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+
+DEDUP_FUNCTION = 'dedup_version_rates'
+
+
+class DedupReport(NamedTuple):
+    # per version with duplicates or conflicts: rate_version_id, rows, duplicates, conflict_groups
+    versions: List[Dict]
+    # per conflicting group: rate_version_id, jurisdiction_id, business_code, rows, rate_sets
+    conflicts: List[Dict]
+    deleted: int
+    applied: bool
+
+    @property
+    def duplicates(self) -> int:
+        return sum(v['duplicates'] for v in self.versions)
+
+    def changed_versions(self) -> List[int]:
+        """Versions whose rows were deleted (their row hashes need a refresh)."""
+        if not self.applied:
+            return []
+        return [v['rate_version_id'] for v in self.versions if v['duplicates']]
+
+
+def dedup_on_server(client, version_id: Optional[int] = None, apply: bool = False) -> DedupReport:
+    """One RPC: report (and with ``apply`` delete) duplicates in one version, or all when None."""
+    res = client.rpc(DEDUP_FUNCTION, {'p_version_id': version_id, 'p_apply': apply}).execute()
+    data = res.data
+    if isinstance(data, list):  # SETOF / older PostgREST wrap the scalar
+        data = data[0] if data else {}
+    return DedupReport(
+        versions=data.get('versions') or [],
+        conflicts=data.get('conflicts') or [],
+        deleted=int(data.get('deleted') or 0),
+        applied=bool(data.get('applied')),
+    )
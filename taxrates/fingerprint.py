@@ -0,0 +1,62 @@
+"""
+Content fingerprints for rate loads.
+
+Re-running a load is how version 10 ended up with 8,004 rows instead of
+~4,600 (cleaned up by 009_dedup_version_rows.py). Every loader now hashes
+what it is about to load — the effective date plus the sorted, normalised
+(region code, business code, rate) triples, so column order, row order,
+whitespace, duplicate lines and "2.4%" vs "2.4" don't matter — and looks
+the hash up on ``rate_versions.content_hash`` before touching anything
+else. A hit means the identical file is already loaded; the hash is only
+recorded once a load has written its rows, so a failed load can be re-run.
+
+The app (``/upload``), 004_add_monthly_rates.py and 003's ADOR sync all
+hash the same way, so a file loaded through one is recognised by the others.
+"""
+
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_VERSION = 'v1'
+
+
+def rates_fingerprint(effective_date: str, records: Iterable[Dict]) -> str:
+    """sha256 over the effective date and the normalised records (region_code, business_code, rate)."""
+    lines = set()
+    for r in records:
+        rate = round(float(r.get('rate') or 0), 6)
+        region = (r.get('region_code') or '').strip().upper()
+        code = (r.get('business_code') or '').strip()
+        if region and code and rate > 0:
+            lines.add(f"{region}|{code}|{rate:.6f}")
+    digest = hashlib.sha256(f"{FINGERPRINT_VERSION}|{str(effective_date)[:10]}\n".encode('utf-8'))
+    digest.update('\n'.join(sorted(lines)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def find_loaded_version(client, fingerprint: str) -> Optional[Dict]:
+    """The rate_version already loaded from identical content, if any (one query)."""
+    try:
+        res = (
+            client.table('rate_versions').select('id, effective_date, loaded_at')
+            .eq('content_hash', fingerprint)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        logger.warning(f"Could not check content fingerprint: {e}")
+        return None
+    return res.data[0] if res.data else None
+
+
+def record_fingerprint(client, version_id: int, fingerprint: str) -> bool:
+    """Store ``fingerprint`` on a rate_version once its rows are written."""
+    try:
+        client.table('rate_versions').update({'content_hash': fingerprint}).eq('id', version_id).execute()
+        return True
+    except Exception as e:
+        logger.warning(f"Could not record content fingerprint on rate_version {version_id}: {e}")
+        return False
@@ -0,0 +1,98 @@
+"""
+Deferred, cached schema check behind ``/readyz``.
+
+The app used to probe its four tables over the network at import time, so
+every worker boot (and every test or script that imported app.py) waited on
+Supabase before doing anything. Now nothing runs at import: the first
+``/readyz`` (or ``init_database()``) probes the tables and the result is
+cached — for ``ttl`` seconds when ready, for ``retry_after`` seconds when
+not, so a failing dependency is re-probed quickly without every readiness
+poll hitting the database.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# (table, column) the app needs; a one-row select proves each exists and is readable
+REQUIRED_TABLES: Sequence[Tuple[str, str]] = (
+    ('jurisdictions', 'id'),
+    ('rate_versions', 'id'),
+    ('rates', 'id'),
+    ('business_class_codes', 'code'),
+)
+
+
+class LazyClient:
+    """Stands in for a Supabase client and creates the real one on first use.
+
+    Attribute access (``.table``, ``.rpc``, ...) goes to the client built by
+    ``factory``, so module-level ``supabase = LazyClient(...)`` works like
+    the eager client without creating it (or requiring its env vars) at
+    import time.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class SchemaCheck:
+    """Probe ``REQUIRED_TABLES`` on first use and cache the result."""
+
+    def __init__(self, client: Callable, ttl: float = 60.0, retry_after: float = 5.0,
+                 tables: Sequence[Tuple[str, str]] = REQUIRED_TABLES):
+        self.client = client  # callable returning the client, so tests can swap it
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.tables = tables
+        self._status: Optional[Dict] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def probe(self) -> Dict:
+        started = time.monotonic()
+        tables = {}
+        try:
+            client = self.client()
+        except Exception as e:
+            tables = {name: f"no client: {e}" for name, _ in self.tables}
+        else:
+            for name, column in self.tables:
+                try:
+                    client.table(name).select(column).limit(1).execute()
+                    tables[name] = 'ok'
+                except Exception as e:
+                    tables[name] = str(e)
+        return {
+            'ready': all(v == 'ok' for v in tables.values()),
+            'tables': tables,
+            'checked_at': datetime.now(timezone.utc).isoformat(),
+            'probe_ms': round((time.monotonic() - started) * 1000, 1),
+        }
+
+    def status(self, refresh: bool = False) -> Dict:
+        """The cached probe result (re-probed once it has expired, or on ``refresh``)."""
+        with self._lock:
+            status = self._status
+            max_age = self.ttl if status and status['ready'] else self.retry_after
+            if refresh or status is None or time.monotonic() - self._checked >= max_age:
+                self._status = status = self.probe()
+                self._checked = time.monotonic()
+            return dict(status, age_s=round(time.monotonic() - self._checked, 1))
+
+    def invalidate(self):
+        with self._lock:
+            self._status = None
@@ -0,0 +1,131 @@
+"""
+Background job queue for CSV uploads.
+
+Jobs run on a small thread pool inside the web process; their state lives in
+one JSON file per job under a local directory so that any Gunicorn worker can
+answer a ``/jobs/<id>`` poll, not just the one that accepted the upload.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """One JSON document per job, written atomically (temp file + rename)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        # Job ids are uuid hex strings; reject anything that could escape the directory
+        if not job_id or not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, job: Dict):
+        tmp_path = self._path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, default=str)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def update(self, job_id: str, **fields) -> Dict:
+        with self._lock:
+            job = self.get(job_id) or {'id': job_id}
+            job.update(fields)
+            job['updated_at'] = datetime.now().isoformat()
+            self.save(job)
+            return job
+
+
+class JobProgress:
+    """Progress callback handed to the job function.
+
+    Counters are flushed to the store at most every ``flush_interval`` seconds
+    so a large load does not turn into a file write per chunk.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, flush_interval: float = 0.5):
+        self.store = store
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.started = time.monotonic()
+        self.rows_parsed = 0
+        self.rows_written = 0
+        self._last_flush = 0.0
+
+    def __call__(self, rows_parsed: Optional[int] = None, rows_written: Optional[int] = None,
+                 stage: Optional[str] = None):
+        if rows_parsed is not None:
+            self.rows_parsed = rows_parsed
+        if rows_written is not None:
+            self.rows_written = rows_written
+        now = time.monotonic()
+        if stage or now - self._last_flush >= self.flush_interval:
+            self._last_flush = now
+            fields = self.snapshot()
+            if stage:
+                fields['stage'] = stage
+            self.store.update(self.job_id, **fields)
+
+    def snapshot(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            'rows_parsed': self.rows_parsed,
+            'rows_written': self.rows_written,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows_written / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+class JobQueue:
+    """Runs ``fn(*args, progress=JobProgress)`` on a bounded thread pool."""
+
+    def __init__(self, store: JobStore, max_workers: int = 2):
+        self.store = store
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+
+    def submit(self, kind: str, fn: Callable, *args, **meta) -> str:
+        job_id = uuid.uuid4().hex
+        self.store.update(job_id, kind=kind, status='queued', created_at=datetime.now().isoformat(),
+                          rows_parsed=0, rows_written=0, result=None, error=None, **meta)
+        self.executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable, args):
+        progress = JobProgress(self.store, job_id)
+        self.store.update(job_id, status='running', started_at=datetime.now().isoformat())
+        try:
+            result = fn(*args, progress=progress)
+            status = 'succeeded' if not isinstance(result, dict) or result.get('success', True) else 'failed'
+            self.store.update(job_id, status=status, result=result,
+                              finished_at=datetime.now().isoformat(), **progress.snapshot())
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            self.store.update(job_id, status='failed', error=str(e),
+                              finished_at=datetime.now().isoformat(), **progress.snapshot())
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        """Stop taking jobs; ones already queued still run."""
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,144 @@
+"""
+Shared region_code -> jurisdiction resolution.
+
+ADOR CSVs identify a jurisdiction by RegionCode, which may match either a
+``city_code`` or a ``region_code`` in the ``jurisdictions`` table. When a
+code exists on both a level='city' and a level='county' record (e.g. 'APA'),
+the county record wins: county rates must land on level='county'
+jurisdictions because the backend's county lookup filters on that level.
+
+``JurisdictionResolver`` keeps the table in memory for ``ttl`` seconds and
+can warm itself from a JSON file so short-lived scripts don't re-query it on
+every run. Anything that creates or edits jurisdictions must call
+``invalidate()``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from taxrates.db import fetch_all
+
+logger = logging.getLogger(__name__)
+
+JURISDICTION_COLUMNS = 'id, level, state_code, city_code, region_code, city_name, county_name'
+
+
+class Jurisdiction(NamedTuple):
+    id: int
+    level: str
+    name: str
+
+
+def build_jurisdiction_map(rows: Iterable[Dict]) -> Dict[str, Jurisdiction]:
+    """city_code/region_code -> Jurisdiction, county records win on code clashes."""
+    candidates: Dict[str, List[Jurisdiction]] = {}
+    for j in rows:
+        level = j.get('level') or 'city'
+        name = (j.get('county_name') if level == 'county' else j.get('city_name')) or ''
+        entry = Jurisdiction(j['id'], level, name)
+        for code in (j.get('city_code'), j.get('region_code')):
+            if code:
+                candidates.setdefault(code, []).append(entry)
+
+    mapping = {}
+    for code, entries in candidates.items():
+        county = [e for e in entries if e.level == 'county']
+        mapping[code] = county[0] if county else entries[0]
+    return mapping
+
+
+class JurisdictionResolver:
+    """TTL-cached jurisdictions table with an optional on-disk warm cache."""
+
+    def __init__(self, loader: Callable[[], List[Dict]], ttl: float = 300.0, cache_path: Optional[str] = None):
+        self.loader = loader
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self._rows: Optional[List[Dict]] = None
+        self._mapping: Dict[str, Jurisdiction] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_client(cls, client, ttl: Optional[float] = None, cache_path: Optional[str] = None) -> 'JurisdictionResolver':
+        """Resolver over a Supabase client, configured from JURISDICTION_CACHE_TTL / _PATH."""
+        if ttl is None:
+            ttl = float(os.getenv('JURISDICTION_CACHE_TTL', 300))
+        if cache_path is None:
+            cache_path = os.getenv('JURISDICTION_CACHE_PATH') or None
+        return cls(lambda: fetch_all(client, 'jurisdictions', JURISDICTION_COLUMNS), ttl=ttl,
+                   cache_path=cache_path)
+
+    def _fresh(self) -> bool:
+        return self._rows is not None and time.time() - self._loaded_at < self.ttl
+
+    def _read_disk(self) -> Optional[List[Dict]]:
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get('saved_at', 0) >= self.ttl:
+            return None
+        self._loaded_at = cached['saved_at']
+        return cached['rows']
+
+    def _write_disk(self, rows: List[Dict]):
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': self._loaded_at, 'rows': rows}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write jurisdiction cache {self.cache_path}: {e}")
+
+    def _load(self, use_disk: bool = True):
+        rows = self._read_disk() if use_disk else None
+        if rows is None:
+            rows = self.loader()
+            self._loaded_at = time.time()
+            self._write_disk(rows)
+        self._rows = rows
+        self._mapping = build_jurisdiction_map(rows)
+
+    def rows(self) -> List[Dict]:
+        """Raw jurisdictions rows (cached)."""
+        if not self._fresh():
+            with self._lock:
+                if not self._fresh():
+                    self._load()
+        return self._rows
+
+    def refresh(self) -> List[Dict]:
+        """Reload from the database now, bypassing both cache layers."""
+        with self._lock:
+            self._load(use_disk=False)
+            return self._rows
+
+    def mapping(self) -> Dict[str, Jurisdiction]:
+        """A copy of the code -> Jurisdiction map."""
+        self.rows()
+        return dict(self._mapping)
+
+    def resolve(self, code: str) -> Optional[Jurisdiction]:
+        self.rows()
+        return self._mapping.get((code or '').strip())
+
+    def invalidate(self):
+        """Drop the in-process and on-disk caches (call after writing jurisdictions)."""
+        with self._lock:
+            self._rows = None
+            self._mapping = {}
+            if self.cache_path:
+                try:
+                    os.remove(self.cache_path)
+                except FileNotFoundError:
+                    pass
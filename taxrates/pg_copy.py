@@ -0,0 +1,194 @@
+"""
+Direct PostgreSQL bulk-load backend (optional).
+
+PostgREST caps every write at one JSON request per batch, so a full
+historical load is hours of 500-row round trips. With ``DATABASE_URL`` set
+(the Supabase connection string), loaders can instead stream rows through
+``COPY ... FROM STDIN`` into a temporary staging table and merge them into
+the real table with one set-based ``INSERT ... SELECT``, all in a single
+transaction.
+
+psycopg2 is only imported when a connection is opened, so the app and the
+PostgREST code paths never need it.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+RATE_COLUMNS = ('rate_version_id', 'jurisdiction_id', 'business_code', 'state_rate', 'county_rate', 'city_rate')
+RATE_KEY = ('rate_version_id', 'jurisdiction_id', 'business_code')
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+class MergeResult(NamedTuple):
+    staged: int
+    inserted: int
+    updated: int
+
+
+def connect(dsn: Optional[str] = None):
+    """Open a psycopg2 connection to ``dsn`` (default: DATABASE_URL)."""
+    dsn = dsn or os.getenv('DATABASE_URL')
+    if not dsn:
+        raise RuntimeError("Set DATABASE_URL to use the direct COPY backend")
+    import psycopg2
+    return psycopg2.connect(dsn)
+
+
+def ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (dict, list)):  # json / jsonb
+        value = json.dumps(value)
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class CopyStream:
+    """File-like object that renders dict rows as COPY text on demand."""
+
+    def __init__(self, rows: Iterable[Dict], columns: Sequence[str]):
+        self._rows = iter(rows)
+        self._columns = columns
+        self._buffer = b''
+        self.count = 0
+
+    def _next_line(self) -> Optional[bytes]:
+        row = next(self._rows, None)
+        if row is None:
+            return None
+        self.count += 1
+        return ('\t'.join(copy_value(row.get(c)) for c in self._columns) + '\n').encode('utf-8')
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = self._next_line()
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def merge_rows(conn, table: str, columns: Sequence[str], rows: Iterable[Dict], key: Sequence[str],
+               update: Sequence[str] = (), commit: bool = True) -> MergeResult:
+    """COPY ``rows`` into a staging table, then merge them into ``table``.
+
+    Rows whose ``key`` already exists are updated (only the ``update``
+    columns, and only if they differ) or left alone; the rest are inserted.
+    Duplicate keys within ``rows`` collapse to the last one staged, as they
+    would in a dict keyed in memory (``_seq`` records the COPY order).
+    """
+    stage = ident(f"_stage_{table}")
+    cols = ', '.join(ident(c) for c in columns)
+    keys = ', '.join(ident(k) for k in key)
+    match = ' AND '.join(f"t.{ident(k)} = s.{ident(k)}" for k in key)
+
+    stream = CopyStream(rows, columns)
+    updated = 0
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+                    f"SELECT {cols} FROM {ident(table)} WITH NO DATA")
+        cur.execute(f"ALTER TABLE {stage} ADD COLUMN _seq bigserial")
+        cur.copy_expert(f"COPY {stage} ({cols}) FROM STDIN", stream)
+        if update:
+            assignments = ', '.join(f"{ident(c)} = s.{ident(c)}" for c in update)
+            changed = ' OR '.join(f"t.{ident(c)} IS DISTINCT FROM s.{ident(c)}" for c in update)
+            cur.execute(f"UPDATE {ident(table)} t SET {assignments} "
+                        f"FROM (SELECT DISTINCT ON ({keys}) * FROM {stage} ORDER BY {keys}, _seq DESC) s "
+                        f"WHERE {match} AND ({changed})")
+            updated = cur.rowcount
+        cur.execute(f"INSERT INTO {ident(table)} ({cols}) "
+                    f"SELECT DISTINCT ON ({keys}) {cols} FROM {stage} s "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {ident(table)} t WHERE {match}) "
+                    f"ORDER BY {keys}, s._seq DESC")
+        inserted = cur.rowcount
+        cur.execute(f"DROP TABLE {stage}")
+    if commit:
+        conn.commit()
+    return MergeResult(stream.count, inserted, updated)
+
+
+def merge_rates(conn, rows: Iterable[Dict], commit: bool = True) -> MergeResult:
+    """Insert rate rows whose (rate_version_id, jurisdiction_id, business_code) is new."""
+    return merge_rows(conn, 'rates', RATE_COLUMNS, rows, RATE_KEY, commit=commit)
+
+
+def scale_high_rates(conn, threshold: float, version_id: Optional[int] = None,
+                     apply: bool = False) -> Dict[int, int]:
+    """Divide the rates of every row with ``total_rate > threshold`` by 100 (the 100x bug).
+
+    One set-based UPDATE for all versions, or just ``version_id``'s; without
+    ``apply`` the rows are only counted. Returns {rate_version_id: rows}.
+    """
+    where = "total_rate > %s"
+    params: tuple = (threshold,)
+    if version_id is not None:
+        where += " AND rate_version_id = %s"
+        params += (version_id,)
+    if apply:
+        scaled = ', '.join(f"{c} = round(coalesce({c}, 0)::numeric / 100, 6)"
+                           for c in ('state_rate', 'county_rate', 'city_rate'))
+        sql = (f"WITH fixed AS (UPDATE rates SET {scaled} WHERE {where} RETURNING rate_version_id) "
+               f"SELECT rate_version_id, count(*) FROM fixed GROUP BY 1 ORDER BY 1")
+    else:
+        sql = f"SELECT rate_version_id, count(*) FROM rates WHERE {where} GROUP BY 1 ORDER BY 1"
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            counts = {vid: n for vid, n in cur.fetchall()}
+        if apply:
+            conn.commit()
+        else:
+            conn.rollback()
+        return counts
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def reset_id_sequence(conn, table: str):
+    """Move ``table``'s id sequence past rows restored with explicit ids."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"COALESCE((SELECT max(id) FROM {ident(table)}), 1))", (table,))
+
+
+def restore_tables(conn, rate_versions: List[Dict], rates: Iterable[Dict],
+                   removals: Sequence[Dict] = ()) -> MergeResult:
+    """Replace rate_versions / rates / rate_removals with backup rows (explicit ids) in one transaction.
+
+    The rate_versions columns are those of the first row, so a dump with the
+    delta storage columns (storage, base_version_id, diff_summary) keeps them.
+    Deleting rate_versions cascades to rate_removals; ``removals`` are
+    written back after the rates. Returns the rates merge result.
+    """
+    version_columns = tuple(rate_versions[0]) if rate_versions else ('id', 'effective_date')
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM rates")
+            cur.execute("DELETE FROM rate_versions")
+        merge_rows(conn, 'rate_versions', version_columns, rate_versions, ('id',), commit=False)
+        result = merge_rows(conn, 'rates', ('id',) + RATE_COLUMNS, rates, ('id',), commit=False)
+        if removals:
+            merge_rows(conn, 'rate_removals', RATE_KEY, removals, RATE_KEY, commit=False)
+        reset_id_sequence(conn, 'rate_versions')
+        reset_id_sequence(conn, 'rates')
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
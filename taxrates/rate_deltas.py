@@ -0,0 +1,277 @@
+"""
+Delta-encoded rate versions.
+
+A monthly ADOR file restates ~4,600 rates that are almost all unchanged
+(June vs May 2026: nothing changed, one rate added). In delta storage a
+rate_version marked ``storage = 'delta'`` holds only the rows that were
+added or changed relative to its ``base_version_id``, plus a
+``rate_removals`` row for every (jurisdiction, business_code) pair that
+disappeared. Every ``CHECKPOINT_EVERY`` versions (and whenever there is no
+predecessor) the full set is written instead (``storage = 'full'``), so
+reconstructing any version reads one checkpoint and at most that many
+small deltas.
+
+``VersionStore.rows`` rebuilds a version's full rate set;
+``VersionStore.rate_for`` answers a single pair by walking the chain
+backwards. The schema this needs (two rate_versions columns and the
+rate_removals table) is in docs/delta-rate-versions.md.
+"""
+
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from taxrates.db import fetch_all, insert_batches
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_EVERY = int(os.getenv('RATE_CHECKPOINT_EVERY', '12'))
+
+RATE_FIELDS = ('state_rate', 'county_rate', 'city_rate')
+ROW_COLUMNS = 'id, rate_version_id, jurisdiction_id, business_code, state_rate, county_rate, city_rate'
+
+# (region code, business code, label) of the rates 007_sync_stripe_tax_rates.py syncs to Stripe
+WATCHED_RATES = (('PE', '214', 'Peoria city'), ('MAR', '014', 'Maricopa County'))
+
+Key = Tuple[int, str]
+
+
+def rate_key(row: Dict) -> Key:
+    return row['jurisdiction_id'], (row['business_code'] or '').strip()
+
+
+def rate_values(row: Dict) -> Tuple[float, ...]:
+    """The compared part of a row (6 decimals, ADOR's precision)."""
+    return tuple(round(float(row.get(f) or 0), 6) for f in RATE_FIELDS)
+
+
+def total_rate(row: Optional[Dict]) -> Optional[float]:
+    if row is None:
+        return None
+    return round(sum(rate_values(row)), 6)
+
+
+class RateDelta(NamedTuple):
+    added: List[Dict]
+    changed: List[Dict]
+    removed: List[Key]
+    unchanged: int
+
+    @property
+    def rows(self) -> List[Dict]:
+        """Rows a delta version stores (added + changed)."""
+        return self.added + self.changed
+
+    def touched(self, keys: Iterable[Key]) -> List[Key]:
+        """Which of ``keys`` were added, changed or removed."""
+        moved = {rate_key(r) for r in self.rows} | set(self.removed)
+        return [key for key in keys if key in moved]
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.removed)} removed, {self.unchanged} unchanged")
+
+    def as_dict(self) -> Dict:
+        return {'added': len(self.added), 'changed': len(self.changed),
+                'removed': len(self.removed), 'unchanged': self.unchanged}
+
+
+def diff_rates(base: Dict[Key, Dict], rows: Iterable[Dict]) -> RateDelta:
+    """Compare a full rate set against ``base`` (key -> row, e.g. from ``VersionStore.rows``)."""
+    added, changed, seen = [], [], set()
+    unchanged = 0
+    for row in rows:
+        key = rate_key(row)
+        if key in seen:
+            continue
+        seen.add(key)
+        previous = base.get(key)
+        if previous is None:
+            added.append(row)
+        elif rate_values(previous) != rate_values(row):
+            changed.append(row)
+        else:
+            unchanged += 1
+    removed = sorted(key for key in base if key not in seen)
+    return RateDelta(added, changed, removed, unchanged)
+
+
+def apply_delta(state: Dict[Key, Dict], rows: Iterable[Dict], removed: Iterable[Key]) -> Dict[Key, Dict]:
+    """Apply one delta version to a reconstructed state (in place)."""
+    for key in removed:
+        state.pop(key, None)
+    for row in rows:
+        state[rate_key(row)] = row
+    return state
+
+
+def version_chain(versions: Dict[int, Dict], version_id: int) -> List[Dict]:
+    """Versions to read for ``version_id`` (id -> rate_versions row): its checkpoint first,
+    then each delta in order."""
+    chain, seen = [], set()
+    current = versions.get(version_id)
+    if current is None:
+        raise KeyError(f"Unknown rate_version {version_id}")
+    while current is not None:
+        if current['id'] in seen:
+            raise ValueError(f"rate_version {version_id} has a cyclic delta chain")
+        seen.add(current['id'])
+        chain.append(current)
+        if current.get('storage') != 'delta':
+            break
+        base = versions.get(current.get('base_version_id'))
+        if base is None:
+            raise ValueError(f"Delta rate_version {current['id']} has no base version")
+        current = base
+    chain.reverse()
+    return chain
+
+
+def fetch_removals(client, version_id: Optional[int] = None) -> List[Dict]:
+    """rate_removals rows (all, or one version's); empty where the table doesn't exist yet."""
+    filters = {} if version_id is None else {'rate_version_id': version_id}
+    try:
+        return fetch_all(client, 'rate_removals', 'rate_version_id, jurisdiction_id, business_code',
+                         order='jurisdiction_id', **filters)
+    except Exception as e:
+        logger.debug(f"No rate_removals: {e}")
+        return []
+
+
+class VersionStore:
+    """Reads and writes delta-encoded rate versions through a Supabase client."""
+
+    def __init__(self, client, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.client = client
+        self.checkpoint_every = max(1, checkpoint_every)
+        self._versions: Optional[Dict[int, Dict]] = None
+
+    # -- version metadata ----------------------------------------------------
+
+    def versions(self) -> Dict[int, Dict]:
+        if self._versions is None:
+            try:
+                rows = fetch_all(self.client, 'rate_versions', 'id, effective_date, storage, base_version_id')
+            except Exception as e:
+                # Schema without delta storage: every version is a full one
+                logger.debug(f"rate_versions has no storage columns: {e}")
+                rows = fetch_all(self.client, 'rate_versions', 'id, effective_date')
+            self._versions = {v['id']: v for v in rows}
+        return self._versions
+
+    def ordered(self) -> List[Dict]:
+        return sorted(self.versions().values(), key=lambda v: (str(v['effective_date'])[:10], v['id']))
+
+    def predecessor(self, version_id: int) -> Optional[Dict]:
+        """The version before ``version_id`` in (effective_date, id) order."""
+        ordered = self.ordered()
+        pos = next((i for i, v in enumerate(ordered) if v['id'] == version_id), None)
+        if pos is None:
+            raise KeyError(f"Unknown rate_version {version_id}")
+        return ordered[pos - 1] if pos else None
+
+    def chain(self, version_id: int) -> List[Dict]:
+        """Versions to read for ``version_id``: its checkpoint first, then each delta in order."""
+        return version_chain(self.versions(), version_id)
+
+    # -- reconstruction --------------------------------------------------------
+
+    def rows(self, version_id: int, jurisdiction_ids: Optional[Iterable[int]] = None) -> Dict[Key, Dict]:
+        """Full rate set of ``version_id`` (key -> row), whatever its storage.
+
+        ``jurisdiction_ids`` restricts it to those jurisdictions' rows.
+        """
+        wanted = None if jurisdiction_ids is None else set(jurisdiction_ids)
+        filters = {} if wanted is None else {'jurisdiction_id': sorted(wanted)}
+        state: Dict[Key, Dict] = {}
+        if wanted is not None and not wanted:
+            return state
+        for version in self.chain(version_id):
+            rows = fetch_all(self.client, 'rates', ROW_COLUMNS, rate_version_id=version['id'], **filters)
+            removed = ([] if version.get('storage') != 'delta'
+                       else [rate_key(r) for r in fetch_removals(self.client, version['id'])
+                             if wanted is None or r['jurisdiction_id'] in wanted])
+            apply_delta(state, rows, removed)
+        return state
+
+    def rate_for(self, version_id: int, jurisdiction_id: int, business_code: str) -> Optional[Dict]:
+        """One pair's row as of ``version_id``: the newest row in its chain, unless removed since."""
+        for version in reversed(self.chain(version_id)):
+            res = (
+                self.client.table('rates').select(ROW_COLUMNS)
+                .eq('rate_version_id', version['id'])
+                .eq('jurisdiction_id', jurisdiction_id)
+                .eq('business_code', business_code)
+                .limit(1)
+                .execute()
+            )
+            if res.data:
+                return res.data[0]
+            if version.get('storage') != 'delta':
+                return None
+            removed = (
+                self.client.table('rate_removals').select('jurisdiction_id')
+                .eq('rate_version_id', version['id'])
+                .eq('jurisdiction_id', jurisdiction_id)
+                .eq('business_code', business_code)
+                .limit(1)
+                .execute()
+            )
+            if removed.data:
+                return None
+        return None
+
+    # -- writing ---------------------------------------------------------------
+
+    def plan(self, version_id: int, force_full: bool = False) -> Tuple[str, Optional[int]]:
+        """(storage, base_version_id) for a version about to be written."""
+        base = None if force_full else self.predecessor(version_id)
+        if base is None or len(self.chain(base['id'])) >= self.checkpoint_every:
+            return 'full', None
+        return 'delta', base['id']
+
+    def diff(self, version_id: int, rows: Iterable[Dict]) -> RateDelta:
+        """``rows`` (a full rate set for ``version_id``) against the version before it."""
+        previous = self.predecessor(version_id)
+        return diff_rates(self.rows(previous['id']) if previous else {}, rows)
+
+    def record_diff(self, version_id: int, summary: Dict) -> bool:
+        """Store a load's diff summary on rate_versions.diff_summary; False if the column is missing."""
+        try:
+            self.client.table('rate_versions').update({'diff_summary': summary}).eq('id', version_id).execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Could not record diff summary on rate_version {version_id}: {e}")
+            return False
+
+    def write_version(self, version_id: int, rows: List[Dict], force_full: bool = False,
+                      insert: Optional[Callable[[List[Dict]], Tuple[int, int]]] = None,
+                      log: Callable = print) -> Tuple[RateDelta, str, int, int]:
+        """Store the full rate set ``rows`` for ``version_id`` as a checkpoint or a delta.
+
+        Re-running is safe: rows and removals already stored for the version
+        are skipped. Returns (delta vs predecessor, storage, inserted, failed);
+        the delta is reported even when a full checkpoint is written.
+        """
+        insert = insert or (lambda batch: insert_batches(self.client, 'rates', batch, log=log))
+        storage, base_id = self.plan(version_id, force_full)
+        delta = self.diff(version_id, rows)
+        wanted = [dict(r, rate_version_id=version_id) for r in (delta.rows if storage == 'delta' else rows)]
+
+        stored = {rate_key(r) for r in fetch_all(self.client, 'rates', 'id, jurisdiction_id, business_code',
+                                                  rate_version_id=version_id)}
+        to_insert = [r for r in wanted if rate_key(r) not in stored]
+        inserted, failed = insert(to_insert) if to_insert else (0, 0)
+
+        if storage == 'delta' and delta.removed:
+            already = {rate_key(r) for r in fetch_removals(self.client, version_id)}
+            removals = [{'rate_version_id': version_id, 'jurisdiction_id': jid, 'business_code': code}
+                        for jid, code in delta.removed if (jid, code) not in already]
+            if removals:
+                insert_batches(self.client, 'rate_removals', removals, log=log)
+
+        self.client.table('rate_versions').update(
+            {'storage': storage, 'base_version_id': base_id}).eq('id', version_id).execute()
+        if self._versions is not None and version_id in self._versions:
+            self._versions[version_id].update(storage=storage, base_version_id=base_id)
+        return delta, storage, inserted, failed
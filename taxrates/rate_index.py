@@ -0,0 +1,211 @@
+"""
+In-memory point-lookup index over the full rate history.
+
+Every (jurisdiction_id, business_code) pair keeps a sorted array of the
+effective dates it has a rate for, so "what was the rate for region X,
+business code Y on date Z" is a dict hit plus a binary search — no Supabase
+round trip. The answer is the row from the latest rate_version whose
+effective_date is on or before Z *and* that carries the pair, which matches
+how the historical AZTaxesRpt loads only record rate changes. A
+``rate_removals`` row (delta-stored versions, see taxrates/rate_deltas.py)
+ends a pair's rate from that version's date until a later row restores it.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from taxrates.db import fetch_all
+from taxrates.jurisdictions import build_jurisdiction_map
+from taxrates.rate_deltas import fetch_removals
+
+logger = logging.getLogger(__name__)
+
+
+class RateLookup(NamedTuple):
+    jurisdiction_id: int
+    business_code: str
+    rate_version_id: int
+    effective_date: str
+    state_rate: float
+    county_rate: float
+    city_rate: float
+
+    @property
+    def total_rate(self) -> float:
+        return round(self.state_rate + self.county_rate + self.city_rate, 6)
+
+    def as_dict(self) -> Dict:
+        d = self._asdict()
+        d['total_rate'] = self.total_rate
+        return d
+
+
+def to_ordinal(value) -> int:
+    """ISO date string / date -> proleptic ordinal (what the index sorts on)."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+def build_code_map(jurisdictions: Iterable[Dict]) -> Dict[str, int]:
+    """region_code/city_code -> jurisdiction_id, county records win on code clashes."""
+    return {code: j.id for code, j in build_jurisdiction_map(jurisdictions).items()}
+
+
+class RateIndex:
+    """Sorted effective-date arrays per (jurisdiction_id, business_code)."""
+
+    def __init__(self):
+        self.code_map: Dict[str, int] = {}
+        self._dates: Dict[Tuple[int, str], List[int]] = {}
+        self._entries: Dict[Tuple[int, str], List[Optional[RateLookup]]] = {}  # None: removed
+        self.version_count = 0
+        self.row_count = 0
+        self.built_at = time.time()
+
+    @classmethod
+    def from_rows(cls, jurisdictions: Iterable[Dict], rate_versions: Iterable[Dict],
+                  rates: Iterable[Dict], removals: Iterable[Dict] = ()) -> 'RateIndex':
+        index = cls()
+        index.code_map = build_code_map(jurisdictions)
+
+        versions = {v['id']: str(v['effective_date'])[:10] for v in rate_versions}
+        index.version_count = len(versions)
+
+        # (ordinal, version_id, entry) per key; sorted once at the end
+        staged: Dict[Tuple[int, str], List[Tuple[int, int, RateLookup]]] = {}
+        for r in rates:
+            eff = versions.get(r['rate_version_id'])
+            if eff is None:
+                continue
+            key = (r['jurisdiction_id'], (r['business_code'] or '').strip())
+            entry = RateLookup(
+                jurisdiction_id=key[0],
+                business_code=key[1],
+                rate_version_id=r['rate_version_id'],
+                effective_date=eff,
+                state_rate=float(r.get('state_rate') or 0),
+                county_rate=float(r.get('county_rate') or 0),
+                city_rate=float(r.get('city_rate') or 0),
+            )
+            staged.setdefault(key, []).append((to_ordinal(eff), r['rate_version_id'], entry))
+            index.row_count += 1
+        for r in removals:
+            eff = versions.get(r['rate_version_id'])
+            if eff is not None:
+                key = (r['jurisdiction_id'], (r['business_code'] or '').strip())
+                staged.setdefault(key, []).append((to_ordinal(eff), r['rate_version_id'], None))
+
+        for key, items in staged.items():
+            items.sort(key=lambda t: (t[0], t[1], t[2] is not None))
+            dates: List[int] = []
+            entries: List[Optional[RateLookup]] = []
+            for ordinal, _, entry in items:
+                # Several versions on one date: the highest version id wins
+                if dates and dates[-1] == ordinal:
+                    entries[-1] = entry
+                else:
+                    dates.append(ordinal)
+                    entries.append(entry)
+            index._dates[key] = dates
+            index._entries[key] = entries
+        return index
+
+    @classmethod
+    def load(cls, client) -> 'RateIndex':
+        """Build the index from Supabase (jurisdictions, rate_versions, rates)."""
+        started = time.monotonic()
+        index = cls.from_rows(
+            fetch_all(client, 'jurisdictions', 'id, city_code, region_code, level'),
+            fetch_all(client, 'rate_versions', 'id, effective_date'),
+            fetch_all(client, 'rates', 'id, rate_version_id, jurisdiction_id, business_code, '
+                                       'state_rate, county_rate, city_rate'),
+            fetch_removals(client),
+        )
+        logger.info(f"Built rate index: {index.row_count} rates, {len(index._dates)} keys, "
+                    f"{index.version_count} versions in {time.monotonic() - started:.1f}s")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def resolve_region(self, region_code: str) -> Optional[int]:
+        return self.code_map.get((region_code or '').strip())
+
+    def lookup_id(self, jurisdiction_id: int, business_code: str, on_date=None) -> Optional[RateLookup]:
+        """Rate in force for a jurisdiction id on ``on_date`` (default: today)."""
+        key = (jurisdiction_id, (business_code or '').strip())
+        dates = self._dates.get(key)
+        if not dates:
+            return None
+        i = bisect_right(dates, to_ordinal(on_date or date.today()))
+        if i == 0:
+            return None
+        return self._entries[key][i - 1]
+
+    def lookup(self, region_code: str, business_code: str, on_date=None) -> Optional[RateLookup]:
+        """Rate in force for an ADOR region code on ``on_date`` (default: today)."""
+        jurisdiction_id = self.resolve_region(region_code)
+        if jurisdiction_id is None:
+            return None
+        return self.lookup_id(jurisdiction_id, business_code, on_date)
+
+    def history(self, jurisdiction_id: int, business_code: str) -> List[RateLookup]:
+        return [e for e in self._entries.get((jurisdiction_id, (business_code or '').strip()), []) if e]
+
+
+class CachedRateIndex:
+    """Process-wide index that is rebuilt once it is older than ``ttl`` seconds.
+
+    Only the first build (and the first after ``invalidate``) makes callers
+    wait. Once the TTL runs out, lookups keep getting the current index
+    while one background thread loads the next. If that load fails, the old
+    index stays in service and the load is retried after ``retry_after``
+    seconds.
+    """
+
+    def __init__(self, loader, ttl: float = 300.0, retry_after: float = 30.0):
+        self.loader = loader
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._index = None
+        self._loaded_at = 0.0
+        self._generation = 0  # bumped by invalidate(), so a refresh started before it is discarded
+        self._lock = threading.Lock()
+
+    def get(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._store(self._generation, self.loader())
+                return self._index
+        if time.monotonic() - self._loaded_at >= self.ttl and self._lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh, args=(self._generation,), daemon=True,
+                             name='rate-index-refresh').start()
+        return index
+
+    def _store(self, generation: int, index):
+        if generation == self._generation:
+            self._index = index
+            self._loaded_at = time.monotonic()
+
+    def _refresh(self, generation: int):
+        """Background reload; runs holding ``_lock``, which it releases."""
+        try:
+            self._store(generation, self.loader())
+        except Exception as e:
+            logger.error(f"Index refresh failed, still serving the previous one: {e}")
+            self._loaded_at = time.monotonic() - self.ttl + self.retry_after
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._generation += 1
+        self._index = None
@@ -0,0 +1,354 @@
+"""
+Per-version effective rate matrix.
+
+A city's rate for a business code is its own row plus the county row for
+the county it sits in (``jurisdictions.county_name``), and the county levies
+some activities under a different code (Peoria rental 214 is Maricopa
+County 014). Instead of every consumer repeating that join, the matrix
+materialises it once per rate_version: a dense (jurisdiction x business
+code) grid of state / county / city components, carried forward so each
+version holds the rates in force on its effective date (the historical
+loads only record changes, delta-stored versions also record removals).
+
+Rates are stored as integer micro-units (``round(rate * 1e6)``, exact for
+ADOR's 6-decimal rates) in uint32 slabs; consecutive versions that change
+nothing share one slab. ``save`` writes the same layout as the snapshot
+files (magic, header, aligned blocks) and ``open`` memory-maps it, so a
+lookup is a dict hit, a binary search over version dates and three array
+reads.
+
+A matrix built from Supabase carries the ``versions_freshness`` tag of the
+rates it was built from. Every rates writer refreshes the version hashes
+that tag covers, so ``current_rate_matrix`` only trusts a saved file while
+its tag still matches and rebuilds it otherwise, whichever script loaded
+the rates.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from taxrates.db import fetch_all
+from taxrates.rate_deltas import fetch_removals
+from taxrates.rate_index import build_code_map, to_ordinal
+from taxrates.version_hashes import FRESHNESS_COLUMNS, versions_freshness
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CCRM'
+FORMAT_VERSION = 1
+ALIGN = 8
+MISSING = 0xFFFFFFFF
+MICRO = 1_000_000
+
+# City business code -> the code its county levies the same activity under
+COUNTY_BUSINESS_CODES = {'214': '014'}
+
+STATE, COUNTY, CITY = range(3)
+
+
+class CombinedRate(NamedTuple):
+    jurisdiction_id: int
+    business_code: str
+    rate_version_id: int
+    effective_date: str
+    state_rate: float
+    county_rate: float
+    city_rate: float
+
+    @property
+    def total_rate(self) -> float:
+        return round(self.state_rate + self.county_rate + self.city_rate, 6)
+
+    def as_dict(self) -> Dict:
+        d = self._asdict()
+        d['total_rate'] = self.total_rate
+        return d
+
+
+def to_micro(value) -> int:
+    return int(round(float(value or 0) * MICRO))
+
+
+def county_parents(jurisdictions: Iterable[Dict]) -> Dict[int, int]:
+    """City jurisdiction id -> id of the level='county' jurisdiction named in its county_name."""
+    jurisdictions = list(jurisdictions)
+    counties = {(j.get('county_name') or '').strip().lower(): j['id']
+                for j in jurisdictions if j.get('level') == 'county' and j.get('county_name')}
+    parents = {}
+    for j in jurisdictions:
+        if j.get('level') == 'county':
+            continue
+        parent = counties.get((j.get('county_name') or '').strip().lower())
+        if parent is not None:
+            parents[j['id']] = parent
+    return parents
+
+
+class RateMatrix:
+    """Dense per-version grid of combined rates (see module docstring)."""
+
+    def __init__(self, header: Dict, data: Sequence[int]):
+        self.header = header
+        self.data = data  # uint32 micro-rates: slab, component, cell
+        self.jurisdiction_ids: List[int] = header['jurisdictions']
+        self.codes: List[str] = header['codes']
+        self.code_map: Dict[str, int] = header['code_map']
+        self.versions: List[Tuple[int, str, int]] = [tuple(v) for v in header['versions']]
+        self.built_at = header.get('built_at', time.time())
+        self._j_pos = {jid: i for i, jid in enumerate(self.jurisdiction_ids)}
+        self._b_pos = {code: i for i, code in enumerate(self.codes)}
+        self._dates = [to_ordinal(eff) for _, eff, _ in self.versions]
+        self.cells = len(self.jurisdiction_ids) * len(self.codes)
+        self._mm = None
+        self._file = None
+
+    # -- building -----------------------------------------------------------
+
+    @classmethod
+    def from_rows(cls, jurisdictions: Iterable[Dict], rate_versions: Iterable[Dict], rates: Iterable[Dict],
+                  county_codes: Optional[Dict[str, str]] = None, removals: Iterable[Dict] = ()) -> 'RateMatrix':
+        county_codes = COUNTY_BUSINESS_CODES if county_codes is None else county_codes
+        jurisdictions = list(jurisdictions)
+        parents = county_parents(jurisdictions)
+
+        by_version: Dict[int, List[Dict]] = {}
+        j_ids, codes = set(), set()
+        for r in rates:
+            code = (r['business_code'] or '').strip()
+            by_version.setdefault(r['rate_version_id'], []).append(r)
+            j_ids.add(r['jurisdiction_id'])
+            codes.add(code)
+        removed_by_version: Dict[int, List[Dict]] = {}
+        for r in removals:
+            removed_by_version.setdefault(r['rate_version_id'], []).append(r)
+        j_ids = sorted(j_ids)
+        codes = sorted(codes)
+        j_pos = {jid: i for i, jid in enumerate(j_ids)}
+        b_pos = {code: i for i, code in enumerate(codes)}
+        n_codes, cells = len(codes), len(j_ids) * len(codes)
+
+        # For each cell, the cell of the county rate that stacks on it (or -1)
+        county_cell = array('q', [-1]) * cells
+        for jid, parent in parents.items():
+            if jid not in j_pos or parent not in j_pos:
+                continue
+            for code, b in b_pos.items():
+                target = b_pos.get(county_codes.get(code, code))
+                if target is not None:
+                    county_cell[j_pos[jid] * n_codes + b] = j_pos[parent] * n_codes + target
+
+        own = [array('I', [0]) * cells for _ in range(3)]
+        present = bytearray(cells)
+        slabs: List[bytes] = []
+        versions = []
+        ordered = sorted(rate_versions, key=lambda v: (str(v['effective_date'])[:10], v['id']))
+        for v in ordered:
+            rows = by_version.get(v['id'], [])
+            removed = removed_by_version.get(v['id'], [])
+            if rows or removed or not slabs:
+                for r in removed:
+                    j, b = j_pos.get(r['jurisdiction_id']), b_pos.get((r['business_code'] or '').strip())
+                    if j is not None and b is not None:
+                        present[j * n_codes + b] = 0
+                for r in rows:
+                    cell = j_pos[r['jurisdiction_id']] * n_codes + b_pos[(r['business_code'] or '').strip()]
+                    own[STATE][cell] = to_micro(r.get('state_rate'))
+                    own[COUNTY][cell] = to_micro(r.get('county_rate'))
+                    own[CITY][cell] = to_micro(r.get('city_rate'))
+                    present[cell] = 1
+                slab = cls._combine(own, present, county_cell).tobytes()
+                if not slabs or slab != slabs[-1]:
+                    slabs.append(slab)
+            versions.append((v['id'], str(v['effective_date'])[:10], len(slabs) - 1))
+
+        header = {
+            'built_at': time.time(),
+            'jurisdictions': j_ids,
+            'codes': codes,
+            'code_map': build_code_map(jurisdictions),
+            'county_codes': county_codes,
+            'versions': versions,
+            'slabs': len(slabs),
+        }
+        data = array('I', b''.join(slabs)) if slabs else array('I')
+        return cls(header, data)
+
+    @staticmethod
+    def _combine(own: List[array], present: bytearray, county_cell: array) -> array:
+        """One slab (state, county, city blocks) from the carried-forward own rows."""
+        cells = len(present)
+        slab = array('I', [MISSING]) * (3 * cells)
+        state, county, city = own
+        for cell in range(cells):
+            parent = county_cell[cell]
+            has_parent = parent >= 0 and present[parent]
+            if not present[cell] and not has_parent:
+                continue
+            if present[cell]:
+                slab[cell] = state[cell]
+                slab[cells + cell] = county[cell]
+                slab[2 * cells + cell] = city[cell]
+            else:
+                slab[cell] = slab[cells + cell] = slab[2 * cells + cell] = 0
+            if has_parent:
+                slab[cells + cell] += county[parent]
+        return slab
+
+    @classmethod
+    def load(cls, client) -> 'RateMatrix':
+        """Build from Supabase (jurisdictions, rate_versions, rates), stamped with the rates tag."""
+        started = time.monotonic()
+        versions = fetch_all(client, 'rate_versions', f'effective_date, {FRESHNESS_COLUMNS}')
+        matrix = cls.from_rows(
+            fetch_all(client, 'jurisdictions', 'id, level, city_code, region_code, county_name'),
+            versions,
+            fetch_all(client, 'rates', 'id, rate_version_id, jurisdiction_id, business_code, '
+                                       'state_rate, county_rate, city_rate'),
+            removals=fetch_removals(client),
+        )
+        matrix.header['rates_tag'] = versions_freshness(versions)[1]
+        logger.info(f"Built rate matrix: {len(matrix.jurisdiction_ids)} x {len(matrix.codes)} cells, "
+                    f"{len(matrix.versions)} versions in {matrix.header['slabs']} slabs "
+                    f"in {time.monotonic() - started:.1f}s")
+        return matrix
+
+    # -- persistence -------------------------------------------------------------
+
+    def save(self, path: str) -> int:
+        """Write to ``path`` (atomically); returns the file size."""
+        header_bytes = json.dumps(self.header, sort_keys=True).encode('utf-8')
+        start = len(MAGIC) + 8 + len(header_bytes)
+        start += (-start) % ALIGN
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<II', FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b'\0' * (start - f.tell()))
+            f.write(self.data.tobytes())
+            size = f.tell()
+        os.replace(tmp_path, path)
+        return size
+
+    @classmethod
+    def open(cls, path: str) -> 'RateMatrix':
+        """Memory-map a saved matrix; slabs are paged in as they are read."""
+        f = open(path, 'rb')
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != MAGIC:
+            mm.close()
+            f.close()
+            raise ValueError(f"{path} is not a rate matrix")
+        version, header_len = struct.unpack_from('<II', mm, 4)
+        if version != FORMAT_VERSION:
+            mm.close()
+            f.close()
+            raise ValueError(f"Unsupported rate matrix format version {version}")
+        header = json.loads(mm[12:12 + header_len].decode('utf-8'))
+        start = 12 + header_len
+        start += (-start) % ALIGN
+        matrix = cls(header, memoryview(mm)[start:].cast('I'))
+        matrix._mm, matrix._file = mm, f
+        return matrix
+
+    def close(self):
+        if self._mm is not None:
+            try:
+                self.data.release()
+                self._mm.close()
+            except BufferError:
+                pass  # a caller still holds a view; the map is freed with it
+            self._file.close()
+            self._mm = self._file = None
+
+    # -- lookups -------------------------------------------------------------------
+
+    def version_at(self, on_date=None) -> Optional[int]:
+        """Position of the version in force on ``on_date`` (latest effective_date <= it)."""
+        i = bisect_right(self._dates, to_ordinal(on_date or date.today()))
+        return i - 1 if i else None
+
+    def cell(self, jurisdiction_id: int, business_code: str) -> Optional[int]:
+        j = self._j_pos.get(jurisdiction_id)
+        b = self._b_pos.get((business_code or '').strip())
+        if j is None or b is None:
+            return None
+        return j * len(self.codes) + b
+
+    def lookup_id(self, jurisdiction_id: int, business_code: str, on_date=None) -> Optional[CombinedRate]:
+        """Combined rate for a jurisdiction id on ``on_date`` (default: today)."""
+        pos = self.version_at(on_date)
+        cell = self.cell(jurisdiction_id, business_code)
+        if pos is None or cell is None:
+            return None
+        version_id, effective_date, slab = self.versions[pos]
+        base = slab * 3 * self.cells + cell
+        state = self.data[base]
+        if state == MISSING:
+            return None
+        return CombinedRate(
+            jurisdiction_id=jurisdiction_id,
+            business_code=(business_code or '').strip(),
+            rate_version_id=version_id,
+            effective_date=effective_date,
+            state_rate=state / MICRO,
+            county_rate=self.data[base + self.cells] / MICRO,
+            city_rate=self.data[base + 2 * self.cells] / MICRO,
+        )
+
+    def lookup(self, region_code: str, business_code: str, on_date=None) -> Optional[CombinedRate]:
+        """Combined rate for an ADOR region code on ``on_date`` (default: today)."""
+        jurisdiction_id = self.code_map.get((region_code or '').strip())
+        if jurisdiction_id is None:
+            return None
+        return self.lookup_id(jurisdiction_id, business_code, on_date)
+
+    def lookup_place(self, city_id: Optional[int], county_id: Optional[int], business_code: str,
+                     on_date=None) -> Optional[CombinedRate]:
+        """Combined rate for a place given by its city and county jurisdiction ids.
+
+        Inside a city its cell already carries the county rate; outside any city
+        (``city_id`` None) the county's own rate applies, under the code the
+        county levies the activity as (214 -> 014).
+        """
+        if city_id is not None:
+            return self.lookup_id(city_id, business_code, on_date)
+        if county_id is None:
+            return None
+        code = (business_code or '').strip()
+        return self.lookup_id(county_id, self.header.get('county_codes', COUNTY_BUSINESS_CODES).get(code, code),
+                              on_date)
+
+
+def rates_tag(client) -> str:
+    """The current ``versions_freshness`` tag of the rates in Supabase."""
+    return versions_freshness(fetch_all(client, 'rate_versions', FRESHNESS_COLUMNS))[1]
+
+
+def current_rate_matrix(client, path: Optional[str] = None) -> RateMatrix:
+    """The matrix saved at ``path`` if it was built from the current rates, else a fresh build.
+
+    A stale (or unstamped) file is rebuilt and saved back to ``path``; if
+    the save fails the fresh matrix is still returned.
+    """
+    if path and os.path.exists(path):
+        matrix = RateMatrix.open(path)
+        if matrix.header.get('rates_tag') == rates_tag(client):
+            return matrix
+        matrix.close()
+        logger.info(f"Rate matrix {path} is older than the rates; rebuilding it")
+    matrix = RateMatrix.load(client)
+    if path:
+        try:
+            matrix.save(path)
+        except OSError as e:
+            logger.warning(f"Could not save rate matrix to {path}: {e}")
+    return matrix
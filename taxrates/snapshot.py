@@ -0,0 +1,345 @@
+"""
+Columnar snapshot of the rates database.
+
+Exports ``jurisdictions``, ``business_class_codes``, ``rate_versions``,
+``rates`` and ``rate_removals`` into one local file so analysis, diffing and
+verification can run offline instead of paging everything out of Supabase
+1,000 rows at a time. rate_versions keep their delta storage columns
+(``storage``, ``base_version_id``), so ``rates_for_version`` rebuilds a
+delta version through its chain the way ``VersionStore.rows`` does.
+
+File layout (all integers little-endian)::
+
+    b"CCRS" | u32 format version | u32 header length | JSON header | column blocks
+
+Every column is a contiguous, 8-byte aligned typed array:
+
+* ``q``  int64   (NULL stored as INT_NULL)
+* ``d``  float64 (NULL stored as NaN)
+* ``s``  int32 index into the shared string table (NULL stored as -1)
+
+The string table is an int64 offsets array plus one UTF-8 blob. Opening a
+snapshot memory-maps the file, so columns are zero-copy ``memoryview`` casts
+and only the pieces a caller touches are paged in.
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from taxrates.db import fetch_all
+from taxrates.rate_deltas import Key, apply_delta, rate_key, version_chain
+
+MAGIC = b'CCRS'
+FORMAT_VERSION = 1
+INT_NULL = -(2 ** 63)
+ALIGN = 8
+
+# table -> (order column, [(column, type code)])
+TABLES: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {
+    'jurisdictions': ('id', [
+        ('id', 'q'), ('level', 's'), ('state_code', 's'), ('city_code', 's'),
+        ('region_code', 's'), ('city_name', 's'), ('county_name', 's'),
+    ]),
+    'business_class_codes': ('code', [
+        ('code', 's'), ('description', 's'),
+    ]),
+    'rate_versions': ('id', [
+        ('id', 'q'), ('effective_date', 's'), ('loaded_at', 's'), ('storage', 's'), ('base_version_id', 'q'),
+    ]),
+    'rates': ('id', [
+        ('id', 'q'), ('rate_version_id', 'q'), ('jurisdiction_id', 'q'), ('business_code', 's'),
+        ('state_rate', 'd'), ('county_rate', 'd'), ('city_rate', 'd'),
+    ]),
+    'rate_removals': ('rate_version_id', [
+        ('rate_version_id', 'q'), ('jurisdiction_id', 'q'), ('business_code', 's'),
+    ]),
+}
+
+# Columns / tables that only exist once delta storage is migrated (docs/delta-rate-versions.md):
+# exported as NULL / empty from a database without them, and left out of an import when unset
+DELTA_STORAGE = {
+    'rate_versions': ('storage', 'base_version_id'),
+    'rate_removals': ('rate_version_id', 'jurisdiction_id', 'business_code'),
+}
+
+_ARRAY_CODES = {'q': 'q', 'd': 'd', 's': 'i'}
+
+
+class _StringTable:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def _encode_column(values: Sequence, type_code: str, strings: _StringTable) -> array:
+    if type_code == 'q':
+        return array('q', (INT_NULL if v is None else int(v) for v in values))
+    if type_code == 'd':
+        return array('d', (math.nan if v is None else float(v) for v in values))
+    return array('i', (strings.add(v) for v in values))
+
+
+def _pad(n: int) -> int:
+    return (-n) % ALIGN
+
+
+def write_snapshot(path: str, tables: Dict[str, List[Dict]], meta: Optional[Dict] = None) -> Dict[str, int]:
+    """Write row dicts for the tables in ``TABLES`` to ``path``; returns row counts."""
+    strings = _StringTable()
+    blocks: List[bytes] = []
+    header: Dict = {'created_at': datetime.now().isoformat(), 'meta': meta or {}, 'tables': {}}
+
+    for name, (_, columns) in TABLES.items():
+        rows = tables.get(name, [])
+        table_header = {'rows': len(rows), 'columns': {}}
+        for column, type_code in columns:
+            data = _encode_column([r.get(column) for r in rows], type_code, strings).tobytes()
+            table_header['columns'][column] = {'type': type_code, 'block': len(blocks), 'nbytes': len(data)}
+            blocks.append(data)
+        header['tables'][name] = table_header
+
+    encoded = [s.encode('utf-8') for s in strings.values]
+    offsets = array('q', [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    header['strings'] = {'count': len(encoded), 'offsets_block': len(blocks), 'blob_block': len(blocks) + 1}
+    blocks.append(offsets.tobytes())
+    blocks.append(b''.join(encoded))
+
+    # Resolve absolute, aligned offsets now that every block size is known
+    header_bytes = b''
+    while True:  # offsets depend on the header length, which depends on the offsets
+        position = len(MAGIC) + 8 + len(header_bytes)
+        position += _pad(position)
+        block_offsets = []
+        for block in blocks:
+            block_offsets.append(position)
+            position += len(block) + _pad(len(block))
+        header['block_offsets'] = block_offsets
+        new_header = json.dumps(header, sort_keys=True).encode('utf-8')
+        settled = len(new_header) == len(header_bytes)
+        header_bytes = new_header
+        if settled:
+            break
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for offset, block in zip(header['block_offsets'], blocks):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(block)
+    os.replace(tmp_path, path)
+    return {name: len(tables.get(name, [])) for name in TABLES}
+
+
+class SnapshotTable:
+    """Column access for one table of an open snapshot."""
+
+    def __init__(self, snapshot: 'Snapshot', name: str, header: Dict):
+        self.snapshot = snapshot
+        self.name = name
+        self.row_count = header['rows']
+        self._columns = header['columns']
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def raw(self, column: str) -> memoryview:
+        """Zero-copy typed view (int64 / float64 / int32 string ids) of a column."""
+        spec = self._columns[column]
+        return self.snapshot._block(spec['block'], spec['nbytes']).cast(_ARRAY_CODES[spec['type']])
+
+    def column(self, column: str) -> list:
+        """Decoded Python values for a column (NULLs as None)."""
+        type_code = self._columns[column]['type']
+        raw = self.raw(column)
+        if type_code == 'q':
+            return [None if v == INT_NULL else v for v in raw]
+        if type_code == 'd':
+            return [None if math.isnan(v) else v for v in raw]
+        strings = self.snapshot.strings
+        return [None if i < 0 else strings[i] for i in raw]
+
+    def row_at(self, i: int) -> Dict:
+        row = {}
+        for name, spec in self._columns.items():
+            v = self.raw(name)[i]
+            if spec['type'] == 'q':
+                v = None if v == INT_NULL else v
+            elif spec['type'] == 'd':
+                v = None if math.isnan(v) else v
+            else:
+                v = None if v < 0 else self.snapshot.strings[v]
+            row[name] = v
+        return row
+
+    def rows(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        names = list(columns or self._columns)
+        decoded = [self.column(c) for c in names]
+        for values in zip(*decoded):
+            yield dict(zip(names, values))
+
+
+class Snapshot:
+    """A memory-mapped snapshot file (use as a context manager or call close())."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a rates snapshot")
+        version, header_len = struct.unpack_from('<II', self._mm, 4)
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot format version {version}")
+        self.header = json.loads(self._mm[12:12 + header_len].decode('utf-8'))
+        self._view = memoryview(self._mm)
+        self._strings: Optional[List[str]] = None
+        self._versions: Optional[Dict[int, Dict]] = None
+        self.tables = {name: SnapshotTable(self, name, h) for name, h in self.header['tables'].items()}
+
+    @classmethod
+    def open(cls, path: str) -> 'Snapshot':
+        return cls(path)
+
+    def _block(self, block: int, nbytes: int) -> memoryview:
+        offset = self.header['block_offsets'][block]
+        return self._view[offset:offset + nbytes]
+
+    @property
+    def strings(self) -> List[str]:
+        if self._strings is None:
+            spec = self.header['strings']
+            count = spec['count']
+            offsets = self._block(spec['offsets_block'], (count + 1) * 8).cast('q')
+            blob_start = self.header['block_offsets'][spec['blob_block']]
+            blob = self._view[blob_start:blob_start + offsets[count]]
+            self._strings = [bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(count)]
+        return self._strings
+
+    def __getitem__(self, name: str) -> SnapshotTable:
+        return self.tables[name]
+
+    def rows(self, name: str, columns: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Rows of a table; empty for a table the file predates (rate_removals)."""
+        if name not in self.tables:
+            return []
+        return list(self.tables[name].rows(columns))
+
+    def stored_rates(self, version_id: int) -> List[Dict]:
+        """The rate rows stored under one rate_version, scanning the typed column directly."""
+        return self._rows_where('rates', version_id)
+
+    def rates_for_version(self, version_id: int) -> List[Dict]:
+        """Full rate set of one rate_version, whatever its storage (one row per key).
+
+        A delta version is rebuilt from its checkpoint and each delta in
+        order, removals applied, as ``VersionStore.rows`` does. Snapshots
+        without the storage columns treat every version as full.
+        """
+        if self._versions is None:
+            self._versions = {v['id']: v for v in self.rows('rate_versions')}
+        if version_id not in self._versions:
+            return []
+        state: Dict[Key, Dict] = {}
+        for version in version_chain(self._versions, version_id):
+            removed = ([] if version.get('storage') != 'delta'
+                       else [rate_key(r) for r in self._rows_where('rate_removals', version['id'])])
+            apply_delta(state, self.stored_rates(version['id']), removed)
+        return list(state.values())
+
+    def _rows_where(self, name: str, version_id: int) -> List[Dict]:
+        table = self.tables.get(name)
+        if table is None:
+            return []
+        version_ids = table.raw('rate_version_id')
+        wanted = [i for i, v in enumerate(version_ids) if v == version_id]
+        version_ids.release()
+        return [table.row_at(i) for i in wanted]
+
+    def close(self):
+        try:
+            if getattr(self, '_view', None) is not None:
+                self._view.release()
+            if getattr(self, '_mm', None) is not None:
+                self._mm.close()
+        except BufferError:
+            # A caller still holds a column view; the map is freed with it
+            pass
+        self._view = None
+        self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_snapshot(client, path: str, log=print) -> Dict[str, int]:
+    """Download the rate tables from Supabase and write them to ``path``."""
+    tables = {}
+    for name, (order, columns) in TABLES.items():
+        names = [c for c, _ in columns]
+        try:
+            tables[name] = fetch_all(client, name, ', '.join(names), order=order)
+        except Exception as e:
+            if name not in DELTA_STORAGE:
+                raise
+            # No delta storage yet: the rest of the columns, or an empty table
+            log(f"  {name}: no delta storage columns ({e})")
+            names = [c for c in names if c not in DELTA_STORAGE[name]]
+            tables[name] = fetch_all(client, name, ', '.join(names), order=order) if names else []
+        log(f"  {name}: {len(tables[name])} rows")
+    return write_snapshot(path, tables, meta={'source': os.getenv('SUPABASE_URL', '')})
+
+
+def import_snapshot(snapshot: Snapshot, client, tables: Sequence[str] = tuple(TABLES), batch_size: int = 500,
+                    log=print) -> Dict[str, int]:
+    """Upsert snapshot rows back into Supabase (parents before children).
+
+    rate_versions go in effective-date order so a delta's base is written
+    first; delta storage columns that are NULL throughout (a snapshot of a
+    database without them) are left out.
+    """
+    written = {}
+    for name in tables:
+        rows = snapshot.rows(name)
+        unset = [c for c in DELTA_STORAGE.get(name, ()) if all(r.get(c) is None for r in rows)]
+        if unset:
+            rows = [{k: v for k, v in r.items() if k not in unset} for r in rows]
+        if name == 'rate_versions':
+            rows.sort(key=lambda v: (str(v['effective_date'])[:10], v['id']))
+        count = 0
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            client.table(name).upsert(batch).execute()
+            count += len(batch)
+        written[name] = count
+        log(f"  {name}: {count} rows upserted")
+    return written
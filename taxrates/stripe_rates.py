@@ -0,0 +1,110 @@
+"""
+Index of our Stripe TaxRates keyed by ``metadata.cactuscomply_key``.
+
+``find_or_create_tax_rate`` in 007_sync_stripe_tax_rates.py used to list
+(and auto-page) every active Stripe TaxRate once per rate it resolved. The
+index lists them once per run, however many jurisdictions are tracked, and
+is kept up to date as rates are archived and created.
+
+With a ``cache_path`` the index is also written to a JSON file. A later run
+starts from that file and checks each entry it hands out by retrieving the
+cached object id from Stripe (still active, still ours, same percentage);
+the first entry that fails the check — or a key the file doesn't know —
+falls back to a single listing pass.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELD = 'cactuscomply_key'
+
+
+def _entry(tr) -> Dict:
+    return {'id': tr.id, 'percentage': float(tr.percentage), 'created': getattr(tr, 'created', 0) or 0}
+
+
+class TaxRateIndex:
+    """Active Stripe TaxRates by ``metadata.cactuscomply_key``; one listing pass per run at most."""
+
+    def __init__(self, stripe, cache_path: Optional[str] = None):
+        self.stripe = stripe
+        self.cache_path = cache_path
+        self.listings = 0
+        self._rates: Optional[Dict[str, Dict]] = None
+        self._listed = False           # _rates came from Stripe this run
+        self._confirmed: Set[str] = set()  # cached keys already checked against Stripe
+
+    def _list(self):
+        rates: Dict[str, Dict] = {}
+        for tr in self.stripe.TaxRate.list(active=True, limit=100).auto_paging_iter():
+            key = (tr.metadata or {}).get(KEY_FIELD)
+            # Several active rates under one key: the newest one is ours
+            if key and (key not in rates or _entry(tr)['created'] > rates[key]['created']):
+                rates[key] = _entry(tr)
+        self._rates, self._listed = rates, True
+        self.listings += 1
+        self._save()
+
+    def _load_cache(self) -> Optional[Dict[str, Dict]]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)['rates']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable tax rate cache {self.cache_path}: {e}")
+            return None
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            tmp = f"{self.cache_path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({'rates': self._rates}, f, indent=2)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write tax rate cache {self.cache_path}: {e}")
+
+    def _still_valid(self, key: str, entry: Dict) -> bool:
+        try:
+            tr = self.stripe.TaxRate.retrieve(entry['id'])
+        except Exception as e:
+            logger.info(f"Cached tax rate {entry['id']} for {key} not retrievable: {e}")
+            return False
+        return bool(tr.active) and (tr.metadata or {}).get(KEY_FIELD) == key \
+            and float(tr.percentage) == entry['percentage']
+
+    def get(self, key: str) -> Optional[Dict]:
+        """``{'id', 'percentage', 'created'}`` of our active rate for ``key``, or None."""
+        if self._rates is None:
+            cached = self._load_cache()
+            if cached is None:
+                self._list()
+            else:
+                self._rates = cached
+        entry = self._rates.get(key)
+        if self._listed or key in self._confirmed:
+            return entry
+        if entry is not None and self._still_valid(key, entry):
+            self._confirmed.add(key)
+            return entry
+        self._list()
+        return self._rates.get(key)
+
+    def put(self, key: str, tr):
+        """Record a newly created rate."""
+        if self._rates is None:
+            self._rates = {}
+        self._rates[key] = _entry(tr)
+        self._confirmed.add(key)
+        self._save()
+
+    def drop(self, key: str):
+        """Forget an archived rate."""
+        if self._rates is not None and self._rates.pop(key, None) is not None:
+            self._save()
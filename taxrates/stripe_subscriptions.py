@@ -0,0 +1,247 @@
+"""
+Concurrent, resumable update of subscriptions' default tax rates.
+
+007_sync_stripe_tax_rates.py used to walk every active subscription and
+call ``Subscription.modify`` one at a time, with no record of how far it
+got. ``SubscriptionUpdater``:
+
+- lists subscriptions once (100 per page) and filters them locally —
+  other products and already-correct subscriptions cost no extra calls;
+- sends the modifies through a bounded thread pool, spaced by a shared
+  ``RateLimiter`` to stay under Stripe's request rate, and retries 429 /
+  5xx / connection errors with exponential backoff;
+- gives every modify an idempotency key derived from the subscription and
+  the target tax rates, so a retry — or a resumed run — can never apply
+  an update twice;
+- appends progress to a checkpoint file (JSON lines): the ids it updated
+  and a listing cursor that only moves past a subscription once it and
+  everything listed before it are settled. A rerun for the same tax rates
+  continues from the cursor and skips ids already done; a failed
+  subscription holds the cursor, so it is retried next time.
+
+By default every subscription gets the same ``tax_rate_ids``. With
+``assign`` each subscription's rates come from ``assign(sub)`` instead
+(per-customer taxation, see taxrates/customer_tax.py); ``None`` means its
+jurisdiction could not be resolved and the subscription is left alone.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from taxrates.batch_writer import is_transient
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = {'RateLimitError', 'APIConnectionError'}
+
+
+def default_workers() -> int:
+    return max(1, int(os.getenv('STRIPE_WORKERS', 8)))
+
+
+def default_rate_limit() -> float:
+    # Stripe allows 100 requests/s in live mode and 25 in test mode
+    return float(os.getenv('STRIPE_RATE_LIMIT', 20))
+
+
+def is_retryable(exc: Exception) -> bool:
+    if getattr(exc, 'http_status', None) in RETRY_STATUSES:
+        return True
+    return type(exc).__name__ in RETRY_ERRORS or is_transient(exc)
+
+
+class RateLimiter:
+    """Spaces calls at most ``per_second`` apart across all threads."""
+
+    def __init__(self, per_second: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+
+class Checkpoint:
+    """Append-only progress file for one target set of tax rates (see module docstring)."""
+
+    def __init__(self, path: str, target: str):
+        self.path = path
+        self.target = target
+        self.done: Set[str] = set()
+        self.cursor: Optional[str] = None
+        self._load()
+
+    def _load(self):
+        lines = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0].get('target') != self.target:
+            # Nothing saved, or progress towards different tax rates: start over
+            with open(self.path, 'w') as f:
+                f.write(json.dumps({'target': self.target}) + '\n')
+            return
+        for entry in lines[1:]:
+            if 'done' in entry:
+                self.done.add(entry['done'])
+            if 'cursor' in entry:
+                self.cursor = entry['cursor']
+
+    def _append(self, entry: Dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+
+    def mark_done(self, subscription_id: str):
+        self.done.add(subscription_id)
+        self._append({'done': subscription_id})
+
+    def advance(self, subscription_id: str):
+        self.cursor = subscription_id
+        self._append({'cursor': subscription_id})
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UpdateResult(NamedTuple):
+    updated: int
+    skipped: int   # already had the target tax rates
+    ignored: int   # not one of our products
+    resumed: int   # done by an earlier, interrupted run
+    failed: List[Tuple[str, str]]  # (subscription id, error)
+    unresolved: int = 0  # assign() had no rates for it
+
+
+class SubscriptionUpdater:
+    """Point every active subscription of ``product_ids`` at ``tax_rate_ids``."""
+
+    def __init__(self, stripe, product_ids: Iterable[str], tax_rate_ids: List[str],
+                 checkpoint_path: Optional[str] = None, workers: Optional[int] = None,
+                 rate_limit: Optional[float] = None, retries: int = 4, backoff: float = 1.0,
+                 sleep: Callable[[float], None] = time.sleep, log: Callable = print,
+                 assign: Optional[Callable[[object], Optional[List[str]]]] = None,
+                 target: Optional[str] = None, list_params: Optional[Dict] = None):
+        self.stripe = stripe
+        self.product_ids = set(product_ids)
+        self.tax_rate_ids = list(tax_rate_ids)
+        self.assign = assign or (lambda sub: self.tax_rate_ids)
+        # Names what the checkpoint is progress towards; a different target starts over
+        self.target = target or ','.join(sorted(self.tax_rate_ids))
+        self.list_params = list_params or {}
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers or default_workers()
+        self.limiter = RateLimiter(default_rate_limit() if rate_limit is None else rate_limit, sleep=sleep)
+        self.retries = retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.log = log
+
+    def idempotency_key(self, subscription_id: str, tax_rate_ids: List[str]) -> str:
+        digest = hashlib.sha256(','.join(sorted(tax_rate_ids)).encode('utf-8')).hexdigest()[:16]
+        return f"cc-tax-sync-{subscription_id}-{digest}"
+
+    def _modify(self, subscription_id: str, tax_rate_ids: List[str]):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                return self.stripe.Subscription.modify(
+                    subscription_id, default_tax_rates=tax_rate_ids,
+                    idempotency_key=self.idempotency_key(subscription_id, tax_rate_ids))
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                self.sleep(self.backoff * (2 ** attempt))
+
+    def is_ours(self, sub) -> bool:
+        return bool({item.price.product for item in sub["items"]["data"]} & self.product_ids)
+
+    @staticmethod
+    def has_rates(sub, tax_rate_ids: List[str]) -> bool:
+        return {tr.id for tr in (sub.default_tax_rates or [])} == set(tax_rate_ids)
+
+    def run(self, dry_run: bool = False) -> UpdateResult:
+        checkpoint = None
+        if self.checkpoint_path and not dry_run:
+            checkpoint = Checkpoint(self.checkpoint_path, self.target)
+        params = dict(self.list_params, status='active', limit=100)
+        if checkpoint and checkpoint.cursor:
+            params['starting_after'] = checkpoint.cursor
+            self.log(f"  Resuming after {checkpoint.cursor} ({len(checkpoint.done)} already updated)")
+
+        counts = {'updated': 0, 'skipped': 0, 'ignored': 0, 'resumed': 0, 'unresolved': 0}
+        failed: List[Tuple[str, str]] = []
+        listed: deque = deque()   # ids in listing order, not yet behind the cursor
+        settled: Set[str] = set()
+        stuck: Set[str] = set()   # failed ids; the cursor stops at the first
+
+        def settle(subscription_id: str):
+            settled.add(subscription_id)
+            last = None
+            while listed and listed[0] in settled and listed[0] not in stuck:
+                last = listed.popleft()
+            if last and checkpoint:
+                checkpoint.advance(last)
+
+        def harvest(done_futures):
+            for future in done_futures:
+                subscription_id = pending.pop(future)
+                try:
+                    future.result()
+                    counts['updated'] += 1
+                    if checkpoint:
+                        checkpoint.mark_done(subscription_id)
+                except Exception as e:
+                    logger.warning(f"Subscription {subscription_id} not updated: {e}")
+                    failed.append((subscription_id, str(e)))
+                    stuck.add(subscription_id)
+                settle(subscription_id)
+
+        pending: Dict = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stripe-sub') as pool:
+            for sub in self.stripe.Subscription.list(**params).auto_paging_iter():
+                listed.append(sub.id)
+                if checkpoint and sub.id in checkpoint.done:
+                    counts['resumed'] += 1
+                    settle(sub.id)
+                    continue
+                tax_rate_ids = self.assign(sub) if self.is_ours(sub) else None
+                if tax_rate_ids is None or self.has_rates(sub, tax_rate_ids):
+                    outcome = 'skipped' if tax_rate_ids is not None else \
+                        'unresolved' if self.is_ours(sub) else 'ignored'
+                    counts[outcome] += 1
+                    settle(sub.id)
+                    continue
+                if dry_run:
+                    self.log(f"  [DRY RUN] Would update subscription {sub.id} -> {', '.join(tax_rate_ids)}")
+                    counts['updated'] += 1
+                    settle(sub.id)
+                    continue
+                pending[pool.submit(self._modify, sub.id, tax_rate_ids)] = sub.id
+                if len(pending) >= self.workers * 2:
+                    harvest(wait(list(pending), return_when=FIRST_COMPLETED).done)
+            while pending:
+                harvest(wait(list(pending), return_when=FIRST_COMPLETED).done)
+
+        if checkpoint and not failed:
+            checkpoint.clear()
+        return UpdateResult(counts['updated'], counts['skipped'], counts['ignored'], counts['resumed'], failed,
+                            counts['unresolved'])
@@ -0,0 +1,208 @@
+"""
+Per-version / per-jurisdiction content hashes.
+
+"Are these two versions identical, and if not, which jurisdictions differ?"
+used to mean downloading both versions (4,600+ rows each, five PostgREST
+pages apiece) and comparing them key by key. Instead every version carries
+a small hash tree, written when it is loaded:
+
+- each (jurisdiction, business code) row hashes to a 128-bit leaf, once for
+  the key alone and once with its state / county / city rates;
+- a jurisdiction's bucket is the row count plus the leaf sums mod 2**128.
+  Sums don't depend on row order and can be rolled forward (``add`` /
+  ``remove``) without rehashing the rest;
+- the version root is a sha256 over the sorted buckets.
+
+Equal roots mean equal versions. Otherwise ``differing`` lists the
+jurisdictions whose buckets disagree and only their rows are fetched.
+Hashes are taken over the version's resolved rate set (delta versions
+rebuilt, one row per key), so a full and a delta-stored copy of the same
+rates compare equal.
+
+They are stored as JSON on ``rate_versions.row_hashes``; see the README for
+the column. Anything that rewrites a version's rows calls ``refresh_hashes``,
+so ``versions_freshness`` over the versions' roots and ``hashed_at`` stamps
+tells whether any rates changed (the API's ETag, the rate matrix file).
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from taxrates.rate_deltas import Key, RateDelta, VersionStore, diff_rates, rate_key, rate_values
+
+logger = logging.getLogger(__name__)
+
+MOD = 1 << 128
+
+# rate_versions columns behind ``versions_freshness``; root and hashed_at come out of row_hashes
+FRESHNESS_COLUMNS = 'id, loaded_at, root:row_hashes->>root, hashed_at:row_hashes->>hashed_at'
+
+
+def _leaf(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), 'big')
+
+
+def key_leaf(row: Dict) -> int:
+    jurisdiction_id, code = rate_key(row)
+    return _leaf(f"{jurisdiction_id}|{code}")
+
+
+def row_leaf(row: Dict) -> int:
+    jurisdiction_id, code = rate_key(row)
+    state, county, city = rate_values(row)
+    return _leaf(f"{jurisdiction_id}|{code}|{state:.6f}|{county:.6f}|{city:.6f}")
+
+
+class VersionHashes:
+    """Bucket hashes of one version's rate set (see module docstring)."""
+
+    def __init__(self, buckets: Optional[Dict[int, List[int]]] = None):
+        # jurisdiction_id -> [row count, key-leaf sum, row-leaf sum]
+        self.buckets: Dict[int, List[int]] = buckets or {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> 'VersionHashes':
+        """Hash a rate set; a key repeated in ``rows`` counts once (the first row, as in diff_rates)."""
+        unique: Dict = {}
+        for r in rows:
+            unique.setdefault(rate_key(r), r)
+        hashes = cls()
+        for row in unique.values():
+            hashes.add(row)
+        return hashes
+
+    def add(self, row: Dict):
+        bucket = self.buckets.setdefault(rate_key(row)[0], [0, 0, 0])
+        bucket[0] += 1
+        bucket[1] = (bucket[1] + key_leaf(row)) % MOD
+        bucket[2] = (bucket[2] + row_leaf(row)) % MOD
+
+    def remove(self, row: Dict):
+        jurisdiction_id = rate_key(row)[0]
+        bucket = self.buckets[jurisdiction_id]
+        bucket[0] -= 1
+        bucket[1] = (bucket[1] - key_leaf(row)) % MOD
+        bucket[2] = (bucket[2] - row_leaf(row)) % MOD
+        if bucket[0] == 0:
+            del self.buckets[jurisdiction_id]
+
+    @property
+    def rows(self) -> int:
+        return sum(b[0] for b in self.buckets.values())
+
+    @property
+    def root(self) -> str:
+        digest = hashlib.sha256()
+        for jurisdiction_id in sorted(self.buckets):
+            count, keys, values = self.buckets[jurisdiction_id]
+            digest.update(f"{jurisdiction_id}:{count}:{keys:032x}:{values:032x}\n".encode('ascii'))
+        return digest.hexdigest()
+
+    def identical(self, other: 'VersionHashes') -> bool:
+        return self.root == other.root
+
+    def differing(self, other: 'VersionHashes', keys_only: bool = False) -> List[int]:
+        """Jurisdictions whose buckets differ (or exist on one side only)."""
+        part = 1 if keys_only else 2
+        out = []
+        for jurisdiction_id in sorted(set(self.buckets) | set(other.buckets)):
+            mine, theirs = self.buckets.get(jurisdiction_id), other.buckets.get(jurisdiction_id)
+            if mine is None or theirs is None or mine[0] != theirs[0] or mine[part] != theirs[part]:
+                out.append(jurisdiction_id)
+        return out
+
+    def as_dict(self) -> Dict:
+        return {
+            'root': self.root,
+            'rows': self.rows,
+            'buckets': {str(jid): [b[0], f"{b[1]:032x}", f"{b[2]:032x}"] for jid, b in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> 'VersionHashes':
+        if isinstance(data, str):
+            data = json.loads(data)
+        return cls({int(jid): [count, int(keys, 16), int(values, 16)]
+                    for jid, (count, keys, values) in data['buckets'].items()})
+
+
+def load_hashes(client, version_ids: Iterable[int]) -> Dict[int, VersionHashes]:
+    """Stored hashes for ``version_ids`` in one query; versions without them are left out."""
+    version_ids = sorted(set(version_ids))
+    try:
+        res = client.table('rate_versions').select('id, row_hashes').in_('id', version_ids).execute()
+    except Exception as e:
+        logger.warning(f"Could not read version hashes: {e}")
+        return {}
+    return {r['id']: VersionHashes.from_dict(r['row_hashes']) for r in res.data if r.get('row_hashes')}
+
+
+def save_hashes(client, version_id: int, hashes: VersionHashes) -> bool:
+    """Store ``hashes`` on the version, stamped ``hashed_at`` (the API's rates change marker)."""
+    stored = dict(hashes.as_dict(), hashed_at=datetime.now(timezone.utc).isoformat())
+    try:
+        client.table('rate_versions').update({'row_hashes': stored}).eq('id', version_id).execute()
+        return True
+    except Exception as e:
+        logger.warning(f"Could not store hashes on rate_version {version_id}: {e}")
+        return False
+
+
+def refresh_hashes(client, version_id: int, store: Optional[VersionStore] = None) -> VersionHashes:
+    """Rehash a version from its stored rows and save the result."""
+    hashes = VersionHashes.from_rows((store or VersionStore(client)).rows(version_id).values())
+    save_hashes(client, version_id, hashes)
+    return hashes
+
+
+def parse_timestamp(value) -> datetime:
+    """Parse a Postgres timestamp string into an aware UTC datetime."""
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def versions_freshness(versions: Iterable[Dict]) -> Tuple[Optional[datetime], str]:
+    """(last_modified, tag) for rate_versions rows read with ``FRESHNESS_COLUMNS``.
+
+    last_modified is the latest loaded_at / hashed_at; the tag also folds in
+    every version's hash root, the newest version id and the version count,
+    so any rates write (or a deleted version) changes it.
+    """
+    versions = list(versions)
+    stamps = [parse_timestamp(v[column]) for v in versions for column in ('loaded_at', 'hashed_at')
+              if v.get(column)]
+    last_modified = max(stamps) if stamps else None
+    max_id = max((v['id'] for v in versions), default=0)
+    roots = hashlib.sha1(''.join(f"{v['id']}:{v.get('root') or '-'}\n"
+                                 for v in sorted(versions, key=lambda v: v['id'])).encode()).hexdigest()[:16]
+    tag = f"{last_modified.isoformat() if last_modified else '-'}:{max_id}:{len(versions)}:{roots}"
+    return last_modified, tag
+
+
+def diff_against_version(client, version_id: int, rows: Iterable[Dict], also: Iterable[int] = (),
+                         store: Optional[VersionStore] = None) -> Tuple[RateDelta, Dict[Key, Dict]]:
+    """``diff_rates(<version's rate set>, rows)``, reading only the jurisdictions whose buckets differ.
+
+    ``also`` names jurisdictions to read regardless (e.g. ones the caller
+    reports on). Returns the delta (``unchanged`` includes the skipped
+    buckets) and the version rows that were read. Without stored hashes the
+    whole version is read.
+    """
+    store = store or VersionStore(client)
+    rows = list(rows)
+    stored = load_hashes(client, [version_id]).get(version_id)
+    if stored is None:
+        base = store.rows(version_id)
+        return diff_rates(base, rows), base
+
+    drill = set(stored.differing(VersionHashes.from_rows(rows))) | set(also)
+    base = store.rows(version_id, drill)
+    delta = diff_rates(base, [r for r in rows if rate_key(r)[0] in drill])
+    skipped = sum(bucket[0] for jid, bucket in stored.buckets.items() if jid not in drill)
+    logger.info(f"rate_version {version_id}: read {len(drill)} of {len(stored.buckets)} jurisdiction buckets")
+    return delta._replace(unchanged=delta.unchanged + skipped), base
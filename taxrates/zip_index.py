@@ -0,0 +1,184 @@
+"""
+Offline ZIP / ZIP+4 -> jurisdiction index.
+
+Rates are keyed by ADOR region code, but customers give us a ZIP code. A
+ZIP can straddle a city boundary, so the mapping file may list ZIP+4
+ranges as well as whole ZIPs. It is a CSV with a header row::
+
+    zip,plus4_low,plus4_high,city_code,county_code
+    85382,,,PE,MAR              # the whole ZIP
+    85383,0001,4999,PE,MAR      # a ZIP+4 range
+    85383,5000,9999,,MAR        # unincorporated: county only
+
+``city_code`` is matched against level='city' jurisdictions and
+``county_code`` against level='county' ones (by city_code or region_code),
+so a row resolves to a (city id, county id) pair; a blank county_code
+takes the city's county (``county_name``).
+
+``ZipIndex`` keeps two sorted integer arrays — ZIP+4 range starts (the
+9-digit ZIP as an int) and whole ZIPs — with parallel arrays of city and
+county ids, so a lookup is one or two binary searches. A ZIP with no
+whole-ZIP row takes the pair covering most of its ZIP+4 ranges and is
+flagged ``ambiguous`` when its ranges disagree; a 9-digit lookup inside a
+range is always exact. ``lookup_rate`` goes straight from a ZIP to the
+combined rate in a ``RateMatrix``.
+"""
+
+import csv
+import logging
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from taxrates.rate_matrix import CombinedRate, RateMatrix, county_parents
+
+logger = logging.getLogger(__name__)
+
+NONE = -1  # no city (unincorporated) / no county in the id arrays
+
+
+class ZipJurisdictions(NamedTuple):
+    city_id: Optional[int]
+    county_id: Optional[int]
+    ambiguous: bool = False  # whole-ZIP answer for a ZIP that spans several jurisdictions
+
+
+def normalize_zip(value) -> Optional[Tuple[int, Optional[int]]]:
+    """'85382', '85382-1234', '853821234' -> (zip5, plus4 or None); None if malformed."""
+    digits = ''.join(ch for ch in str(value or '') if ch.isdigit())
+    if len(digits) == 5:
+        return int(digits), None
+    if len(digits) == 9:
+        return int(digits[:5]), int(digits[5:])
+    return None
+
+
+def _codes(jurisdictions: Iterable[Dict]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """(city code -> city id, county code -> county id)."""
+    cities, counties = {}, {}
+    for j in jurisdictions:
+        target = counties if j.get('level') == 'county' else cities
+        for code in (j.get('city_code'), j.get('region_code')):
+            if code:
+                target.setdefault(code.strip(), j['id'])
+    return cities, counties
+
+
+class ZipIndex:
+    """Sorted-array ZIP / ZIP+4 -> (city id, county id) index (see module docstring)."""
+
+    def __init__(self):
+        self.starts = array('I')   # ZIP+4 ranges: zip5 * 10000 + plus4_low
+        self.ends = array('I')
+        self.range_city = array('i')
+        self.range_county = array('i')
+        self.zips = array('I')     # whole ZIPs
+        self.zip_city = array('i')
+        self.zip_county = array('i')
+        self.zip_ambiguous = bytearray()
+        self.skipped = 0
+        self.built_at = time.time()
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], jurisdictions: Iterable[Dict]) -> 'ZipIndex':
+        """Build from mapping-file rows; rows with an unknown code, a bad ZIP or a bad
+        ZIP+4 range are skipped. Overlapping ranges or a ZIP listed twice raise ValueError."""
+        jurisdictions = list(jurisdictions)
+        cities, counties = _codes(jurisdictions)
+        parents = county_parents(jurisdictions)
+        index = cls()
+        ranges: List[Tuple[int, int, int, int]] = []
+        whole: Dict[int, Tuple[int, int]] = {}
+        coverage: Dict[int, Dict[Tuple[int, int], int]] = {}  # zip5 -> pair -> ZIP+4 values covered
+
+        for row in rows:
+            parsed = normalize_zip(row.get('zip'))
+            city_code = (row.get('city_code') or '').strip()
+            county_code = (row.get('county_code') or '').strip()
+            city = cities.get(city_code) if city_code else NONE
+            county = counties.get(county_code) if county_code else NONE
+            low, high = (row.get('plus4_low') or '').strip(), (row.get('plus4_high') or '').strip()
+            if county == NONE and city not in (None, NONE):
+                county = parents.get(city, NONE)
+            if parsed is None or city is None or county is None or (city == NONE and county == NONE) \
+                    or any(v and not v.isdigit() for v in (low, high)):
+                index.skipped += 1
+                continue
+            zip5, plus4 = parsed
+            if plus4 is not None:
+                low = high = plus4
+            elif low:
+                low, high = int(low), int(high or low)
+                if low > high or high > 9999:
+                    index.skipped += 1
+                    continue
+            else:
+                if zip5 in whole:
+                    raise ValueError(f"ZIP {zip5:05d} is listed twice as a whole ZIP")
+                whole[zip5] = (city, county)
+                continue
+            ranges.append((zip5 * 10000 + low, zip5 * 10000 + high, city, county))
+            pairs = coverage.setdefault(zip5, {})
+            pairs[(city, county)] = pairs.get((city, county), 0) + high - low + 1
+
+        ranges.sort()
+        for start, end, city, county in ranges:
+            if index.ends and start <= index.ends[-1]:
+                raise ValueError(f"Overlapping ZIP+4 ranges at {start // 10000:05d}-{start % 10000:04d}")
+            index.starts.append(start)
+            index.ends.append(end)
+            index.range_city.append(city)
+            index.range_county.append(county)
+
+        for zip5 in sorted(set(whole) | set(coverage)):
+            pairs = coverage.get(zip5, {})
+            pair = whole.get(zip5) or max(pairs, key=pairs.get)
+            index.zips.append(zip5)
+            index.zip_city.append(pair[0])
+            index.zip_county.append(pair[1])
+            index.zip_ambiguous.append(int(any(p != pair for p in pairs)))
+        if index.skipped:
+            logger.warning(f"ZIP index: skipped {index.skipped} rows with a bad ZIP, range or unknown code")
+        return index
+
+    @classmethod
+    def load(cls, path: str, jurisdictions: Iterable[Dict]) -> 'ZipIndex':
+        """Build from the CSV mapping file at ``path``."""
+        started = time.monotonic()
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            index = cls.from_rows(csv.DictReader(f), jurisdictions)
+        logger.info(f"Built ZIP index: {len(index.zips)} ZIPs, {len(index.starts)} ZIP+4 ranges "
+                    f"in {time.monotonic() - started:.2f}s")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.zips)
+
+    @staticmethod
+    def _pair(city: int, county: int, ambiguous: bool = False) -> ZipJurisdictions:
+        return ZipJurisdictions(None if city == NONE else city, None if county == NONE else county, ambiguous)
+
+    def lookup(self, zip_code) -> Optional[ZipJurisdictions]:
+        """Jurisdiction ids for a 5- or 9-digit ZIP, or None if it isn't in the file."""
+        parsed = normalize_zip(zip_code)
+        if parsed is None:
+            return None
+        zip5, plus4 = parsed
+        if plus4 is not None:
+            key = zip5 * 10000 + plus4
+            i = bisect_right(self.starts, key) - 1
+            if i >= 0 and self.ends[i] >= key:
+                return self._pair(self.range_city[i], self.range_county[i])
+        i = bisect_right(self.zips, zip5) - 1
+        if i < 0 or self.zips[i] != zip5:
+            return None
+        return self._pair(self.zip_city[i], self.zip_county[i], bool(self.zip_ambiguous[i]))
+
+    def lookup_rate(self, matrix: RateMatrix, zip_code, business_code: str,
+                    on_date=None) -> Optional[CombinedRate]:
+        """Combined rate for a ZIP on ``on_date``: ZIP -> jurisdictions -> matrix cell."""
+        place = self.lookup(zip_code)
+        if place is None:
+            return None
+        return matrix.lookup_place(place.city_id, place.county_id, business_code, on_date)
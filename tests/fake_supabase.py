@@ -0,0 +1,253 @@
+"""
+In-memory stand-in for the supabase-py client used by the tests.
+
+Supports the subset of the PostgREST query builder the app and scripts use:
+select / eq / neq / gt / gte / lt / lte / in_ / ilike / or_ / order / limit /
+range and
+insert / upsert / update / delete, plus a call log so tests can assert on
+round trips.
+"""
+
+import fnmatch
+
+
+class FakeResult:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeAPIError(RuntimeError):
+    """Raised for ``fail_when``; ``code`` is the SQLSTATE it returned, if any."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table_name = table
+        self.filters = []
+        self.action = 'select'
+        self.payload = None
+        self._order = []
+        self._limit = None
+        self._range = None
+        self._count = None
+
+    # --- builders -------------------------------------------------------
+
+    def select(self, columns='*', count=None):
+        self.action = 'select'
+        self._count = count
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.action, self.payload = 'upsert', payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def in_(self, column, values):
+        return self._filter(column, 'in', list(values))
+
+    def ilike(self, column, pattern):
+        return self._filter(column, 'ilike', pattern)
+
+    def or_(self, expression):
+        """PostgREST or=(...) with ``col.op.value`` clauses (eq, ilike, in)."""
+        clauses, depth, current = [], 0, ''
+        for ch in expression:
+            if ch == ',' and depth == 0:
+                clauses.append(current)
+                current = ''
+                continue
+            depth += ch == '('
+            depth -= ch == ')'
+            current += ch
+        clauses.append(current)
+        parsed = []
+        for clause in clauses:
+            column, op, value = clause.split('.', 2)
+            if op == 'in':
+                value = [int(v) if v.isdigit() else v for v in value.strip('()').split(',')]
+            elif op == 'ilike':
+                value = value.replace('*', '%')
+            parsed.append((column, op, value))
+        return self._filter(None, 'or', parsed)
+
+    def order(self, column, desc=False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    # --- execution ------------------------------------------------------
+
+    def _matches(self, row):
+        for column, op, value in self.filters:
+            if op == 'or':
+                if not any(FakeQuery._clause(row, c, o, v) for c, o, v in value):
+                    return False
+                continue
+            if not FakeQuery._clause(row, column, op, value):
+                return False
+        return True
+
+    @staticmethod
+    def _clause(row, column, op, value):
+        cell = row.get(column)
+        if op == 'eq':
+            return cell == value
+        if op == 'neq':
+            return cell != value
+        if op == 'in':
+            return cell in value
+        if op == 'ilike':
+            return cell is not None and fnmatch.fnmatch(str(cell).lower(), value.replace('%', '*').lower())
+        if cell is None:
+            return False
+        return {'gt': cell > value, 'gte': cell >= value, 'lt': cell < value, 'lte': cell <= value}[op]
+
+    def execute(self):
+        self.client.calls.append((self.table_name, self.action))
+        failure = self.client.fail_when and self.client.fail_when(self)
+        if failure:
+            raise FakeAPIError(f"simulated failure on {self.table_name}.{self.action}",
+                               failure if isinstance(failure, str) else None)
+
+        rows = self.client.tables.setdefault(self.table_name, [])
+        if self.action in ('insert', 'upsert'):
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            written = []
+            for record in payload:
+                record = dict(record)
+                if 'id' not in record and self.table_name != 'business_class_codes':
+                    record['id'] = self.client.next_id(self.table_name)
+                key = self.client.primary_keys.get(self.table_name, 'id')
+                existing = next((r for r in rows if r.get(key) == record.get(key)), None)
+                if existing is not None and self.action == 'upsert':
+                    existing.update(record)
+                else:
+                    rows.append(record)
+                written.append(record)
+            return FakeResult(written)
+
+        matched = [r for r in rows if self._matches(r)]
+        if self.action == 'update':
+            for r in matched:
+                r.update(self.payload)
+            return FakeResult(matched)
+        if self.action == 'delete':
+            self.client.tables[self.table_name] = [r for r in rows if r not in matched]
+            return FakeResult(matched)
+
+        # Apply the last (least significant) sort key first; sorted() is stable
+        for column, desc in reversed(self._order):
+            matched = sorted(matched, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        total = len(matched)
+        if self._range:
+            start, end = self._range
+            matched = matched[start:end + 1]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return FakeResult([dict(r) for r in matched], count=total if self._count else None)
+
+
+class FakeSupabase:
+    """Minimal supabase Client replacement backed by dict rows."""
+
+    def __init__(self, tables=None):
+        self.tables = {name: [dict(r) for r in rows] for name, rows in (tables or {}).items()}
+        self.calls = []
+        self.rpc_calls = []
+        self.rpc_handlers = {}
+        self.fail_when = None
+        self.primary_keys = {'business_class_codes': 'code'}
+
+    def next_id(self, table):
+        ids = [r.get('id') or 0 for r in self.tables.get(table, [])]
+        return max(ids, default=0) + 1
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        self.rpc_calls.append((name, params or {}))
+        handler = self.rpc_handlers[name]
+
+        class _Rpc:
+            def execute(_self):
+                return FakeResult(handler(params or {}))
+
+        return _Rpc()
+
+    def count(self, table, action=None):
+        return sum(1 for t, a in self.calls if t == table and (action is None or a == action))
+
+
+class AsyncFakeQuery:
+    """FakeQuery whose ``execute()`` is awaitable, like postgrest's async builders."""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def chain(*args, **kwargs):
+            return AsyncFakeQuery(method(*args, **kwargs))
+        return chain
+
+    async def execute(self):
+        return self._query.execute()
+
+
+class AsyncFakeSupabase:
+    """AsyncClient stand-in over a FakeSupabase (shares its tables and call log)."""
+
+    def __init__(self, sync: FakeSupabase):
+        self.sync = sync
+
+    def table(self, name):
+        return AsyncFakeQuery(self.sync.table(name))
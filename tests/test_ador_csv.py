@@ -0,0 +1,83 @@
+"""
+Tests for the columnar ADOR CSV parser.
+"""
+import io
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from taxrates.ador_csv import AdorColumns, iter_date_batches, parse_rate, parse_rate_date
+
+MONTHLY = "\ufeff" + """RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate
+PE,Peoria,214,Restaurants,1.8%
+MAR,Maricopa County,014,Personal Property Rental,1
+TU,Tucson,017,Retail,0
+PH,Phoenix,017,Retail,n/a
+,Blank,017,Retail,2.0
+"""
+
+HISTORICAL = """RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate,RateStartDate
+PE,Peoria,214,Restaurants,1.8,1/1/2021 12:00:00 AM
+PE,Peoria,214,Restaurants,1.9,07/01/2023 0:00
+PE,Peoria,214,Restaurants,0,2024-01-01
+PE,Peoria,214,Restaurants,2.0,not a date
+"""
+
+
+def test_scalar_helpers():
+    assert parse_rate('2.4%') == 0.024
+    assert parse_rate(' 1 ') == 0.01  # 1% is not 100%
+    assert parse_rate('n/a') == 0.0
+    assert parse_rate_date('1/1/2021 12:00:00 AM') == '2021-01-01'
+    assert parse_rate_date('07/01/2023 0:00') == '2023-07-01'
+    assert parse_rate_date('2024-01-01') == '2024-01-01'
+    assert parse_rate_date('13/45/2024') is None
+
+
+def test_monthly_file_validates_rows():
+    table = AdorColumns.from_text(MONTHLY)
+    assert len(table) == 5
+    assert table.effective_date is None
+    assert math.isnan(table.rate[3])
+    records = list(table.records(effective_date='2026-06-01'))
+    assert [(r['region_code'], r['rate']) for r in records] == [('PE', 0.018), ('MAR', 0.01)]
+    assert records[0]['effective_date'] == '2026-06-01'
+
+
+def test_historical_file_groups_by_date():
+    table = AdorColumns.from_text(HISTORICAL)
+    assert table.indices_by_date() == {'2021-01-01': [0], '2023-07-01': [1]}
+    kept = table.indices_by_date(positive_only=False)
+    assert kept['2024-01-01'] == [2]
+    assert [len(b) for b in table.batches(1, require_date=True, positive_only=False)] == [1, 1, 1]
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError, match='TaxRate'):
+        AdorColumns.from_text("RegionCode,BusinessCode\nPE,214\n")
+
+
+def test_iter_date_batches_streams_runs_of_dates():
+    text = HISTORICAL + "PE,Peoria,214,Restaurants,2.1,1/1/2021 12:00:00 AM\n"
+    batches = list(iter_date_batches(io.StringIO(text)))
+    assert [(d, [r['rate'] for r in recs]) for d, recs in batches] == [
+        ('2021-01-01', [0.018]),
+        ('2023-07-01', [0.019]),
+        ('2021-01-01', [0.021]),  # a date seen again later is a new batch
+    ]
+    assert batches[0][1][0]['region_name'] == 'Peoria'
+
+
+def test_iter_date_batches_is_lazy():
+    def lines():
+        yield "RegionCode,BusinessCode,TaxRate,RateStartDate\n"
+        yield "PE,214,1.8,1/1/2021\n"
+        yield "PE,214,1.9,1/1/2022\n"
+        raise AssertionError("read past the second batch")
+
+    first = next(iter_date_batches(lines()))
+    assert first[0] == '2021-01-01'
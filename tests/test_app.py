@@ -4,7 +4,8 @@ Basic tests for the Tax Rates Flask application.
 import pytest
 import os
 import sys
-from io import StringIO
+import time
+from io import BytesIO, StringIO
 
 # Add parent directory to path to import app
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -62,3 +63,393 @@ def test_app_routes_defined():
     assert '/upload' in routes
     assert '/rates' in routes
     assert '/api/rates' in routes
+
+
+def _sample_rates(n, region_codes=('PH', 'TU')):
+    rates = []
+    for i in range(n):
+        code = region_codes[i % len(region_codes)]
+        rates.append({
+            'region_code': code,
+            'region_name': code.title(),
+            'business_code': f'{i:03d}',
+            'business_name': f'Code {i}',
+            'state_rate': 0.0,
+            'county_rate': 0.0,
+            'city_rate': 0.025,
+        })
+    return rates
+
+
+def test_upsert_tax_rates_batches_writes(monkeypatch):
+    """Rates are resolved with one jurisdictions lookup and written in chunks."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase({'jurisdictions': [
+        {'id': 1, 'city_code': 'PH', 'level': 'city'},
+        {'id': 2, 'city_code': 'TU', 'level': 'city'},
+    ]})
+    monkeypatch.setattr(app, 'supabase', fake)
+    app.jurisdiction_resolver.invalidate()
+
+    count = app.upsert_tax_rates(_sample_rates(25), rate_version_id=7, uploader='test', chunk_size=10)
+
+    assert count == 25
+    assert fake.count('jurisdictions') == 1
+    assert fake.count('rates', 'insert') == 3
+    assert {r['jurisdiction_id'] for r in fake.tables['rates']} == {1, 2}
+
+
+def test_upsert_tax_rates_falls_back_per_row(monkeypatch):
+    """A chunk rejected for its content is split until only the bad rows are skipped."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase({'jurisdictions': [{'id': 1, 'city_code': 'PH', 'level': 'city'}]})
+    fake.fail_when = lambda q: (q.table_name == 'rates' and q.action == 'insert'
+                                and any(r['business_code'] == '003' for r in q.payload) and '23505')
+    monkeypatch.setattr(app, 'supabase', fake)
+    app.jurisdiction_resolver.invalidate()
+
+    count = app.upsert_tax_rates(_sample_rates(6, ('PH',)), rate_version_id=1, uploader='test', chunk_size=4)
+
+    assert count == 5
+    assert '003' not in {r['business_code'] for r in fake.tables['rates']}
+
+
+def test_upsert_tax_rates_does_not_resend_a_chunk_that_landed(monkeypatch):
+    """A chunk that committed but timed out is checked, not inserted twice."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase({'jurisdictions': [{'id': 1, 'city_code': 'PH', 'level': 'city'}]})
+    real_table = fake.table
+
+    def table(name):
+        query = real_table(name)
+        if name == 'rates' and not fake.tables.get('rates'):
+            write = query.execute
+
+            def commit_then_time_out():
+                write()
+                raise TimeoutError()
+            query.execute = commit_then_time_out
+        return query
+
+    monkeypatch.setattr(fake, 'table', table)
+    monkeypatch.setattr(app, 'supabase', fake)
+    app.jurisdiction_resolver.invalidate()
+
+    assert app.upsert_tax_rates(_sample_rates(4, ('PH',)), rate_version_id=1, uploader='test') == 4
+    assert len(fake.tables['rates']) == 4
+
+
+def test_upsert_tax_rates_routes_county_codes(monkeypatch):
+    """A code shared by a city and a county record loads into the county's county_rate."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase({'jurisdictions': [
+        {'id': 5, 'city_code': 'MAR', 'level': 'city'},
+        {'id': 71, 'region_code': 'MAR', 'level': 'county', 'county_name': 'Maricopa'},
+    ]})
+    monkeypatch.setattr(app, 'supabase', fake)
+    app.jurisdiction_resolver.invalidate()
+
+    assert app.upsert_tax_rates(_sample_rates(1, ('MAR',)), rate_version_id=1, uploader='test') == 1
+    row = fake.tables['rates'][0]
+    assert (row['jurisdiction_id'], row['county_rate'], row['city_rate']) == (71, 0.025, 0.0)
+
+
+def test_upsert_jurisdictions_invalidates_resolver(monkeypatch):
+    """New jurisdictions are visible to the next rate upsert."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase({'jurisdictions': [{'id': 1, 'city_code': 'PH', 'level': 'city'}]})
+    monkeypatch.setattr(app, 'supabase', fake)
+    app.jurisdiction_resolver.invalidate()
+
+    rates = _sample_rates(2, ('PH', 'TU'))
+    app.upsert_jurisdictions(rates)
+    assert app.upsert_tax_rates(rates, rate_version_id=1, uploader='test') == 2
+    assert {r['jurisdiction_id'] for r in fake.tables['rates']} == {1, 2}
+
+
+def test_async_upload_returns_job_id(monkeypatch):
+    """Async uploads are queued and their progress is served from /jobs/<id>."""
+    import app
+
+    from tests.fake_supabase import FakeSupabase
+
+    def fake_parse(csv_content, effective_date, uploader, progress=None, fingerprint=None):
+        progress(rows_parsed=2, rows_written=2, stage='writing')
+        return {'success': True, 'total_records': 2}
+
+    monkeypatch.setattr(app, 'supabase', FakeSupabase())
+    monkeypatch.setattr(app, 'parse_csv_content', fake_parse)
+    client = app.app.test_client()
+    data = {
+        'file': (BytesIO(b"RegionCode,TaxRate\nPH,2.5\n"), 'rates.csv'),
+        'effective_date': '2026-06-01',
+        'async': '1',
+    }
+    resp = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 202
+    job_id = resp.get_json()['job_id']
+
+    for _ in range(200):
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] == 'succeeded':
+            break
+        time.sleep(0.01)
+    assert job['status'] == 'succeeded'
+    assert job['rows_written'] == 2
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_identical_upload_is_skipped(monkeypatch):
+    """Re-submitting a loaded file is caught by its content fingerprint before any writes."""
+    import app
+    from taxrates.fingerprint import rates_fingerprint
+    from tests.fake_supabase import FakeSupabase
+
+    csv_content = ("RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate\n"
+                   "PH,Phoenix,017,Retail,2.3\nTU,Tucson,017,Retail,2.6\n")
+    reordered = ("RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate\n"
+                 "TU,Tucson,017,Retail, 2.60%\nPH,Phoenix,017,Retail,2.3\n")
+    fingerprint = rates_fingerprint('2026-06-01', [
+        {'region_code': 'PH', 'business_code': '017', 'rate': 0.023},
+        {'region_code': 'TU', 'business_code': '017', 'rate': 0.026}])
+    fake = FakeSupabase({'rate_versions': [
+        {'id': 120, 'effective_date': '2026-06-01', 'content_hash': fingerprint}]})
+    monkeypatch.setattr(app, 'supabase', fake)
+
+    result = app.parse_csv_content(reordered, '2026-06-01', 'test')
+    assert result['success'] and result['duplicate_of'] == 120
+    assert fake.calls == [('rate_versions', 'select')]
+
+    client = app.app.test_client()
+    data = {'file': (BytesIO(csv_content.encode()), 'rates.csv'), 'effective_date': '2026-06-01', 'async': '1'}
+    resp = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 200 and resp.get_json()['duplicate_of'] == 120
+
+    # Same rates, another month: a new version, not a duplicate
+    assert rates_fingerprint('2026-07-01', [{'region_code': 'PH', 'business_code': '017', 'rate': 0.023}]) \
+        != rates_fingerprint('2026-06-01', [{'region_code': 'PH', 'business_code': '017', 'rate': 0.023}])
+
+
+def test_partial_load_records_no_fingerprint(monkeypatch):
+    import app
+    from tests.fake_supabase import FakeSupabase
+
+    recorded = []
+    monkeypatch.setattr(app, 'supabase', FakeSupabase())
+    monkeypatch.setattr(app, 'upsert_business_codes', lambda rows: 1)
+    monkeypatch.setattr(app, 'upsert_jurisdictions', lambda rows: 2)
+    monkeypatch.setattr(app, 'create_rate_version', lambda *a: 121)
+    monkeypatch.setattr(app, 'refresh_hashes', lambda *a: None)
+    monkeypatch.setattr(app, 'materialize_rate_matrix', lambda: None)
+    monkeypatch.setattr(app, 'record_fingerprint', lambda client, vid, fp: recorded.append(vid))
+    csv_content = ("RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate\n"
+                   "PH,Phoenix,017,Retail,2.3\nTU,Tucson,017,Retail,2.6\n")
+
+    monkeypatch.setattr(app, 'upsert_tax_rates', lambda rows, *a, **kw: 1)
+    assert app.parse_csv_content(csv_content, '2026-06-01', 'test')['inserted_count'] == 1
+    assert recorded == []
+    monkeypatch.setattr(app, 'upsert_tax_rates', lambda rows, *a, **kw: len(rows))
+    app.parse_csv_content(csv_content, '2026-06-01', 'test')
+    assert recorded == [121]
+
+
+def test_api_rate_point_lookup(monkeypatch):
+    """/api/rate answers from the in-memory index."""
+    import app
+    from taxrates.rate_index import RateIndex
+
+    index = RateIndex.from_rows(
+        [{'id': 198, 'city_code': 'PE', 'level': 'city'}],
+        [{'id': 116, 'effective_date': '2026-05-01'}],
+        [{'rate_version_id': 116, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.018}],
+    )
+    monkeypatch.setattr(app.rate_index, 'get', lambda: index)
+    client = app.app.test_client()
+
+    resp = client.get('/api/rate?region_code=PE&business_code=214&date=2026-05-02')
+    assert resp.status_code == 200
+    assert resp.get_json()['total_rate'] == 0.018
+    assert client.get('/api/rate?region_code=PE&business_code=214&date=2026-04-30').status_code == 404
+    assert client.get('/api/rate?region_code=PE').status_code == 400
+
+
+def _rates_fake():
+    from tests.fake_supabase import FakeSupabase
+    return FakeSupabase({
+        'rate_versions': [
+            {'id': 116, 'effective_date': '2026-05-01', 'loaded_at': '2026-05-21T10:00:00+00:00'},
+            {'id': 117, 'effective_date': '2026-06-01', 'loaded_at': '2026-05-21T11:00:00+00:00'},
+        ],
+        'jurisdictions': [{'id': 198, 'city_code': 'PE'}, {'id': 71, 'city_code': None}],
+        'current_rates': [
+            {'id': i, 'rate_version_id': 117, 'jurisdiction_id': 198 if i % 2 else 71,
+             'business_code': f'{i:03d}', 'city_rate': 0.02, 'total_rate': 0.02}
+            for i in range(1, 6)
+        ],
+    })
+
+
+def test_api_rates_cursor_pagination_and_projection(monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'supabase', _rates_fake())
+    client = app.app.test_client()
+
+    resp = client.get('/api/rates?limit=2&fields=business_code,total_rate')
+    assert resp.status_code == 200
+    assert [r['id'] for r in resp.get_json()] == [1, 2]
+    assert 'cursor=2' in resp.headers['Link']
+
+    resp = client.get('/api/rates?limit=2&cursor=4')
+    assert [r['id'] for r in resp.get_json()] == [5]
+    assert 'Link' not in resp.headers
+
+    assert client.get('/api/rates?fields=secret_column').status_code == 400
+
+
+def test_api_rates_filters(monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'supabase', _rates_fake())
+    client = app.app.test_client()
+
+    rows = client.get('/api/rates?region_code=PE').get_json()
+    assert [r['id'] for r in rows] == [1, 3, 5]
+    assert client.get('/api/rates?effective_date=2026-05-01').get_json() == []
+    assert client.get('/api/rates?min_rate=abc').status_code == 400
+    assert client.get('/api/rates/datatable?min_rate=abc').status_code == 400
+
+
+def test_api_rates_conditional_get(monkeypatch):
+    import app
+    fake = _rates_fake()
+    monkeypatch.setattr(app, 'supabase', fake)
+    client = app.app.test_client()
+
+    first = client.get('/api/rates')
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+
+    again = client.get('/api/rates', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert fake.count('current_rates') == 1
+
+    since = client.get('/api/rates', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert since.status_code == 304
+
+    # Rates rewritten in place (e.g. 010's fix) show up through the refreshed row_hashes
+    fake.tables['rate_versions'][0].update(root='0f3a', hashed_at='2026-06-01T08:00:00+00:00')
+    assert client.get('/api/rates', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/api/rates', headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 200
+    etag = client.get('/api/rates').headers['ETag']
+
+    fake.tables['rate_versions'].append(
+        {'id': 118, 'effective_date': '2026-07-01', 'loaded_at': '2026-06-20T09:00:00+00:00'})
+    assert client.get('/api/rates', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_rates_datatable_server_side(monkeypatch):
+    """DataTables endpoint pages, sorts, searches and filters on the server."""
+    import app
+    monkeypatch.setattr(app, 'supabase', _rates_fake())
+    client = app.app.test_client()
+
+    resp = client.get('/api/rates/datatable?draw=3&start=1&length=2&order[0][column]=1&order[0][dir]=desc')
+    body = resp.get_json()
+    assert body['draw'] == 3
+    assert body['recordsTotal'] == 5
+    assert body['recordsFiltered'] == 5
+    assert [r['business_code'] for r in body['data']] == ['004', '003']
+
+    body = client.get('/api/rates/datatable?search[value]=PE&region_code=PE').get_json()
+    assert body['recordsFiltered'] == 3
+
+    body = client.get('/api/rates/datatable?search[value]=002').get_json()
+    assert [r['id'] for r in body['data']] == [2]
+
+    assert client.get('/api/rates/datatable?order[0][column]=99').status_code == 400
+
+
+def test_view_rates_renders_first_page_only(monkeypatch):
+    import app
+    fake = _rates_fake()
+    fake.tables['current_rates'] = [
+        {'id': i, 'rate_version_id': 117, 'jurisdiction_id': 198, 'business_code': f'{i:03d}',
+         'state_rate': 0, 'county_rate': 0, 'city_rate': 0.02, 'total_rate': 0.02}
+        for i in range(1, 61)
+    ]
+    monkeypatch.setattr(app, 'supabase', fake)
+
+    html = app.app.test_client().get('/rates').get_data(as_text=True)
+    import re
+    assert len(re.findall(r'bg-secondary">\d+<', html)) == app.DATATABLE_DEFAULT_LENGTH
+    assert 'deferLoading: [60, 60]' in html
+
+
+def test_health_and_readiness(monkeypatch):
+    """/healthz never touches the database; /readyz serves a cached schema probe."""
+    import app
+    from tests.fake_supabase import FakeSupabase
+    fake = FakeSupabase()
+    fake.fail_when = lambda q: q.table_name == 'rates'
+    monkeypatch.setattr(app, 'supabase', fake)
+    monkeypatch.setitem(app.app.config, 'READINESS_TTL', 60)
+    monkeypatch.setitem(app.app.config, 'RATE_INDEX_TTL', 5)
+    for name in ('job_queue', 'rate_index', 'rate_matrix', 'jurisdiction_resolver', 'zip_index', 'schema_check'):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    client = app.create_app({'READINESS_TTL': 60, 'RATE_INDEX_TTL': 5}).test_client()
+    # Overrides reach the services built at import, not just the readiness TTL
+    assert (app.schema_check.ttl, app.rate_index.ttl, app.zip_index.ttl) == (60, 5, 5)
+
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+    assert fake.calls == []
+
+    resp = client.get('/readyz')
+    assert resp.status_code == 503
+    assert resp.get_json()['tables']['rates'].startswith('simulated failure')
+
+    fake.fail_when = None
+    assert client.get('/readyz').status_code == 503  # failure cached for retry_after
+    app.schema_check.invalidate()
+    assert client.get('/readyz').status_code == 200
+    probes = len(fake.calls)
+    assert client.get('/readyz').get_json()['ready'] is True
+    assert len(fake.calls) == probes
+
+
+def test_create_app_reuses_the_job_queue(monkeypatch, tmp_path):
+    import app
+    from taxrates.jobs import JobQueue, JobStore
+    for name in ('rate_index', 'rate_matrix', 'jurisdiction_resolver', 'zip_index', 'schema_check'):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    monkeypatch.setitem(app.app.config, 'JOBS_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.app.config, 'JOB_WORKERS', 2)
+    queue = JobQueue(JobStore(str(tmp_path)), max_workers=2)
+    monkeypatch.setattr(app, 'job_queue', queue)
+
+    app.create_app({'JOB_WORKERS': 2})
+    assert app.job_queue is queue
+    app.create_app({'JOB_WORKERS': 3})
+    assert app.job_queue is not queue and app.job_queue.max_workers == 3
+    with pytest.raises(RuntimeError):  # the replaced pool was shut down
+        queue.executor.submit(print)
+    app.job_queue.shutdown()
+
+
+def test_lazy_client_defers_creation():
+    from taxrates.health import LazyClient
+    from tests.fake_supabase import FakeSupabase
+    made = []
+    lazy = LazyClient(lambda: made.append(1) or FakeSupabase({'rates': [{'id': 1}]}))
+    assert made == []
+    assert lazy.table('rates').select('id').execute().data == [{'id': 1}]
+    lazy.table('rates')
+    assert made == [1]
@@ -0,0 +1,108 @@
+"""
+Tests for the ASGI entry point (async read endpoints + Flask fallback).
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.fake_supabase import AsyncFakeSupabase
+from tests.test_app import _rates_fake
+
+
+def call(path, query='', headers=(), method='GET', body=b''):
+    import asgi
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'scheme': 'http',
+        'query_string': query.encode(), 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        'headers': [(b'host', b'testserver')] + [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, payload = sent
+    response_headers = {k.decode(): v.decode() for k, v in start['headers']}
+    return start['status'], response_headers, payload['body']
+
+
+def use_fake(monkeypatch, fake):
+    import asgi
+    monkeypatch.setattr(asgi, '_client', AsyncFakeSupabase(fake))
+
+
+def test_api_rates_pages_like_flask(monkeypatch):
+    use_fake(monkeypatch, _rates_fake())
+
+    status, headers, body = call('/api/rates', 'limit=2&fields=business_code,total_rate')
+    assert status == 200
+    assert [r['id'] for r in json.loads(body)] == [1, 2]
+    assert 'cursor=2' in headers['link']
+
+    status, headers, body = call('/api/rates', 'region_code=PE')
+    assert [r['id'] for r in json.loads(body)] == [1, 3, 5]
+    assert 'link' not in headers
+
+    assert call('/api/rates', 'fields=secret_column')[0] == 400
+
+
+def test_api_rates_conditional_get(monkeypatch):
+    fake = _rates_fake()
+    use_fake(monkeypatch, fake)
+
+    _, headers, _ = call('/api/rates')
+    assert call('/api/rates', headers=[('If-None-Match', headers['etag'])])[0] == 304
+    assert call('/api/rates', headers=[('If-Modified-Since', headers['last-modified'])])[0] == 304
+    assert fake.count('current_rates') == 1
+
+
+def test_datatable_and_point_lookup(monkeypatch):
+    import app
+    from taxrates.rate_index import RateIndex
+
+    use_fake(monkeypatch, _rates_fake())
+    status, _, body = call('/api/rates/datatable', 'draw=3&start=0&length=2&order[0][column]=0&order[0][dir]=desc')
+    payload = json.loads(body)
+    assert status == 200
+    assert payload['draw'] == 3 and payload['recordsTotal'] == 5
+    assert [r['id'] for r in payload['data']] == [5, 4]
+
+    index = RateIndex.from_rows(
+        [{'id': 198, 'city_code': 'PE', 'level': 'city'}],
+        [{'id': 116, 'effective_date': '2026-05-01'}],
+        [{'rate_version_id': 116, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.018}],
+    )
+    monkeypatch.setattr(app.rate_index, 'get', lambda: index)
+    status, _, body = call('/api/rate', 'region_code=PE&business_code=214&date=2026-05-02')
+    assert status == 200 and json.loads(body)['total_rate'] == 0.018
+
+
+def test_combined_lookup_answers_like_flask(monkeypatch):
+    import app
+    import asgi
+    from tests.test_rate_matrix import build
+
+    monkeypatch.setattr(app.rate_matrix, 'get', build)
+    monkeypatch.setattr(asgi, 'call_flask', None)  # served natively, never handed to Flask
+    client = app.app.test_client()
+    for query in ('region_code=PE&business_code=214&date=2025-03-01', 'region_code=PE&business_code=999',
+                  'region_code=PE', 'zip=85345&business_code=214'):
+        status, _, body = call('/api/rate/combined', query)
+        expected = client.get(f'/api/rate/combined?{query}')
+        assert (status, json.loads(body)) == (expected.status_code, expected.get_json())
+    assert json.loads(call('/api/rate/combined', 'region_code=PE&business_code=214&date=2025-03-01')[2]
+                      )['total_rate'] == 0.025
+
+
+def test_other_routes_fall_through_to_flask(monkeypatch):
+    status, headers, body = call('/jobs/does-not-exist')
+    assert status == 404
+    assert json.loads(body) == {'error': 'Unknown job does-not-exist'}
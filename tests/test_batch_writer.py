@@ -0,0 +1,165 @@
+"""
+Tests for the concurrent batch writer.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.batch_writer import BatchWriteError, BatchWriter, is_transient, is_unsent
+from taxrates.db import insert_batches, rows_present
+from tests.fake_supabase import FakeSupabase
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+def rows(n):
+    return [{'n': i} for i in range(n)]
+
+
+def test_writes_everything_with_bounded_concurrency():
+    lock = threading.Lock()
+    in_flight = peak = 0
+    seen = []
+
+    def write(batch):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+            seen.extend(r['n'] for r in batch)
+
+    result = BatchWriter(write, batch_size=10, workers=3).write(rows(95))
+    assert result.written == 95 and result.errors == []
+    assert sorted(seen) == list(range(95))
+    assert 1 < peak <= 3
+
+
+def test_bad_rows_are_isolated_and_reported_in_order():
+    def write(batch):
+        if any(r['n'] in (7, 42) for r in batch):
+            raise APIError('23505')
+
+    result = BatchWriter(write, batch_size=20, workers=4).write(rows(60))
+    assert result.written == 58
+    assert [(e.start, e.size) for e in result.errors] == [(7, 1), (42, 1)]
+    with pytest.raises(BatchWriteError):
+        result.check()
+
+
+def test_errors_that_are_not_row_level_are_raised_without_bisecting():
+    attempts = []
+
+    def write(batch):
+        attempts.append(len(batch))
+        raise APIError('42703')  # undefined column: every batch would fail
+
+    with pytest.raises(APIError):
+        BatchWriter(write, batch_size=20, workers=1).write(rows(60), stop_on_error=True)
+    assert attempts == [20]
+
+
+def test_transient_errors_retry_and_shrink_batches():
+    attempts = []
+    sizes = []
+
+    def write(batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            raise APIError('503')
+        sizes.append(len(batch))
+
+    sleeps = []
+    writer = BatchWriter(write, batch_size=100, workers=1, backoff=0.1, sleep=sleeps.append)
+    result = writer.write(rows(250))
+    assert result.written == 250
+    assert sleeps == [0.1]
+    assert sizes[0] == 100 and sizes[1] == 50  # later batches use the smaller size
+
+
+def test_gives_up_after_retries():
+    sleeps = []
+    writer = BatchWriter(lambda batch: (_ for _ in ()).throw(APIError('429')), batch_size=5, workers=1,
+                         retries=2, sleep=sleeps.append)
+    result = writer.write(rows(5))
+    assert result.written == 0
+    assert [(e.start, e.size) for e in result.errors] == [(0, 5)]
+    assert len(sleeps) == 2
+
+
+def test_ambiguous_failures_are_not_resent_blindly():
+    table = []
+
+    def commit_then_time_out(batch):
+        table.extend(batch)
+        if len(table) == len(batch):
+            raise TimeoutError()
+
+    # Without a landed check the batch fails rather than risking duplicates
+    result = BatchWriter(commit_then_time_out, batch_size=10, workers=1, sleep=lambda s: None).write(rows(10))
+    assert (result.written, len(table)) == (0, 10)
+    assert [(e.start, e.size) for e in result.errors] == [(0, 10)]
+
+    # It committed: landed says so and nothing is resent
+    table.clear()
+    writer = BatchWriter(commit_then_time_out, batch_size=10, workers=1, sleep=lambda s: None,
+                         landed=lambda batch: all(r in table for r in batch))
+    assert writer.write(rows(10)).written == 10
+    assert len(table) == 10
+
+    # It didn't: resent once the check finds it missing
+    attempts = []
+
+    def time_out_first(batch):
+        attempts.append(batch)
+        if len(attempts) == 1:
+            raise APIError('504')
+
+    writer = BatchWriter(time_out_first, batch_size=10, workers=1, sleep=lambda s: None,
+                         landed=lambda batch: False)
+    assert writer.write(rows(10)).written == 10 and len(attempts) == 2
+
+
+def test_stop_on_error():
+    def write(batch):
+        raise APIError('23502')
+
+    result = BatchWriter(write, batch_size=1, workers=1).write(rows(5), stop_on_error=True)
+    assert [(e.start, e.size) for e in result.errors] == [(0, 1)]
+
+
+def test_is_transient():
+    assert is_transient(ConnectionError())
+    assert is_transient(APIError('57014'))
+    assert not is_transient(APIError('23505'))
+    assert not is_transient(ValueError())
+    assert is_unsent(ConnectionRefusedError()) and is_unsent(APIError('503'))
+    assert not is_unsent(TimeoutError()) and not is_unsent(APIError('504'))
+
+
+def test_insert_batches_writes_through_client():
+    fake = FakeSupabase()
+    inserted, failed = insert_batches(fake, 'rates', iter(rows(1234)), batch_size=100)
+    assert (inserted, failed) == (1234, 0)
+    assert len(fake.tables['rates']) == 1234
+
+
+def test_rows_present_checks_the_natural_key():
+    fake = FakeSupabase()
+    batch = [{'rate_version_id': 1, 'jurisdiction_id': j, 'business_code': '011'} for j in (5, 6)]
+    key = ('rate_version_id', 'jurisdiction_id', 'business_code')
+    fake.table('rates').insert(batch[:1]).execute()
+    assert not rows_present(fake, 'rates', batch, key)
+    fake.table('rates').insert(batch[1:]).execute()
+    assert rows_present(fake, 'rates', batch, key)
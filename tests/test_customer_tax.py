@@ -0,0 +1,90 @@
+"""
+Tests for per-customer jurisdiction resolution and the assign mode of the subscription updater.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.customer_tax import CustomerTaxResolver, TaxGroup
+from taxrates.rate_matrix import RateMatrix
+from taxrates.stripe_subscriptions import SubscriptionUpdater
+from taxrates.zip_index import ZipIndex
+from tests.test_rate_matrix import JURISDICTIONS, RATES, VERSIONS
+from tests.test_stripe_subscriptions import FakeSubscriptions, subscription
+
+
+def resolver():
+    return CustomerTaxResolver(JURISDICTIONS, RateMatrix.from_rows(JURISDICTIONS, VERSIONS, RATES),
+                               '214', on_date='2025-03-01')
+
+
+def customer(city=None, state='AZ', metadata=None, shipping_city=None):
+    shipping = {'address': {'city': shipping_city, 'state': 'AZ'}} if shipping_city else None
+    return SimpleNamespace(id='cus_1', metadata=metadata or {}, shipping=shipping,
+                           address={'city': city, 'state': state} if city else None)
+
+
+def test_groups_by_address_and_metadata():
+    r = resolver()
+    assert r.group_for(customer('peoria ')) == TaxGroup(198, 71, '214')
+    assert r.group_for(customer(None, shipping_city='Phoenix')) == TaxGroup(5, 71, '214')
+    assert r.group_for(customer('Peoria', state='IL')) is None
+    assert r.group_for(customer('Nowhere')) is None
+
+    # Metadata wins over the address; the subscription's over the customer's
+    c = customer('Peoria', metadata={'cactuscomply_region_code': 'TU'})
+    assert r.group_for(c) == TaxGroup(40, None, '214')
+    assert r.group_for(c, {'cactuscomply_region_code': 'MAR',
+                           'cactuscomply_business_code': '017'}) == TaxGroup(None, 71, '017')
+
+
+def test_each_group_is_looked_up_once():
+    r = resolver()
+    calls = []
+    lookup = r.matrix.lookup_id
+    r.matrix.lookup_id = lambda *a: calls.append(a) or lookup(*a)
+
+    for _ in range(3):
+        assert r.rate_for(TaxGroup(198, 71, '214')).percentage == 2.5
+    assert r.rate_for(TaxGroup(5, 71, '214')).percentage == 0.7         # county-only
+    assert r.rate_for(TaxGroup(None, 71, '214')).percentage == 0.7       # 214 -> county 014
+    assert r.rate_for(TaxGroup(40, None, '214')) is None
+    assert len(calls) == 4
+    assert r.label(TaxGroup(198, 71, '214')) == 'Peoria / Maricopa (214)'
+    assert r.version() == (1, '2025-01-01')
+
+
+def test_updater_assigns_rates_per_subscription():
+    subs = [subscription('sub_pe'), subscription('sub_ph'), subscription('sub_far'),
+            subscription('sub_ok', rates=['txr_2.5'])]
+    assigned = {'sub_pe': ['txr_2.5'], 'sub_ph': ['txr_0.7'], 'sub_ok': ['txr_2.5']}
+    stripe = SimpleNamespace(Subscription=FakeSubscriptions(subs))
+    updater = SubscriptionUpdater(stripe, ['prod_pro'], [], workers=2, rate_limit=0,
+                                  sleep=lambda s: None, log=lambda *a: None,
+                                  assign=lambda sub: assigned.get(sub.id), target='per-customer:1')
+    result = updater.run()
+    assert (result.updated, result.skipped, result.unresolved) == (2, 1, 1)
+    assert [tr.id for tr in subs[1].default_tax_rates] == ['txr_0.7']
+    assert [tr.id for tr in subs[2].default_tax_rates] == ['txr_old']
+
+
+def test_zip_index_resolves_before_city_name():
+    zips = ZipIndex.from_rows([
+        {'zip': '85382', 'city_code': 'PE', 'county_code': 'MAR'},
+        {'zip': '85383', 'plus4_low': '0000', 'plus4_high': '5999', 'city_code': 'PE'},
+        {'zip': '85383', 'plus4_low': '6000', 'plus4_high': '9999', 'county_code': 'MAR'},
+    ], JURISDICTIONS)
+    r = CustomerTaxResolver(JURISDICTIONS, RateMatrix.from_rows(JURISDICTIONS, VERSIONS, RATES),
+                            '214', on_date='2025-03-01', zip_index=zips)
+
+    def at(city, postal_code):
+        return SimpleNamespace(metadata={}, shipping=None,
+                               address={'city': city, 'state': 'AZ', 'postal_code': postal_code})
+
+    assert r.group_for(at('Phoenix', '85382')) == TaxGroup(198, 71, '214')
+    assert r.group_for(at('Unknown', '85383-6000')) == TaxGroup(None, 71, '214')
+    # Split ZIP: the city name decides, else the ZIP's majority
+    assert r.group_for(at('Phoenix', '85383')) == TaxGroup(5, 71, '214')
+    assert r.group_for(at('Unknown', '85383')) == TaxGroup(198, 71, '214')
@@ -0,0 +1,38 @@
+"""
+Tests for the server-side dedup wrapper.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.fake_supabase import FakeSupabase
+from taxrates.dedup import DEDUP_FUNCTION, dedup_on_server
+
+REPORT = {
+    'versions': [{'rate_version_id': 10, 'rows': 8004, 'duplicates': 3402, 'conflict_groups': 1},
+                 {'rate_version_id': 12, 'rows': 4600, 'duplicates': 0, 'conflict_groups': 2}],
+    'conflicts': [{'rate_version_id': 10, 'jurisdiction_id': 5, 'business_code': '017',
+                   'rows': 2, 'rate_sets': 2}],
+    'deleted': 3402,
+}
+
+
+def test_dedup_is_one_rpc_and_reports_changed_versions():
+    fake = FakeSupabase()
+    fake.rpc_handlers[DEDUP_FUNCTION] = lambda params: dict(REPORT, applied=params['p_apply'])
+
+    report = dedup_on_server(fake, apply=True)
+    assert fake.rpc_calls == [(DEDUP_FUNCTION, {'p_version_id': None, 'p_apply': True})]
+    assert fake.calls == []
+    assert (report.duplicates, report.deleted, len(report.conflicts)) == (3402, 3402, 1)
+    assert report.changed_versions() == [10]
+
+    assert dedup_on_server(fake, 10).changed_versions() == []
+
+
+def test_dedup_accepts_wrapped_scalar():
+    fake = FakeSupabase()
+    fake.rpc_handlers[DEDUP_FUNCTION] = lambda params: [dict(REPORT, deleted=0, applied=False)]
+    report = dedup_on_server(fake, 10)
+    assert report.deleted == 0 and not report.applied and report.duplicates == 3402
@@ -0,0 +1,60 @@
+"""
+Tests for the background upload job queue.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.jobs import JobQueue, JobStore
+
+
+def _wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job and job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_reports_progress_and_result(tmp_path):
+    queue = JobQueue(JobStore(str(tmp_path)), max_workers=1)
+
+    def load(n, progress=None):
+        progress(rows_parsed=n, stage='writing')
+        for i in range(1, n + 1):
+            progress(rows_written=i)
+        return {'success': True, 'total_records': n}
+
+    job_id = queue.submit('csv_upload', load, 40, filename='rates.csv')
+    job = _wait_for(queue, job_id)
+
+    assert job['status'] == 'succeeded'
+    assert job['rows_parsed'] == 40
+    assert job['rows_written'] == 40
+    assert job['result'] == {'success': True, 'total_records': 40}
+    assert job['filename'] == 'rates.csv'
+    assert 'rows_per_second' in job
+
+    # A second store over the same directory (another worker) sees the job too
+    assert JobStore(str(tmp_path)).get(job_id)['status'] == 'succeeded'
+
+
+def test_job_failure_is_recorded(tmp_path):
+    queue = JobQueue(JobStore(str(tmp_path)), max_workers=1)
+
+    def boom(progress=None):
+        raise ValueError("bad csv")
+
+    job = _wait_for(queue, queue.submit('csv_upload', boom))
+    assert job['status'] == 'failed'
+    assert job['error'] == 'bad csv'
+
+
+def test_unknown_or_unsafe_job_ids(tmp_path):
+    store = JobStore(str(tmp_path))
+    assert store.get('does-not-exist') is None
+    assert store.get('../../etc/passwd') is None
@@ -0,0 +1,65 @@
+"""
+Tests for the shared jurisdiction resolver.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.jurisdictions import Jurisdiction, JurisdictionResolver, build_jurisdiction_map
+
+ROWS = [
+    {'id': 198, 'level': 'city', 'city_code': 'PE', 'region_code': None, 'city_name': 'Peoria'},
+    {'id': 12, 'level': 'city', 'city_code': 'APA', 'region_code': None, 'city_name': 'Apache'},
+    {'id': 4, 'level': 'county', 'city_code': None, 'region_code': 'APA', 'county_name': 'Apache'},
+]
+
+
+def _resolver(rows=ROWS, **kwargs):
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return [dict(r) for r in rows]
+
+    return JurisdictionResolver(loader, **kwargs), loads
+
+
+def test_county_wins_on_code_clash():
+    mapping = build_jurisdiction_map(ROWS)
+    assert mapping['APA'] == Jurisdiction(4, 'county', 'Apache')
+    assert mapping['PE'] == Jurisdiction(198, 'city', 'Peoria')
+
+
+def test_ttl_cache_and_invalidate():
+    resolver, loads = _resolver(ttl=60)
+    assert resolver.resolve('PE').id == 198
+    assert resolver.resolve(' APA ').level == 'county'
+    assert resolver.resolve('ZZ') is None
+    assert len(loads) == 1
+
+    resolver.invalidate()
+    resolver.mapping()
+    assert len(loads) == 2
+
+    resolver._loaded_at = time.time() - 61
+    resolver.mapping()
+    assert len(loads) == 3
+
+
+def test_disk_warm_cache(tmp_path):
+    path = str(tmp_path / 'jurisdictions.json')
+    first, first_loads = _resolver(ttl=60, cache_path=path)
+    first.mapping()
+    assert os.path.exists(path)
+
+    # A second process starts warm from the file without querying
+    second, second_loads = _resolver(ttl=60, cache_path=path)
+    assert second.resolve('APA').id == 4
+    assert (len(first_loads), len(second_loads)) == (1, 0)
+
+    second.invalidate()
+    assert not os.path.exists(path)
+    second.mapping()
+    assert len(second_loads) == 1
@@ -0,0 +1,167 @@
+"""
+Tests for the direct COPY + merge backend (no live database: a recording
+connection stands in for psycopg2).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates import pg_copy
+from taxrates.pg_copy import CopyStream, copy_value, merge_rates, merge_rows, restore_tables, scale_high_rates
+from taxrates.pg_dump import unescape
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.fail_on and self.conn.fail_on in sql:
+            raise RuntimeError("boom")
+        self.conn.statements.append(sql)
+        self.conn.params.append(params)
+        self.rowcount = self.conn.rowcount
+
+    def fetchall(self):
+        return self.conn.results
+
+    def copy_expert(self, sql, stream):
+        self.conn.statements.append(sql)
+        chunks = []
+        while True:
+            chunk = stream.read(64)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.conn.copied.append(b''.join(chunks).decode('utf-8'))
+
+
+class RecordingConnection:
+    def __init__(self, rowcount=0, fail_on=None, results=()):
+        self.statements = []
+        self.params = []
+        self.results = list(results)
+        self.copied = []
+        self.rowcount = rowcount
+        self.fail_on = fail_on
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_copy_value_escapes_round_trip():
+    for value in ['plain', 'tab\there', 'line\nbreak', 'back\\slash', 'cr\r']:
+        assert unescape(copy_value(value)) == value
+    assert copy_value(None) == '\\N'
+    assert copy_value(True) == 't'
+    assert copy_value(0.0056) == '0.0056'
+
+
+def test_copy_stream_reads_in_chunks():
+    rows = [{'a': i, 'b': f'x{i}'} for i in range(50)]
+    stream = CopyStream(rows, ('a', 'b'))
+    data = b''
+    while True:
+        chunk = stream.read(7)
+        if not chunk:
+            break
+        assert len(chunk) <= 7
+        data += chunk
+    assert data.decode().splitlines()[3] == '3\tx3'
+    assert stream.count == 50
+
+
+def test_merge_rates_stages_and_inserts_missing():
+    conn = RecordingConnection(rowcount=2)
+    rows = [
+        {'rate_version_id': 1, 'jurisdiction_id': 5, 'business_code': '011',
+         'state_rate': 0.0, 'county_rate': 0.0, 'city_rate': 0.02},
+        {'rate_version_id': 1, 'jurisdiction_id': 6, 'business_code': '011',
+         'state_rate': 0.0, 'county_rate': 0.007, 'city_rate': 0.0},
+    ]
+    result = merge_rates(conn, iter(rows))
+
+    assert result == (2, 2, 0)
+    assert conn.commits == 1
+    create, seq, copy, insert, drop = conn.statements
+    assert create.startswith('CREATE TEMP TABLE "_stage_rates" ON COMMIT DROP')
+    assert seq == 'ALTER TABLE "_stage_rates" ADD COLUMN _seq bigserial'
+    assert copy.startswith('COPY "_stage_rates" ("rate_version_id"')
+    assert 'SELECT DISTINCT ON ("rate_version_id", "jurisdiction_id", "business_code")' in insert
+    assert 'WHERE NOT EXISTS' in insert
+    # Last staged row wins a duplicate key, like the in-memory path
+    assert insert.endswith('ORDER BY "rate_version_id", "jurisdiction_id", "business_code", s._seq DESC')
+    assert conn.copied[0].splitlines()[1] == '1\t6\t011\t0.0\t0.007\t0.0'
+
+
+def test_merge_rows_update_only_changed_columns():
+    conn = RecordingConnection(rowcount=1)
+    merge_rows(conn, 'rate_versions', ('id', 'effective_date'), [{'id': 1, 'effective_date': '2025-01-01'}],
+               key=('id',), update=('effective_date',))
+    update = conn.statements[3]
+    assert update.startswith('UPDATE "rate_versions" t SET "effective_date" = s."effective_date"')
+    assert 'ORDER BY "id", _seq DESC) s' in update
+    assert 't."effective_date" IS DISTINCT FROM s."effective_date"' in update
+
+
+def test_restore_tables_is_one_transaction():
+    conn = RecordingConnection()
+    restore_tables(conn, [{'id': 1, 'effective_date': '2025-01-01'}],
+                   iter([{'id': 10, 'rate_version_id': 1, 'jurisdiction_id': 5, 'business_code': '011'}]))
+    assert conn.statements[:2] == ['DELETE FROM rates', 'DELETE FROM rate_versions']
+    assert conn.commits == 1
+
+    # Delta storage columns and the cascaded rate_removals come back too
+    conn = RecordingConnection()
+    restore_tables(conn, [{'id': 2, 'effective_date': '2025-02-01', 'storage': 'delta', 'base_version_id': 1,
+                           'diff_summary': {'added': 1}}], iter([]),
+                   [{'rate_version_id': 2, 'jurisdiction_id': 5, 'business_code': '011'}])
+    assert ('COPY "_stage_rate_versions" ("id", "effective_date", "storage", "base_version_id", "diff_summary") '
+            'FROM STDIN' in conn.statements)
+    assert conn.copied[0] == '2\t2025-02-01\tdelta\t1\t{"added": 1}\n'
+    assert any(s.startswith('INSERT INTO "rate_removals"') for s in conn.statements)
+    assert conn.copied[2] == '2\t5\t011\n'
+
+    failing = RecordingConnection(fail_on='INSERT INTO "rates"')
+    with pytest.raises(RuntimeError):
+        restore_tables(failing, [], iter([]))
+    assert failing.commits == 0
+    assert failing.rollbacks == 1
+
+
+def test_scale_high_rates_is_one_statement():
+    conn = RecordingConnection(results=[(9, 3), (112, 41)])
+    assert scale_high_rates(conn, 0.20, apply=True) == {9: 3, 112: 41}
+    (sql,) = conn.statements
+    assert sql.startswith('WITH fixed AS (UPDATE rates SET state_rate = round(coalesce(state_rate, 0)::numeric / 100, 6)')
+    assert 'WHERE total_rate > %s RETURNING rate_version_id' in sql
+    assert conn.params == [(0.20,)] and conn.commits == 1
+
+    dry = RecordingConnection(results=[(112, 41)])
+    assert scale_high_rates(dry, 0.20, version_id=112) == {112: 41}
+    assert dry.statements[0].startswith('SELECT rate_version_id, count(*) FROM rates')
+    assert dry.params == [(0.20, 112)] and dry.commits == 0 and dry.rollbacks == 1
+
+
+def test_connect_requires_database_url(monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    with pytest.raises(RuntimeError):
+        pg_copy.connect()
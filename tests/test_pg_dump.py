@@ -0,0 +1,92 @@
+"""
+Tests for the streaming pg_dump COPY reader.
+"""
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from taxrates.pg_dump import iter_copy_rows, read_table, unescape
+
+DUMP = """--
+-- PostgreSQL database dump
+--
+
+CREATE TABLE public.rate_versions (
+    id integer NOT NULL,
+    effective_date date NOT NULL,
+    loaded_at timestamp with time zone DEFAULT now()
+);
+
+CREATE TABLE public.rates (
+    id bigint NOT NULL,
+    rate_version_id integer NOT NULL,
+    business_code character varying(10) NOT NULL,
+    jurisdiction_id integer NOT NULL,
+    state_rate numeric(8,6) DEFAULT 0,
+    county_rate numeric(8,6) DEFAULT 0,
+    city_rate numeric(8,6) DEFAULT 0,
+    total_rate numeric GENERATED ALWAYS AS (((state_rate + county_rate) + city_rate)) STORED,
+    CONSTRAINT rates_pkey PRIMARY KEY (id)
+);
+
+CREATE TABLE public.business_class_codes (
+    code text NOT NULL,
+    description text
+);
+
+COPY public.business_class_codes (code, description) FROM stdin;
+214\tRestaurants\\tand Bars
+014\t\\N
+\\.
+
+COPY public.rate_versions (id, effective_date, loaded_at) FROM stdin;
+9\t2025-10-01\t2025-10-02 08:00:00+00
+116\t2026-05-01\t\\N
+\\.
+
+COPY public.rates (id, rate_version_id, business_code, jurisdiction_id, state_rate, county_rate, city_rate) FROM stdin;
+1\t9\t214\t198\t0.056000\t0.000000\t0.018000
+2\t116\t014\t71\t0.000000\t0.063000\t0.000000
+\\.
+
+SELECT pg_catalog.setval('public.rates_id_seq', 2, true);
+"""
+
+
+def test_rows_are_typed_from_create_table():
+    rows = list(read_table(DUMP.splitlines(True), 'rates'))
+    assert rows[0] == {'id': 1, 'rate_version_id': 9, 'business_code': '214', 'jurisdiction_id': 198,
+                       'state_rate': 0.056, 'county_rate': 0.0, 'city_rate': 0.018}
+    versions = list(read_table(DUMP.splitlines(True), 'rate_versions', ['id', 'loaded_at']))
+    assert versions == [{'id': 9, 'loaded_at': '2025-10-02 08:00:00+00'}, {'id': 116, 'loaded_at': None}]
+
+
+def test_escapes_and_table_filter():
+    rows = list(iter_copy_rows(DUMP.splitlines(True), ('business_class_codes',)))
+    assert [r[2] for r in rows] == [('214', 'Restaurants\tand Bars'), ('014', None)]
+    assert unescape('a\\\\b\\nc\\101') == 'a\\b\ncA'
+
+
+def test_reads_gzip_paths(tmp_path):
+    path = str(tmp_path / 'backup.sql.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(DUMP)
+    tables = [t for t, _, _ in iter_copy_rows(path)]
+    assert tables == ['business_class_codes'] * 2 + ['rate_versions'] * 2 + ['rates'] * 2
+
+
+def test_damaged_dumps_raise():
+    truncated = DUMP[:DUMP.index('2\t116\t014')]
+    with pytest.raises(ValueError, match='ends inside the COPY block for rates'):
+        list(iter_copy_rows(truncated.splitlines(True), ('rates',)))
+    # A cut inside a block we skip still means the file is incomplete
+    with pytest.raises(ValueError, match='truncated'):
+        list(iter_copy_rows(truncated.splitlines(True), ('business_class_codes',)))
+
+    short_row = DUMP.replace('2\t116\t014\t71\t0.000000\t0.063000\t0.000000', '2\t116\t014')
+    with pytest.raises(ValueError, match='has 3 fields, expected 7'):
+        list(read_table(short_row.splitlines(True), 'rates'))
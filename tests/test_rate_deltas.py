@@ -0,0 +1,112 @@
+"""
+Tests for delta-encoded rate versions.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.fake_supabase import FakeSupabase
+from taxrates.rate_deltas import VersionStore, diff_rates, rate_key
+from taxrates.rate_index import RateIndex
+from taxrates.rate_matrix import RateMatrix
+
+
+def rate(jid, code, city=0.0, county=0.0):
+    return {'jurisdiction_id': jid, 'business_code': code, 'state_rate': 0.0,
+            'county_rate': county, 'city_rate': city}
+
+
+MAY = [rate(198, '214', city=0.018), rate(71, '014', county=0.007), rate(5, '017', city=0.023)]
+JUNE = [rate(198, '214', city=0.018), rate(71, '014', county=0.007), rate(5, '017', city=0.023),
+        rate(40, '017', city=0.026)]
+JULY = [rate(198, '214', city=0.02), rate(71, '014', county=0.007), rate(40, '017', city=0.026)]
+
+
+def store_with_versions(n, checkpoint_every=3):
+    fake = FakeSupabase({'rate_versions': [
+        {'id': i, 'effective_date': f'2026-{4 + i:02d}-01'} for i in range(1, n + 1)]})
+    return fake, VersionStore(fake, checkpoint_every=checkpoint_every)
+
+
+def write(store, version_id, rows):
+    return store.write_version(version_id, rows, log=lambda *a: None)
+
+
+def test_diff_rates():
+    base = {rate_key(r): r for r in MAY}
+    delta = diff_rates(base, JULY)
+    assert [rate_key(r) for r in delta.added] == [(40, '017')]
+    assert [rate_key(r) for r in delta.changed] == [(198, '214')]
+    assert delta.removed == [(5, '017')]
+    assert delta.unchanged == 1
+    assert diff_rates(base, MAY).summary() == "0 added, 0 changed, 0 removed, 3 unchanged"
+
+
+def test_delta_versions_store_only_changes_and_reconstruct():
+    fake, store = store_with_versions(3)
+    assert write(store, 1, MAY)[1:] == ('full', 3, 0)
+    delta, storage, inserted, _ = write(store, 2, JUNE)
+    assert (storage, inserted, len(delta.added)) == ('delta', 1, 1)
+    delta, storage, inserted, _ = write(store, 3, JULY)
+    assert (storage, inserted, delta.removed) == ('delta', 1, [(5, '017')])
+
+    assert len(fake.tables['rates']) == 5
+    assert [(r['rate_version_id'], rate_key(r)) for r in fake.tables['rate_removals']] == [(3, (5, '017'))]
+    assert {v['id']: (v['storage'], v['base_version_id']) for v in fake.tables['rate_versions']} == {
+        1: ('full', None), 2: ('delta', 1), 3: ('delta', 2)}
+
+    for version_id, expected in [(1, MAY), (2, JUNE), (3, JULY)]:
+        rebuilt = store.rows(version_id)
+        assert {k: r['city_rate'] + r['county_rate'] for k, r in rebuilt.items()} == {
+            rate_key(r): r['city_rate'] + r['county_rate'] for r in expected}
+
+    assert store.rate_for(3, 198, '214')['city_rate'] == 0.02
+    assert store.rate_for(3, 71, '014')['rate_version_id'] == 1
+    assert store.rate_for(3, 5, '017') is None
+    assert store.rate_for(2, 5, '017')['city_rate'] == 0.023
+
+    # Re-running a load writes nothing new
+    assert write(store, 3, JULY)[2] == 0
+    assert len(fake.tables['rates']) == 5 and len(fake.tables['rate_removals']) == 1
+
+
+def test_periodic_full_checkpoint():
+    fake, store = store_with_versions(4, checkpoint_every=2)
+    storages = [write(store, i, rows)[1] for i, rows in enumerate([MAY, JUNE, JULY, JULY], start=1)]
+    assert storages == ['full', 'delta', 'full', 'delta']
+    assert [v['id'] for v in store.chain(4)] == [3, 4]
+    assert len(store.rows(4)) == 3
+
+
+def test_indexes_honour_removals():
+    fake, store = store_with_versions(3)
+    for i, rows in enumerate([MAY, JUNE, JULY], start=1):
+        write(store, i, rows)
+    fake.tables['jurisdictions'] = [
+        {'id': 5, 'level': 'city', 'city_code': 'PH', 'county_name': 'Maricopa'},
+        {'id': 198, 'level': 'city', 'city_code': 'PE', 'county_name': 'Maricopa'},
+        {'id': 71, 'level': 'county', 'region_code': 'MAR', 'county_name': 'Maricopa'},
+    ]
+
+    index = RateIndex.load(fake)
+    assert index.lookup('PH', '017', '2026-06-15').city_rate == 0.023
+    assert index.lookup('PH', '017', '2026-07-15') is None
+    assert len(index.history(5, '017')) == 1
+
+    matrix = RateMatrix.load(fake)
+    assert matrix.lookup('PH', '017', '2026-06-15').total_rate == 0.023
+    assert matrix.lookup('PH', '017', '2026-07-15') is None
+    assert matrix.lookup('PE', '214', '2026-07-15').total_rate == 0.027  # + Maricopa 014
+
+
+def test_diff_summary_and_watched_keys():
+    fake, store = store_with_versions(2)
+    write(store, 1, MAY)
+    changes = store.diff(2, JUNE)
+    assert changes.as_dict() == {'added': 1, 'changed': 0, 'removed': 0, 'unchanged': 3}
+    assert changes.touched([(198, '214'), (71, '014')]) == []
+    assert diff_rates(store.rows(1), JULY).touched([(198, '214'), (71, '014')]) == [(198, '214')]
+
+    assert store.record_diff(2, dict(changes.as_dict(), watched_changed=[]))
+    assert fake.tables['rate_versions'][1]['diff_summary']['added'] == 1
@@ -0,0 +1,99 @@
+"""
+Tests for the in-memory rate lookup index.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.rate_index import CachedRateIndex, RateIndex
+
+JURISDICTIONS = [
+    {'id': 198, 'city_code': 'PE', 'region_code': None, 'level': 'city'},
+    {'id': 71, 'city_code': None, 'region_code': 'MAR', 'level': 'county'},
+    {'id': 5, 'city_code': 'MAR', 'region_code': None, 'level': 'city'},  # stale clash, county wins
+]
+VERSIONS = [
+    {'id': 9, 'effective_date': '2025-10-01'},
+    {'id': 116, 'effective_date': '2026-05-01'},
+    {'id': 117, 'effective_date': '2026-06-01'},
+    {'id': 118, 'effective_date': '2026-06-01'},  # re-load of the same month
+]
+RATES = [
+    {'rate_version_id': 9, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.018},
+    {'rate_version_id': 116, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.019},
+    {'rate_version_id': 117, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.02},
+    {'rate_version_id': 118, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.021},
+    {'rate_version_id': 9, 'jurisdiction_id': 71, 'business_code': '014', 'county_rate': 0.063},
+]
+
+
+def _index():
+    return RateIndex.from_rows(JURISDICTIONS, VERSIONS, RATES)
+
+
+def test_lookup_picks_latest_version_on_or_before_date():
+    index = _index()
+    assert index.lookup('PE', '214', '2025-09-30') is None
+    assert index.lookup('PE', '214', '2025-10-01').city_rate == 0.018
+    assert index.lookup('PE', '214', '2026-05-31').rate_version_id == 116
+    # Two versions for 2026-06-01: the higher id wins
+    assert index.lookup('PE', '214', '2030-01-01').rate_version_id == 118
+
+
+def test_lookup_carries_unchanged_rates_forward():
+    index = _index()
+    rate = index.lookup('MAR', '014', '2026-06-15')
+    assert rate.jurisdiction_id == 71
+    assert rate.effective_date == '2025-10-01'
+    assert rate.total_rate == 0.063
+
+
+def test_unknown_keys():
+    index = _index()
+    assert index.lookup('ZZ', '214', '2026-01-01') is None
+    assert index.lookup('PE', '999', '2026-01-01') is None
+
+
+def test_cached_index_reloads_after_invalidate():
+    builds = []
+
+    def loader():
+        builds.append(1)
+        return _index()
+
+    cache = CachedRateIndex(loader, ttl=60)
+    cache.get()
+    cache.get()
+    assert len(builds) == 1
+    cache.invalidate()
+    cache.get()
+    assert len(builds) == 2
+
+
+def test_expired_index_is_served_while_it_reloads():
+    release = threading.Event()
+    builds = []
+
+    def loader():
+        builds.append(1)
+        if len(builds) > 1 and not release.wait(5):
+            raise RuntimeError("never released")
+        if len(builds) == 2:
+            raise RuntimeError("Supabase is down")
+        return _index()
+
+    cache = CachedRateIndex(loader, ttl=0, retry_after=0)
+    first = cache.get()
+    # Expired: lookups get the old index straight away, one reload runs in the background
+    assert cache.get() is first and cache.get() is first
+    release.set()
+    deadline = time.time() + 5
+    while len(builds) < 3 and time.time() < deadline:
+        assert cache.get() is not None  # the failed reload left the old index in service
+        time.sleep(0.01)
+    while cache.get() is first and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get() is not first
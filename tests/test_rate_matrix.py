@@ -0,0 +1,111 @@
+"""
+Tests for the per-version combined rate matrix.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.rate_matrix import RateMatrix, county_parents, current_rate_matrix
+from tests.fake_supabase import FakeSupabase
+
+JURISDICTIONS = [
+    {'id': 198, 'level': 'city', 'city_code': 'PE', 'city_name': 'Peoria', 'county_name': 'Maricopa'},
+    {'id': 5, 'level': 'city', 'city_code': 'PH', 'city_name': 'Phoenix', 'county_name': 'Maricopa'},
+    {'id': 71, 'level': 'county', 'region_code': 'MAR', 'county_name': 'Maricopa'},
+    {'id': 40, 'level': 'city', 'city_code': 'TU', 'city_name': 'Tucson', 'county_name': 'Pima'},
+]
+VERSIONS = [
+    {'id': 1, 'effective_date': '2025-01-01'},
+    {'id': 2, 'effective_date': '2025-06-01'},
+    {'id': 3, 'effective_date': '2025-07-01'},  # no rows: carries forward
+]
+RATES = [
+    {'rate_version_id': 1, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.018},
+    {'rate_version_id': 1, 'jurisdiction_id': 5, 'business_code': '017', 'city_rate': 0.023},
+    {'rate_version_id': 1, 'jurisdiction_id': 71, 'business_code': '014', 'county_rate': 0.007},
+    {'rate_version_id': 1, 'jurisdiction_id': 71, 'business_code': '017', 'county_rate': 0.007},
+    {'rate_version_id': 1, 'jurisdiction_id': 40, 'business_code': '017', 'city_rate': 0.026},
+    {'rate_version_id': 2, 'jurisdiction_id': 198, 'business_code': '214', 'city_rate': 0.02},
+]
+
+
+def build():
+    return RateMatrix.from_rows(JURISDICTIONS, VERSIONS, RATES)
+
+
+def test_county_parents_by_county_name():
+    assert county_parents(JURISDICTIONS) == {198: 71, 5: 71}
+
+
+def test_city_rate_stacks_mapped_county_rate():
+    matrix = build()
+    rate = matrix.lookup('PE', '214', '2025-03-01')
+    assert (rate.city_rate, rate.county_rate, rate.total_rate) == (0.018, 0.007, 0.025)
+    assert rate.rate_version_id == 1
+
+    later = matrix.lookup('PE', '214', '2025-08-01')
+    assert later.rate_version_id == 3 and later.city_rate == 0.02 and later.total_rate == 0.027
+
+
+def test_same_code_county_and_county_only_cells():
+    matrix = build()
+    assert matrix.lookup('PH', '017', '2025-02-01').total_rate == 0.03
+    # No Phoenix 214 row, but Maricopa levies 014: county-only combined rate
+    assert matrix.lookup('PH', '214', '2025-02-01').as_dict()['total_rate'] == 0.007
+    # Tucson's county has no jurisdiction row: city rate alone
+    assert matrix.lookup('TU', '017', '2025-02-01').total_rate == 0.026
+    assert matrix.lookup('MAR', '014', '2025-02-01').county_rate == 0.007
+    assert matrix.lookup('PE', '214', '2024-12-31') is None
+    assert matrix.lookup('ZZ', '214') is None
+
+
+def test_unchanged_versions_share_a_slab(tmp_path):
+    matrix = build()
+    assert matrix.header['slabs'] == 2
+    assert [v[2] for v in matrix.versions] == [0, 1, 1]
+
+    path = str(tmp_path / 'rates.ccrm')
+    matrix.save(path)
+    opened = RateMatrix.open(path)
+    try:
+        for region, code, on in [('PE', '214', '2025-03-01'), ('PE', '214', None), ('PH', '214', '2025-07-02')]:
+            assert opened.lookup(region, code, on) == matrix.lookup(region, code, on)
+    finally:
+        opened.close()
+
+
+def test_saved_matrix_is_rebuilt_once_the_rates_change(tmp_path):
+    fake = FakeSupabase({'jurisdictions': JURISDICTIONS, 'rates': RATES,
+                         'rate_versions': [dict(v, loaded_at='2025-07-01T00:00:00+00:00') for v in VERSIONS]})
+    path = str(tmp_path / 'rates.ccrm')
+
+    current_rate_matrix(fake, path).close()  # no file yet: built and saved
+    reads = fake.count('rates')
+    matrix = current_rate_matrix(fake, path)
+    assert fake.count('rates') == reads  # served from the file
+    assert matrix.lookup('PE', '214', '2025-03-01').total_rate == 0.025
+    matrix.close()
+
+    # A script rewrites a rate and refreshes the version's hashes
+    fake.tables['rates'][0]['city_rate'] = 0.03
+    fake.tables['rate_versions'][0].update(root='abc', hashed_at='2025-08-01T00:00:00+00:00')
+    matrix = current_rate_matrix(fake, path)
+    assert fake.count('rates') > reads
+    assert matrix.lookup('PE', '214', '2025-03-01').total_rate == 0.037
+    matrix.close()
+    reopened = RateMatrix.open(path)
+    assert reopened.lookup('PE', '214', '2025-03-01').total_rate == 0.037
+    reopened.close()
+
+
+def test_api_rate_combined(monkeypatch):
+    import app
+    monkeypatch.setattr(app.rate_matrix, 'get', build)
+    client = app.app.test_client()
+
+    resp = client.get('/api/rate/combined?region_code=PE&business_code=214&date=2025-03-01')
+    assert resp.status_code == 200
+    assert resp.get_json()['total_rate'] == 0.025
+    assert client.get('/api/rate/combined?region_code=PE&business_code=999').status_code == 404
+    assert client.get('/api/rate/combined?region_code=PE').status_code == 400
@@ -0,0 +1,134 @@
+"""
+Tests for scripts/003_restore_and_sync_rates.py: --stream and the default
+in-memory historical merge must load the same rates.
+"""
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from taxrates.jurisdictions import Jurisdiction
+from taxrates.rate_deltas import VersionStore
+from tests.fake_supabase import FakeSupabase
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'scripts', '003_restore_and_sync_rates.py')
+
+# PE/214 is repeated within the 2021 run and again in a second 2021 run;
+# the newer file repeats TU/017 with a different rate.
+OLDER = """RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate,RateStartDate
+PE,Peoria,214,Restaurants,1.8,1/1/2021
+PE,Peoria,214,Restaurants,1.85,1/1/2021
+TU,Tucson,017,Retail,2.6,1/1/2021
+TU,Tucson,017,Retail,2.7,7/1/2023
+PE,Peoria,214,Restaurants,1.9,1/1/2021
+"""
+NEWER = """RegionCode,RegionName,BusinessCode,BusinessCodesName,TaxRate,RateStartDate
+TU,Tucson,017,Retail,2.5,1/1/2021
+TU,Tucson,017,Retail,2.75,7/1/2023
+TU,Tucson,017,Retail,2.8,7/1/2023
+"""
+
+
+@pytest.fixture
+def script(monkeypatch):
+    monkeypatch.setenv('SUPABASE_URL', 'https://test.supabase.co')
+    monkeypatch.setenv('SUPABASE_SERVICE_KEY',
+                       'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.x')
+    spec = importlib.util.spec_from_file_location('restore_and_sync_rates', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+DUMP = """CREATE TABLE public.rate_versions (
+    id integer NOT NULL,
+    effective_date date NOT NULL,
+    storage text DEFAULT 'full'::text NOT NULL,
+    base_version_id integer,
+    diff_summary jsonb
+);
+
+CREATE TABLE public.rates (
+    id bigint NOT NULL,
+    rate_version_id integer NOT NULL,
+    business_code character varying(10) NOT NULL,
+    jurisdiction_id integer NOT NULL,
+    state_rate numeric(8,6) DEFAULT 0,
+    county_rate numeric(8,6) DEFAULT 0,
+    city_rate numeric(8,6) DEFAULT 0
+);
+
+CREATE TABLE public.rate_removals (
+    rate_version_id integer NOT NULL,
+    jurisdiction_id integer NOT NULL,
+    business_code character varying(10) NOT NULL
+);
+
+COPY public.rate_versions (id, effective_date, storage, base_version_id, diff_summary) FROM stdin;
+12\t2026-06-01\tdelta\t11\t{"added": 1, "removed": 1}
+11\t2026-05-01\tfull\t\\N\t\\N
+\\.
+
+COPY public.rates (id, rate_version_id, business_code, jurisdiction_id, state_rate, county_rate, city_rate) FROM stdin;
+1\t11\t214\t1\t0\t0\t0.018
+2\t11\t017\t2\t0\t0\t0.026
+3\t12\t017\t1\t0\t0\t0.02
+\\.
+
+COPY public.rate_removals (rate_version_id, jurisdiction_id, business_code) FROM stdin;
+12\t2\t017
+\\.
+"""
+
+
+def load(script, csv_paths, stream):
+    fake = FakeSupabase({'rate_versions': [], 'rates': []})
+    script.supabase = fake
+    cache = {'PE': Jurisdiction(1, 'city', 'Peoria'), 'TU': Jurisdiction(2, 'city', 'Tucson')}
+    if stream:
+        script.stream_historical_rates(csv_paths, cache, 10)
+    else:
+        records = [r for path in csv_paths for r in script.parse_historical_csv(path)]
+        script.merge_historical_rates(script.latest_per_key(records), cache, 10)
+    dates = {v['id']: v['effective_date'] for v in fake.tables['rate_versions']}
+    return {(dates[r['rate_version_id']], r['jurisdiction_id'], r['business_code']): r['city_rate']
+            for r in fake.tables['rates']}, len(fake.tables['rates'])
+
+
+def test_stream_matches_the_in_memory_merge(script, tmp_path):
+    older, newer = tmp_path / 'older.csv', tmp_path / 'newer.csv'
+    older.write_text(OLDER)
+    newer.write_text(NEWER)
+    paths = [str(older), str(newer)]
+
+    streamed, streamed_rows = load(script, paths, stream=True)
+    merged, merged_rows = load(script, paths, stream=False)
+
+    assert streamed == merged
+    assert streamed_rows == merged_rows == 3
+    # Last row of the file wins within a file, the newer file wins across files
+    assert streamed[('2021-01-01', 1, '214')] == 0.019
+    assert streamed[('2021-01-01', 2, '017')] == 0.025
+    assert streamed[('2023-07-01', 2, '017')] == 0.028
+
+
+def test_restore_keeps_delta_storage_and_removals(script, tmp_path):
+    dump = tmp_path / 'backup.sql'
+    dump.write_text(DUMP)
+    fake = FakeSupabase({'rate_versions': [{'id': 99, 'effective_date': '2020-01-01'}],
+                         'rates': [{'id': 7, 'rate_version_id': 99, 'jurisdiction_id': 1, 'business_code': '214'}]})
+    script.supabase = fake
+
+    assert script.restore_backup(str(dump)) == 12
+
+    versions = {v['id']: v for v in fake.tables['rate_versions']}
+    assert set(versions) == {11, 12}
+    assert versions[12]['storage'] == 'delta' and versions[12]['base_version_id'] == 11
+    assert versions[12]['diff_summary'] == {'added': 1, 'removed': 1}
+    assert [(r['rate_version_id'], r['jurisdiction_id'], r['business_code'])
+            for r in fake.tables['rate_removals']] == [(12, 2, '017')]
+    # The delta version resolves through its base, without the removed pair
+    assert sorted(VersionStore(fake).rows(12)) == [(1, '017'), (1, '214')]
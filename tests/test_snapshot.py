@@ -0,0 +1,122 @@
+"""
+Tests for the columnar rates snapshot.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from taxrates.snapshot import Snapshot, export_snapshot, import_snapshot, write_snapshot
+from tests.fake_supabase import FakeSupabase
+
+TABLES = {
+    'jurisdictions': [
+        {'id': 198, 'level': 'city', 'state_code': 'AZ', 'city_code': 'PE', 'region_code': None,
+         'city_name': 'Peoria', 'county_name': 'Maricopa'},
+        {'id': 71, 'level': 'county', 'state_code': 'AZ', 'city_code': None, 'region_code': 'MAR',
+         'city_name': None, 'county_name': 'Maricopa'},
+    ],
+    'business_class_codes': [
+        {'code': '014', 'description': 'Personal Property Rental'},
+        {'code': '214', 'description': 'Örtliche Miete'},  # non-ASCII survives the string table
+    ],
+    'rate_versions': [
+        {'id': 9, 'effective_date': '2025-10-01', 'loaded_at': '2025-10-02T08:00:00', 'storage': 'full',
+         'base_version_id': None},
+        {'id': 116, 'effective_date': '2026-05-01', 'loaded_at': None, 'storage': 'delta',
+         'base_version_id': 9},
+    ],
+    'rates': [
+        {'id': 1, 'rate_version_id': 9, 'jurisdiction_id': 198, 'business_code': '214',
+         'state_rate': 0.056, 'county_rate': None, 'city_rate': 0.018},
+        {'id': 2, 'rate_version_id': 116, 'jurisdiction_id': 198, 'business_code': '214',
+         'state_rate': 0.056, 'county_rate': 0.0, 'city_rate': 0.019},
+        {'id': 3, 'rate_version_id': 9, 'jurisdiction_id': 71, 'business_code': '014',
+         'state_rate': 0.0, 'county_rate': 0.063, 'city_rate': 0.0},
+    ],
+    'rate_removals': [
+        {'rate_version_id': 116, 'jurisdiction_id': 71, 'business_code': '014'},
+    ],
+}
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / 'rates.ccrs')
+    write_snapshot(path, TABLES, meta={'source': 'test'})
+    return path
+
+
+def test_round_trip_preserves_rows_and_nulls(snapshot_path):
+    with Snapshot.open(snapshot_path) as snap:
+        assert snap.header['meta'] == {'source': 'test'}
+        for name, rows in TABLES.items():
+            assert snap.rows(name) == rows
+
+
+def test_columns_are_typed_views(snapshot_path):
+    with Snapshot.open(snapshot_path) as snap:
+        rates = snap['rates']
+        ids = rates.raw('rate_version_id')
+        assert ids.format == 'q' and list(ids) == [9, 116, 9]
+        ids.release()
+        assert rates.column('county_rate') == [None, 0.0, 0.063]
+
+
+def test_rates_for_version(snapshot_path):
+    with Snapshot.open(snapshot_path) as snap:
+        assert [r['id'] for r in snap.rates_for_version(9)] == [1, 3]
+        assert snap.rates_for_version(404) == []
+        # Delta v116: its own row over v9, with v9's 014 row removed
+        assert [r['id'] for r in snap.stored_rates(116)] == [2]
+        assert [r['id'] for r in snap.rates_for_version(116)] == [2]
+
+
+def test_delta_version_matches_version_store(snapshot_path):
+    from taxrates.rate_deltas import VersionStore
+
+    fake = FakeSupabase(TABLES)
+    with Snapshot.open(snapshot_path) as snap:
+        for vid in (9, 116):
+            assert {(r['jurisdiction_id'], r['business_code']): r['id'] for r in snap.rates_for_version(vid)} == \
+                {key: r['id'] for key, r in VersionStore(fake).rows(vid).items()}
+
+
+def test_snapshot_without_delta_storage_reads_every_version_as_full(tmp_path):
+    path = str(tmp_path / 'old.ccrs')
+    legacy = dict(TABLES, rate_versions=[{k: v for k, v in r.items() if k not in ('storage', 'base_version_id')}
+                                         for r in TABLES['rate_versions']], rate_removals=[])
+    write_snapshot(path, legacy)
+    with Snapshot.open(path) as snap:
+        assert [r['id'] for r in snap.rates_for_version(116)] == [2]
+        assert snap.rows('rate_versions')[1]['storage'] is None
+
+    target = FakeSupabase()
+    with Snapshot.open(path) as snap:
+        import_snapshot(snap, target, log=lambda msg: None)
+    assert 'storage' not in target.tables['rate_versions'][0]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not-a-snapshot'
+    path.write_bytes(b'id,rate\n1,0.5\n')
+    with pytest.raises(ValueError):
+        Snapshot.open(str(path))
+
+
+def test_export_then_import(tmp_path):
+    path = str(tmp_path / 'rates.ccrs')
+    source = FakeSupabase(TABLES)
+    source.primary_keys = {}
+    counts = export_snapshot(source, path, log=lambda msg: None)
+    assert counts == {name: len(rows) for name, rows in TABLES.items()}
+
+    target = FakeSupabase()
+    with Snapshot.open(path) as snap:
+        import_snapshot(snap, target, log=lambda msg: None)
+    assert target.tables['rates'] == TABLES['rates']
+    assert target.tables['business_class_codes'] == TABLES['business_class_codes']
+    assert target.tables['rate_versions'] == TABLES['rate_versions']
+    assert len(target.tables['rate_removals']) == 1
@@ -0,0 +1,76 @@
+"""
+Tests for the Stripe tax-rate index (no network: a fake stands in for the stripe module).
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.stripe_rates import TaxRateIndex
+
+
+class FakeTaxRates:
+    def __init__(self, rates):
+        self.rates = {r.id: r for r in rates}
+        self.list_calls = 0
+        self.retrieve_calls = 0
+
+    def list(self, active=True, limit=100):
+        self.list_calls += 1
+        matching = [r for r in self.rates.values() if r.active == active]
+        return SimpleNamespace(auto_paging_iter=lambda: iter(matching))
+
+    def retrieve(self, rate_id):
+        self.retrieve_calls += 1
+        if rate_id not in self.rates:
+            raise LookupError(rate_id)
+        return self.rates[rate_id]
+
+
+def tax_rate(rate_id, key, percentage, created, active=True):
+    return SimpleNamespace(id=rate_id, metadata={'cactuscomply_key': key} if key else {},
+                           percentage=percentage, created=created, active=active)
+
+
+def fake_stripe():
+    return SimpleNamespace(TaxRate=FakeTaxRates([
+        tax_rate('txr_old', 'peoria_214', 1.6, 100),
+        tax_rate('txr_pe', 'peoria_214', 1.8, 200),
+        tax_rate('txr_mar', 'maricopa_014', 0.7, 150),
+        tax_rate('txr_other', None, 5.0, 50),
+    ]))
+
+
+def test_one_listing_pass_per_run():
+    stripe = fake_stripe()
+    index = TaxRateIndex(stripe)
+    assert index.get('peoria_214')['id'] == 'txr_pe'  # newest of the two
+    assert index.get('maricopa_014')['percentage'] == 0.7
+    assert index.get('unknown') is None
+    assert stripe.TaxRate.list_calls == 1
+
+    index.drop('maricopa_014')
+    index.put('maricopa_014', tax_rate('txr_new', 'maricopa_014', 0.8, 300))
+    assert index.get('maricopa_014')['id'] == 'txr_new'
+    assert stripe.TaxRate.list_calls == 1
+
+
+def test_persisted_cache_is_validated_by_id(tmp_path):
+    path = str(tmp_path / 'tax_rates.json')
+    TaxRateIndex(fake_stripe(), cache_path=path).get('peoria_214')
+
+    stripe = fake_stripe()
+    index = TaxRateIndex(stripe, cache_path=path)
+    assert index.get('peoria_214')['id'] == 'txr_pe'
+    assert index.get('peoria_214')['id'] == 'txr_pe'
+    assert (stripe.TaxRate.list_calls, stripe.TaxRate.retrieve_calls) == (0, 1)
+
+    # The cached object was archived in Stripe: fall back to one listing
+    stripe = fake_stripe()
+    stripe.TaxRate.rates['txr_mar'].active = False
+    stripe.TaxRate.rates['txr_mar2'] = tax_rate('txr_mar2', 'maricopa_014', 0.8, 400)
+    index = TaxRateIndex(stripe, cache_path=path)
+    assert index.get('maricopa_014')['id'] == 'txr_mar2'
+    assert index.get('peoria_214')['id'] == 'txr_pe'
+    assert stripe.TaxRate.list_calls == 1
@@ -0,0 +1,112 @@
+"""
+Tests for the concurrent, resumable subscription updater against a local Stripe stand-in.
+"""
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.stripe_subscriptions import RateLimiter, SubscriptionUpdater
+
+PRO = 'prod_pro'
+NEW_RATES = ['txr_pe', 'txr_mar']
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class FakeSubscriptions:
+    """Subscription.list / modify over in-memory subscriptions, newest first like Stripe."""
+
+    def __init__(self, subs, fail=None, throttle=()):
+        self.subs = subs
+        self.fail = set(fail or ())
+        self.throttle = set(throttle)
+        self.modified = []
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    def list(self, status='active', limit=100, starting_after=None):
+        ids = [s.id for s in self.subs]
+        start = ids.index(starting_after) + 1 if starting_after else 0
+        return SimpleNamespace(auto_paging_iter=lambda: iter(self.subs[start:]))
+
+    def modify(self, sub_id, default_tax_rates, idempotency_key):
+        with self.lock:
+            if sub_id in self.throttle:
+                self.throttle.discard(sub_id)
+                raise RateLimitError("Too many requests")
+            if sub_id in self.fail:
+                raise ValueError("card declined")
+            if idempotency_key in self.keys:
+                return  # Stripe replays the first response
+            self.keys.add(idempotency_key)
+            self.modified.append(sub_id)
+        sub = next(s for s in self.subs if s.id == sub_id)
+        sub.default_tax_rates = [SimpleNamespace(id=i) for i in default_tax_rates]
+
+
+class FakeSubscription(SimpleNamespace):
+    """Attribute access like a StripeObject, plus sub["items"]."""
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+def subscription(sub_id, product=PRO, rates=('txr_old',)):
+    item = SimpleNamespace(price=SimpleNamespace(product=product))
+    return FakeSubscription(id=sub_id, items={'data': [item]},
+                            default_tax_rates=[SimpleNamespace(id=r) for r in rates])
+
+
+def make_stripe(**kwargs):
+    subs = [subscription(f'sub_{i:03d}') for i in range(40)]
+    subs.append(subscription('sub_other', product='prod_other'))
+    subs.append(subscription('sub_done', rates=NEW_RATES))
+    return SimpleNamespace(Subscription=FakeSubscriptions(subs, **kwargs))
+
+
+def updater(stripe, path=None):
+    return SubscriptionUpdater(stripe, [PRO], NEW_RATES, checkpoint_path=path, workers=4,
+                               rate_limit=0, sleep=lambda s: None, log=lambda *a: None)
+
+
+def test_updates_concurrently_with_retries_and_idempotency(tmp_path):
+    stripe = make_stripe(throttle={'sub_005'})
+    result = updater(stripe, str(tmp_path / 'cp.jsonl')).run()
+    assert (result.updated, result.skipped, result.ignored, result.failed) == (40, 1, 1, [])
+    assert sorted(stripe.Subscription.modified) == [f'sub_{i:03d}' for i in range(40)]
+    assert not (tmp_path / 'cp.jsonl').exists()  # clean run: checkpoint removed
+
+    assert updater(stripe).run(dry_run=True).updated == 0
+
+
+def test_resumes_where_it_stopped(tmp_path):
+    path = str(tmp_path / 'cp.jsonl')
+    stripe = make_stripe(fail={'sub_010'})
+    first = updater(stripe, path).run()
+    assert [f[0] for f in first.failed] == ['sub_010'] and first.updated == 39
+
+    # Second run: starts from the cursor (just before sub_010), skips what's done
+    stripe.Subscription.fail.clear()
+    stripe.Subscription.modified.clear()
+    second = updater(stripe, path).run()
+    assert stripe.Subscription.modified == ['sub_010']
+    assert second.updated == 1 and second.resumed == 29 and second.failed == []
+    assert not os.path.exists(path)
+
+
+def test_rate_limiter_spaces_calls():
+    now = [0.0]
+    slept = []
+
+    def sleep(s):
+        slept.append(s)
+
+    limiter = RateLimiter(10, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert [round(s, 2) for s in slept] == [0.1, 0.2]
@@ -0,0 +1,66 @@
+"""
+Tests for per-version / per-jurisdiction row hashes.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.fake_supabase import FakeSupabase
+from taxrates.rate_deltas import VersionStore, diff_rates
+from taxrates.version_hashes import (
+    VersionHashes, diff_against_version, load_hashes, refresh_hashes)
+from tests.test_rate_deltas import JULY, JUNE, MAY, rate, store_with_versions, write
+
+
+def test_hashes_ignore_order_and_roll_forward():
+    may = VersionHashes.from_rows(MAY)
+    assert may.identical(VersionHashes.from_rows(list(reversed(MAY))))
+    assert may.rows == 3
+
+    rolled = VersionHashes.from_rows(MAY)
+    rolled.add(rate(40, '017', city=0.026))
+    assert rolled.identical(VersionHashes.from_rows(JUNE))
+    rolled.remove(rate(40, '017', city=0.026))
+    assert rolled.identical(may) and 40 not in rolled.buckets
+
+
+def test_differing_buckets():
+    may, july = VersionHashes.from_rows(MAY), VersionHashes.from_rows(JULY)
+    # 198 changed a rate, 5 dropped out, 40 is new; 71 is untouched
+    assert may.differing(july) == [5, 40, 198]
+    assert may.differing(july, keys_only=True) == [5, 40]
+
+    restored = VersionHashes.from_dict(july.as_dict())
+    assert restored.identical(july) and restored.buckets == july.buckets
+
+
+def test_refresh_and_load_from_store():
+    fake, store = store_with_versions(3)
+    for i, rows in enumerate([MAY, JUNE, JULY], start=1):
+        write(store, i, rows)
+        refresh_hashes(fake, i, store)
+
+    hashes = load_hashes(fake, [1, 3, 99])
+    assert sorted(hashes) == [1, 3]
+    # Version 3 is a delta, but its hashes cover the rebuilt rate set
+    assert hashes[3].identical(VersionHashes.from_rows(JULY))
+    assert not load_hashes(FakeSupabase(), [1])
+
+    assert set(store.rows(3, [198, 5])) == {(198, '214')}
+    assert store.rows(3, []) == {}
+
+
+def test_diff_against_version_reads_only_differing_buckets():
+    fake, store = store_with_versions(2)
+    write(store, 1, MAY)
+    refresh_hashes(fake, 1, store)
+
+    delta, read = diff_against_version(fake, 1, JULY)
+    assert delta.as_dict() == diff_rates(store.rows(1), JULY).as_dict()
+    assert {jid for jid, _ in read} == {5, 198}
+
+    # Without stored hashes the whole version is read
+    fake.tables['rate_versions'][0]['row_hashes'] = None
+    delta, read = diff_against_version(fake, 1, JULY, store=VersionStore(fake))
+    assert len(read) == 3 and delta.unchanged == 1
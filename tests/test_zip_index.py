@@ -0,0 +1,97 @@
+"""
+Tests for the offline ZIP / ZIP+4 -> jurisdiction index.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from taxrates.zip_index import ZipIndex, ZipJurisdictions, normalize_zip
+from tests.test_rate_matrix import JURISDICTIONS, build
+
+MAPPING = """zip,plus4_low,plus4_high,city_code,county_code
+85382,,,PE,MAR
+85383,0000,5999,PE,
+85383,6000,9999,,MAR
+85301,,,PH,MAR
+85301,7000,7999,PE,MAR
+99999,,,ZZ,MAR
+8538,,,PE,MAR
+"""
+
+
+def index(tmp_path):
+    path = tmp_path / 'zips.csv'
+    path.write_text(MAPPING)
+    return ZipIndex.load(str(path), JURISDICTIONS)
+
+
+def test_normalize_zip():
+    assert normalize_zip('85382') == (85382, None)
+    assert normalize_zip(' 85383-0042 ') == (85383, 42)
+    assert normalize_zip('853830042') == (85383, 42)
+    assert normalize_zip('8538') is None and normalize_zip(None) is None
+
+
+def test_zip_and_zip4_lookups(tmp_path):
+    zips = index(tmp_path)
+    assert (len(zips), len(zips.starts), zips.skipped) == (3, 3, 2)
+
+    assert zips.lookup('85382') == ZipJurisdictions(198, 71)
+    assert zips.lookup('85382-1234') == ZipJurisdictions(198, 71)  # no range: whole ZIP
+    # Blank county_code takes the city's county; blank city_code is unincorporated
+    assert zips.lookup('85383-0100') == ZipJurisdictions(198, 71)
+    assert zips.lookup('85383-6000') == ZipJurisdictions(None, 71)
+    # Split ZIP without a whole-ZIP row: the bigger share, flagged
+    assert zips.lookup('85383') == ZipJurisdictions(198, 71, ambiguous=True)
+    assert zips.lookup('85301') == ZipJurisdictions(5, 71, ambiguous=True)
+    assert zips.lookup('85301-7500') == ZipJurisdictions(198, 71)
+    assert zips.lookup('85001') is None and zips.lookup('abc') is None
+
+
+def test_zip_to_combined_rate(tmp_path):
+    zips = index(tmp_path)
+    matrix = build()
+    assert zips.lookup_rate(matrix, '85382', '214', '2025-03-01').total_rate == 0.025
+    # Unincorporated: Maricopa County's own rate under the mapped code (214 -> 014)
+    assert zips.lookup_rate(matrix, '85383-6000', '214', '2025-03-01').total_rate == 0.007
+    assert zips.lookup_rate(matrix, '85001', '214') is None
+
+
+def test_overlapping_ranges_and_repeated_zips_are_rejected():
+    rows = [{'zip': '85383', 'plus4_low': '0001', 'plus4_high': '5000', 'city_code': 'PE'},
+            {'zip': '85383', 'plus4_low': '5000', 'plus4_high': '9999', 'county_code': 'MAR'}]
+    with pytest.raises(ValueError):
+        ZipIndex.from_rows(rows, JURISDICTIONS)
+    rows = [{'zip': '85382', 'city_code': 'PE'}, {'zip': '85382', 'county_code': 'MAR'}]
+    with pytest.raises(ValueError, match='listed twice'):
+        ZipIndex.from_rows(rows, JURISDICTIONS)
+
+
+def test_bad_ranges_are_skipped():
+    zips = ZipIndex.from_rows([
+        {'zip': '85383', 'plus4_low': '5000', 'plus4_high': '4000', 'city_code': 'PE'},
+        {'zip': '85383', 'plus4_low': '9000', 'plus4_high': '12000', 'city_code': 'PE'},
+        {'zip': '85383', 'plus4_low': '0000', 'plus4_high': '3999', 'county_code': 'MAR'},
+    ], JURISDICTIONS)
+    assert (len(zips.starts), zips.skipped) == (1, 2)
+    assert zips.lookup('85383-0100') == ZipJurisdictions(None, 71)
+
+
+def test_api_rate_combined_by_zip(monkeypatch, tmp_path):
+    import app
+    zips = index(tmp_path)
+    monkeypatch.setattr(app.rate_matrix, 'get', build)
+    monkeypatch.setattr(app.zip_index, 'get', lambda: zips)
+    client = app.app.test_client()
+
+    assert client.get('/api/rate/combined?zip=85382&business_code=214').status_code == 501
+    monkeypatch.setitem(app.app.config, 'ZIP_JURISDICTION_PATH', 'zips.csv')
+    resp = client.get('/api/rate/combined?zip=85383-0100&business_code=214&date=2025-03-01')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['zip'], body['city_id'], body['county_id'], body['total_rate']) == ('85383-0100', 198, 71, 0.025)
+    assert client.get('/api/rate/combined?zip=85001&business_code=214').status_code == 404
+    assert client.get('/api/rate/combined?zip=85382').status_code == 400